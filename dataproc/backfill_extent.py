@@ -0,0 +1,114 @@
+"""
+Title: Checkpointed backfill of the daily regional sea ice extent history
+Description:
+    Computes the daily sea ice extent of the Alaska regions over the full CDR + NRT history and
+    writes it to an `ExtentStore`, one time partition (calendar year by default) at a time.
+    CDR days are used where available and NRT days otherwise (`stitch_sources`).
+
+    Each finished partition is recorded in the store's backfill manifest (`_backfill.json`) with a
+    fingerprint of its source data. Rerunning the command resumes from the first missing
+    partition; with `--changed-only`, recorded partitions whose source data changed (e.g., NRT days
+    since replaced by the CDR, or a reprocessed CDR) are recomputed too. The partitions run in
+    parallel on the `ExtentEngine` workers.
+
+    The source (CDR or NRT dataset ID) of each day is stored with its extent. After the backfill,
+    month partitions holding NRT days that a newer CDR release covers are recomputed from the CDR
+    (`ExtentBackfill.supersede`).
+
+    Every write also updates the temporal pyramid of the store (`ExtentPyramid`, in
+    `{store}/_pyramid`): the weekly, monthly and water-year means of the periods it touches.
+    compute_annualized_timeseries.py --from-history reads the monthly means from there, and
+    compute_baseline_extent.py reads the stored days of the years it covers.
+
+Usage:
+    python backfill_extent.py --start 1985-01-01
+    python backfill_extent.py --changed-only --refresh-since 2024-01-01
+"""
+
+import argparse
+import logging
+import os
+from datetime import date
+
+from pw_data import SIC25k, read_regions, stitch_sources
+from pw_engine import ExtentBackfill
+from pw_metrics import RunReport
+from pw_store import ExtentStore, ExtentPyramid
+from pw_paths import ROOT, EXTENT_HISTORY
+
+CDR_DAILY_ID = 'nsidcG02202v5nh1day'  # CDR daily sea ice conc
+NRT_DAILY_ID = 'nsidcG10016v3nh1day'  # NRT daily sea ice conc
+AREA_ID = 'pstere_gridcell_N25k'  # Grid cell area
+CRS = 'epsg:3413'  # EPSG code for the polar stereographic (north) projection
+VAR_NAME = 'cdr_seaice_conc'
+# Paths are anchored to this script and the repository root, not the working directory
+RESOURCE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'resources', 'akmarineeco')
+CACHE_DIR = os.path.join(ROOT, 'cache')  # Local copy of the ERDDAP data, synced incrementally
+REPORT_DIR = os.path.join(ROOT, 'reports')  # JSON run report and Prometheus text file
+REGIONS = dict([('AlaskanArctic', 'arctic_sf.shp'),
+                ('NorthernBering', 'nbering_sf.shp'),
+                ('EasternBering', 'ebering_sf.shp'),
+                ('SoutheasternBering', 'se_bering_sf.shp')])
+
+
+def backfill(args, report):
+    shapes = read_regions(REGIONS, RESOURCE_DIR, CRS)
+
+    # Sync the local copies; days changed on the server since --refresh-since are fetched again
+    with report.stage('open'):
+        sic_cdr = SIC25k(CDR_DAILY_ID, VAR_NAME, CRS, cache_dir=CACHE_DIR, window_shapes=shapes,
+                         refresh_since=args.refresh_since, report=report)
+        sic_nrt = SIC25k(NRT_DAILY_ID, VAR_NAME, CRS, cache_dir=CACHE_DIR, window_shapes=shapes,
+                         refresh_since=args.refresh_since, report=report)
+    sic_cdr.load_area(AREA_ID)
+    index = sic_cdr.build_region_index(shapes, cache_dir=CACHE_DIR)
+
+    # Use CDR days where available and NRT days otherwise
+    sic = stitch_sources(sic_cdr.ds, sic_nrt.ds, (CDR_DAILY_ID, NRT_DAILY_ID))
+
+    store = ExtentStore(args.store)
+    runner = ExtentBackfill(sic, index, store, freq=args.freq, report=report, pyramid=ExtentPyramid(store),
+                            workers=args.workers, memory_budget=args.memory_budget,
+                            **sic_cdr.kernel_threshold(0.15))
+    # Regions without a pyramid yet (e.g., a history backfilled before it existed) are built in full
+    missing = [name for name in REGIONS if name not in runner.pyramid.regions()]
+    computed = runner.run(args.start, args.end, changed_only=args.changed_only)
+    print(f'Backfilled {len(computed)} partitions: {computed}')
+    for name in missing:
+        runner.pyramid.update(name)
+
+    # Months stored from NRT days that the CDR now covers are recomputed from the CDR
+    superseded = runner.supersede(CDR_DAILY_ID)
+    print(f'Superseded {len(superseded)} month partitions with the CDR: {superseded}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--start', default='1985-01-01', help='First date (default: 1985-01-01)')
+    parser.add_argument('--end', default=date.today().strftime('%Y-%m-%d'), help='Last date (default: today)')
+    parser.add_argument('--store', default=EXTENT_HISTORY,
+                        help='Extent store directory (default: data/extent_history in the repository root)')
+    parser.add_argument('--freq', default='Y', choices=['Y', 'Q', 'M'],
+                        help='Partition length: year, quarter or month (default: Y)')
+    parser.add_argument('--changed-only', action='store_true',
+                        help='Also recompute recorded partitions whose source data changed')
+    parser.add_argument('--refresh-since', default=None,
+                        help='Fetch days from this date again when syncing the local copies (default: none)')
+    parser.add_argument('--workers', type=int, default=None, help='Worker processes (default: number of CPUs)')
+    parser.add_argument('--memory-budget', default='2GB', help='Memory for the data blocks in flight (default: 2GB)')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    report = RunReport('backfill_extent')
+    try:
+        backfill(args, report)
+    except Exception as e:
+        report.error(f'{type(e).__name__}: {e}')
+        raise
+    finally:
+        report.write(os.path.join(REPORT_DIR, 'backfill_extent.json'),
+                     os.path.join(REPORT_DIR, 'backfill_extent.prom'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,234 @@
+"""
+Title: Benchmark suite of the pw_data extent pipeline
+Description:
+    Times the stages of the extent pipeline (`clip_data`, `SIC25k.subset_dim`, `format_sic`,
+    `compute_extent_km`, `extent_from_conc`, `compute_clim`, `compute_region_metrics` with four
+    thresholds plus ice area and open-water fraction) and the two end-to-end flows of the
+    scripts, on synthetic NH 25 km data (`pw_synth`) served from a local file-backed ERDDAP stand-in,
+    for the four Alaska regions:
+    - legacy_script: per region `subset_dim` -> `format_sic` -> `compute_extent_km` (original scripts)
+    - indexed_script: grid window, local cache, region index and one `compute_region_extents` pass
+      (compute_ext_recent_years.py)
+
+    Sizes: 1 day, 1 year and 40 years of daily grids. Stand-in datasets are written once to
+    `--workdir` and reused. Each (size, stage) case runs in its own process, so its peak RSS
+    (setup included) is measured in isolation.
+
+    Results are written as JSON, comparable between runs with `--compare`:
+        {"schema": 1, "meta": {...},
+         "results": [{"size", "stage", "days", "regions", "seconds", "grid_days_per_s", "peak_rss_mb", "error"}]}
+    grid_days_per_s is the number of daily grids processed (for all regions) per second.
+
+Usage:
+    python benchmark_pipeline.py --sizes day year --out bench.json
+    python benchmark_pipeline.py --sizes 40y --stages legacy_script indexed_script --compare bench.json
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import tempfile
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+import dask
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from pw_data import SIC25k, clip_data, read_regions
+from pw_synth import write_standin
+
+CRS = 'epsg:3413'
+VAR_NAME = 'cdr_seaice_conc'
+AREA_ID = 'pstere_gridcell_N25k'
+REGIONS = dict([('AlaskanArctic', 'arctic_sf.shp'),
+                ('NorthernBering', 'nbering_sf.shp'),
+                ('EasternBering', 'ebering_sf.shp'),
+                ('SoutheasternBering', 'se_bering_sf.shp')])
+RESOURCE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'resources', 'alaska_shapefiles')
+
+# Size -> first day and number of daily grids
+SIZES = {"day": ("2023-09-01", 1), "year": ("2023-09-01", 365), "40y": ("1985-09-01", 14610)}
+
+
+def _region_extents(sic, shapes, dates):
+    """Per-region format_sic + compute_extent_km over clipped data, as in the original scripts."""
+    for shp in shapes.values():
+        ds, area = sic.subset_dim(dates, shp)
+        sic.compute_extent_km(sic.format_sic(ds), area).compute()
+
+
+def stage_clip_data(sic, shapes, dates, workdir):
+    ds = sic.ds.sel(time=slice(*dates))
+    return lambda: [clip_data(ds, shp).load() for shp in shapes.values()]
+
+
+def stage_subset_dim(sic, shapes, dates, workdir):
+    return lambda: [sic.subset_dim(dates, shp)[0].load() for shp in shapes.values()]
+
+
+def stage_format_sic(sic, shapes, dates, workdir):
+    clipped = [sic.subset_dim(dates, shp)[0].load() for shp in shapes.values()]
+    return lambda: [sic.format_sic(ds).load() for ds in clipped]
+
+
+def stage_compute_extent_km(sic, shapes, dates, workdir):
+    inputs = []
+    for shp in shapes.values():
+        ds, area = sic.subset_dim(dates, shp)
+        inputs.append((sic.format_sic(ds).load(), area.load()))
+    return lambda: [sic.compute_extent_km(ds, area).compute() for ds, area in inputs]
+
+
+def stage_extent_from_conc(sic, shapes, dates, workdir):
+    inputs = [tuple(x.load() for x in sic.subset_dim(dates, shp)) for shp in shapes.values()]
+    return lambda: [sic.extent_from_conc(ds, area).compute() for ds, area in inputs]
+
+
+def stage_compute_clim(sic, shapes, dates, workdir):
+    years = [pd.Timestamp(dates[0]).year, pd.Timestamp(dates[1]).year]
+    return lambda: sic.compute_clim(years, 'M').load()
+
+
+def stage_region_metrics(sic, shapes, dates, workdir):
+    index = sic.build_region_index(shapes)
+    return lambda: sic.compute_region_metrics(dates, index).compute()
+
+
+def stage_legacy_script(sic, shapes, dates, workdir):
+    return lambda: _region_extents(sic, shapes, dates)
+
+
+def stage_indexed_script(sic, shapes, dates, workdir):
+    def run():
+        cache_dir = tempfile.mkdtemp(dir=workdir)
+        try:
+            sic_w = SIC25k(sic.id, VAR_NAME, CRS, server=sic.server, cache_dir=cache_dir, window_shapes=shapes)
+            sic_w.load_area(AREA_ID)
+            index = sic_w.build_region_index(shapes)
+            sic_w.compute_region_extents(dates, index).compute()
+        finally:
+            shutil.rmtree(cache_dir)
+    return run
+
+
+STAGES = {
+    "load": None,
+    "clip_data": stage_clip_data,
+    "subset_dim": stage_subset_dim,
+    "format_sic": stage_format_sic,
+    "compute_extent_km": stage_compute_extent_km,
+    "extent_from_conc": stage_extent_from_conc,
+    "compute_clim": stage_compute_clim,
+    "region_metrics": stage_region_metrics,
+    "legacy_script": stage_legacy_script,
+    "indexed_script": stage_indexed_script,
+}
+
+
+def standin(workdir: str, size: str) -> tuple:
+    """Returns the (server directory, dataset ID) of a size, writing the stand-in on first use."""
+    root = os.path.join(workdir, size)
+    id = f"synth_{size}"
+    if not os.path.exists(os.path.join(root, id)):
+        start, days = SIZES[size]
+        write_standin(root, id, pd.date_range(start, periods=days, freq="D"), area_id=AREA_ID)
+    return root, id
+
+
+def run_case(workdir: str, size: str, stage: str) -> dict:
+    """Runs one (size, stage) case; meant to run in a fresh process."""
+    warnings.filterwarnings("ignore", category=xr.SerializationWarning)
+    start, days = SIZES[size]
+    dates = [start, (pd.Timestamp(start) + pd.Timedelta(days=days - 1)).strftime('%Y-%m-%d')]
+    result = {"size": size, "stage": stage, "days": days, "regions": len(REGIONS),
+              "seconds": None, "grid_days_per_s": None, "peak_rss_mb": None, "error": None}
+    try:
+        server, id = standin(workdir, size)
+        shapes = read_regions(REGIONS, RESOURCE_DIR, CRS)
+
+        t0 = time.perf_counter()
+        sic = SIC25k(id, VAR_NAME, CRS, server=server)
+        sic.load_area(AREA_ID)
+        if stage == "load":
+            seconds = time.perf_counter() - t0
+        else:
+            run = STAGES[stage](sic, shapes, dates, workdir)
+            t0 = time.perf_counter()
+            run()
+            seconds = time.perf_counter() - t0
+        result.update(seconds=round(seconds, 4), grid_days_per_s=round(days / seconds, 2))
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    # ru_maxrss is in KB on Linux
+    result["peak_rss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    return result
+
+
+def metadata() -> dict:
+    try:
+        rev = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                             cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        rev = None
+    return {"date": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+            "git": rev, "python": platform.python_version(), "platform": platform.platform(),
+            "cpus": os.cpu_count(), "numpy": np.__version__, "pandas": pd.__version__,
+            "xarray": xr.__version__, "dask": dask.__version__}
+
+
+def compare(results: list, baseline_path: str):
+    """Prints time and peak RSS ratios (this run / baseline) for the cases in both runs."""
+    with open(baseline_path) as f:
+        baseline = {(r["size"], r["stage"]): r for r in json.load(f)["results"]}
+    print(f"\n{'size':6s} {'stage':20s} {'seconds':>10s} {'baseline':>10s} {'ratio':>7s} {'rss ratio':>9s}")
+    for r in results:
+        b = baseline.get((r["size"], r["stage"]))
+        if b is None or r["seconds"] is None or b["seconds"] is None:
+            continue
+        print(f"{r['size']:6s} {r['stage']:20s} {r['seconds']:10.3f} {b['seconds']:10.3f} "
+              f"{r['seconds'] / b['seconds']:7.2f} {r['peak_rss_mb'] / b['peak_rss_mb']:9.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", nargs="+", choices=list(SIZES), default=["day", "year"],
+                        help="Sizes to run (default: day year)")
+    parser.add_argument("--stages", nargs="+", choices=list(STAGES), default=list(STAGES),
+                        help="Stages to run (default: all)")
+    parser.add_argument("--workdir", default=os.path.join("cache", "benchmark"),
+                        help="Directory of the stand-in datasets (default: cache/benchmark)")
+    parser.add_argument("--out", default="benchmark_pipeline.json", help="Output JSON file")
+    parser.add_argument("--compare", help="Baseline JSON file to compare with")
+    args = parser.parse_args()
+
+    workdir = os.path.abspath(args.workdir)
+    results = []
+    for size in args.sizes:
+        standin(workdir, size)
+        for stage in args.stages:
+            with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as pool:
+                r = pool.submit(run_case, workdir, size, stage).result()
+            results.append(r)
+            if r["error"] is None:
+                print(f"{size:6s} {stage:20s} {r['seconds']:10.3f} s {r['grid_days_per_s']:12.1f} grid-days/s "
+                      f"{r['peak_rss_mb']:8.0f} MB")
+            else:
+                print(f"{size:6s} {stage:20s} failed: {r['error']}")
+
+    with open(args.out, "w") as f:
+        json.dump({"schema": 1, "meta": metadata(), "results": results}, f, indent=1)
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Title: Precompiled region index for the nightly update job
+Description:
+    Builds the grid cell indices and area weights (km^2) of the Alaska regions on the NSIDC 25 km
+    polar stereographic grid, and writes them as a `RegionIndex` artifact (`data/region_index.npz`).
+    The nightly `scripts/update_daily_extent.py` reads only this file, fetches only the grid window
+    it covers and computes the extents of all regions with numpy, so the job needs no geospatial
+    packages (geopandas, rasterio, rioxarray, shapely).
+
+    By default the regions are rasterized from `resources/alaska_shapefiles` onto the grid cell
+    area from ERDDAP (cells whose center lies inside a region, as `rio.clip` selects them).
+    With `--area-files`, the index is instead taken from the clipped `area_{name}.nc` files of
+    compute_regional_area.py (cells with an area), with no geometry or server access.
+
+    Rebuild and commit the artifact whenever the shapefiles or the grid change.
+
+Usage:
+    python dataproc/build_region_index.py
+    python dataproc/build_region_index.py --area-files data
+"""
+
+import argparse
+import os
+
+import xarray as xr
+
+from pw_data import SIC25k, RegionIndex, read_regions
+
+NRT_DAILY_ID = 'nsidcG10016v3nh1day'  # Any dataset on the grid; only its coordinates are read
+AREA_ID = 'pstere_gridcell_N25k'  # Grid cell area
+CRS = 'epsg:3413'  # EPSG code for the polar stereographic (north) projection
+VAR_NAME = 'cdr_seaice_conc'
+RESOURCE_DIR = 'resources/alaska_shapefiles'
+CACHE_DIR = 'cache'  # Local copy of the grid cell area
+REGIONS = dict([('AlaskanArctic', 'arctic_sf.shp'),
+                ('NorthernBering', 'nbering_sf.shp'),
+                ('EasternBering', 'ebering_sf.shp'),
+                ('SoutheasternBering', 'se_bering_sf.shp')])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--out', default=os.path.join('data', 'region_index.npz'),
+                        help='Output file (default: data/region_index.npz)')
+    parser.add_argument('--area-files', default=None,
+                        help='Build from the area_{name}.nc files in this directory instead of the shapefiles')
+    args = parser.parse_args()
+
+    if args.area_files is not None:
+        areas = {}
+        for name in REGIONS:
+            with xr.open_dataset(os.path.join(args.area_files, f'area_{name}.nc')) as ds:
+                areas[name] = ds['cell_area'].load()
+        index = RegionIndex.from_areas(areas)
+    else:
+        shapes = read_regions(REGIONS, RESOURCE_DIR, CRS)
+        sic = SIC25k(NRT_DAILY_ID, VAR_NAME, CRS, cache_dir=CACHE_DIR, window_shapes=shapes)
+        sic.load_area(AREA_ID)
+        index = sic.build_region_index(shapes)
+
+    index.save(args.out)
+    print(index)
+
+
+if __name__ == '__main__':
+    main()
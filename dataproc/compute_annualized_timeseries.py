@@ -12,8 +12,16 @@ Description:
     year (e.g., September 2023 to August 2024 for Year 2024). Monthly sea ice extent values are averaged 
     to produce an annualized sea ice extent value. The results are saved in CSV format for each defined region.
 
-    The sea ice extent values for all years, except the most recent, were computed using the CDR 
-    sea ice concentration data. Values for the most recent year were calculated using Near-Real-Time data.
+    The source is chosen per month: months covered by the CDR sea ice concentration data use the CDR, and
+    the remaining (most recent) months use Near-Real-Time data. All years and regions are reduced in a
+    single lazy Dask graph and computed once.
+
+    With --from-history, the water-year means are read from the temporal pyramid of the daily extent
+    history (backfill_extent.py) instead, and no grids are read for the years it covers. These are
+    means of the monthly means of the daily extents, not extents of the monthly mean concentration,
+    so the values differ slightly from the default series. A year is covered when every month of it
+    that has ended holds all of its days in every region; the other years (e.g., before the history
+    starts, or months the nightly job missed) are computed from the monthly grids as above.
 
 
 Regions:
@@ -28,29 +36,45 @@ Dependencies:
 - pandas (data handling and CSV export)
 - geopandas (geospatial data processing)
 - dask (for parallel computing) 
-- gc (garbage collection)
 - datetime (for managing date ranges)
 
 Parameters:
 - CRS: EPSG:3413 (Polar Stereographic)
-- NRT_DAILY_ID: 'nsidcG10016v2nh1day' for near-real-time daily data
+- CDR_DATA_ID: 'nsidcG02202v5nhmday' for CDR monthly data
+- NRT_DATA_ID: 'nsidcG10016v3nhmday' for near-real-time monthly data
 - GRID_CELL_AREA_ID: 'pstere_gridcell_N25k'
 - VAR_NAME: 'cdr_seaice_conc'
 
 Usage:
     Run this script to compute and export the annual sea ice extent for each defined Alaska region to CSV files.
+    python compute_annualized_timeseries.py [--from-history]
 
 """
 
 
 # Import necessary libraries
-from pw_data import SIC25k  # Custom class to handle sea ice concentration data (NSIDC 25k)
-import numpy as np  # For numerical operations
-import pandas as pd  # For working with DataFrames and exporting data
-import geopandas as gpd  # For handling geospatial data (e.g., shapefiles)
+from pw_data import SIC25k, read_regions, stitch_sources, annualized_extent  # Custom class and helpers for sea ice concentration data (NSIDC 25k)
+from pw_metrics import RunReport  # Stage timings and counters of the run
+from pw_store import ExtentStore, ExtentPyramid  # Daily extent history and its weekly/monthly/water-year means
+from pw_baseline import water_year  # September-August water year of each day
+from pw_paths import EXTENT_HISTORY  # Daily extent history written by backfill_extent.py
 from dask.distributed import Client  # Dask for distributed computing
-import gc
 from datetime import datetime 
+import argparse
+import logging
+import os
+import pandas as pd
+
+# Define dataset and variable information
+CDR_DATA_ID = 'nsidcG02202v5nhmday'  # ERDDAP ID for CDR monthly sea ice conc data
+NRT_DATA_ID = 'nsidcG10016v3nhmday' # ERDDAP ID for NRT monthly sea ice conc data
+AREA_ID = 'pstere_gridcell_N25k'  # ID for the corresponding area grid
+CRS = 'epsg:3413'  # EPSG code for the polar stereographic projection
+VAR_NAME = 'cdr_seaice_conc_monthly'  # The variable name in the dataset
+CACHE_DIR = 'cache'  # Local copy of the ERDDAP data, synced incrementally
+REPORT_DIR = 'reports'  # JSON run report and Prometheus text file
+HISTORY_DIR = EXTENT_HISTORY  # Daily extent history and its pyramid (backfill_extent.py)
+
 
 def main():
     """
@@ -59,89 +83,114 @@ def main():
 
     The data used is sea ice concentration from PolarWatch ERDDAP (https://polarwatch.noaa.gov/).
     For data information: 
-    - Monthly Near-real-time data: 'nsidcG10016v2nhmday' (variable name: cdr_seaice_conc_monthly)
-    - Monthly CDR data: 'nsidcG02202v4nhmday'(variable name: cdr_seaice_conc_monthly)
+    - Monthly Near-real-time data: 'nsidcG10016v3nhmday' (variable name: cdr_seaice_conc_monthly)
+    - Monthly CDR data: 'nsidcG02202v5nhmday'(variable name: cdr_seaice_conc_monthly)
     
     The output will be CSV files containing annual sea ice extent for the specified regions.
     """
 
-    # Initialize Dask Client for parallel computing. You can customize the cluster if needed.
-    # cluster = LocalCluster(n_workers=4, threads_per_worker=2)  # Optional: custom cluster configuration
-    client = Client()  # Start a Dask client using the default settings
-    print(f"Dashboard is running on: {client.dashboard_link}")  # Print Dask dashboard link for monitoring
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--from-history', action='store_true',
+                        help='Read the years the daily extent history covers from its pyramid')
+    args = parser.parse_args()
 
-    # Define dataset and variable information
-    CDR_DATA_ID = 'nsidcG02202v5nhmday'  # ERDDAP ID for CDR monthly sea ice conc data
-    NRT_DATA_ID = 'nsidcG10016v3nhmday' # ERDDAP ID for NRT monthly sea ice conc data
-    AREA_ID = 'pstere_gridcell_N25k'  # ID for the corresponding area grid
-    CRS = 'epsg:3413'  # EPSG code for the polar stereographic projection
-    VAR_NAME = 'cdr_seaice_conc_monthly'  # The variable name in the dataset
     thisyear = datetime.now().year
+
+    logging.basicConfig(level=logging.INFO)
+    report = RunReport('compute_annualized_timeseries')
     
     # Define regions and corresponding shapefiles for spatial subsetting
     regions = dict([
-       ('AlaskanArctic', 'arctic_sf.shp')  ])
-    
-      # Alaskan Arctic region
-    #    ('NorthernBering', 'nbering_sf.shp'),  # Northern Bering Sea region
-    #    ('EasternBering', 'ebering_sf.shp'),  # Eastern Bering Sea region
-    #     ('SoutheasternBering', 'se_bering_sf.shp') # Southeastern Bering Sea region
-    # ])
-
-    # Instantiate an SIC25k object and load sea ice concentration and grid data
-    sic_m = SIC25k(CDR_DATA_ID, VAR_NAME, CRS)  # Initialize SIC25k with ERDDAP data
-    sic_m.load_area(AREA_ID)  # Load the corresponding grid cell area data
-
-
-    # Loop over each region and its corresponding shapefile
-    for name, shp in regions.items():
-        # Load the shapefile for the region and transform it to the dataset's CRS
-        alaska_shp = gpd.read_file(f'resources/akmarineeco/{shp}')  # Read shapefile
-        alaska_shp_proj = alaska_shp.to_crs(CRS)  # Reproject the shapefile to match the dataset CRS
-
-        # List to store annual sea ice extent for each region and year
-        extents = [] 
-        # Loop over each year from 1985-09-01 to 2023-08-31, 
-        # computing sea ice extent for each September 1 to August 31 period
-        for year in range(1985, thisyear):
-            # Subset the dataset by time (September 1 to August 31) and region (clip to the shapefile)
-            ds, area = sic_m.subset_dim([f'{year-1}-09-01', f'{year}-08-31'], alaska_shp_proj)
-
-            # Format the sea ice concentration data to binary (0 or 1) using a threshold of 0.15
-            sic = sic_m.format_sic(ds, 0.15)  # Sea ice concentration thresholding
-
-            # Compute the sea ice extent in square kilometers for the subset data
-            ext = sic_m.compute_extent_km(sic, area)
+       ('AlaskanArctic', 'arctic_sf.shp'),  # Alaskan Arctic region
+       ('NorthernBering', 'nbering_sf.shp'),  # Northern Bering Sea region
+       ('EasternBering', 'ebering_sf.shp'),  # Eastern Bering Sea region
+        ('SoutheasternBering', 'se_bering_sf.shp') # Southeastern Bering Sea region
+    ])
+
+    years = list(range(1985, thisyear + 1))
+    frames = []
+    if args.from_history:
+        # Water-year means precomputed from the daily history, for the years it covers
+        with report.stage('open'):
+            covered, years = annualized_from_pyramid(ExtentPyramid(ExtentStore(HISTORY_DIR)), regions, years)
+        frames.append(covered)
+        if years:
+            logging.info('Years not covered by the daily history, computed from the grids: %s', years)
+    if years:
+        frames.append(annualized_from_grids(regions, years, report))
+    df = pd.concat(frames).sort_values(['region', 'year'], kind='stable').reset_index(drop=True)
+
+    # Export the results for each region
+    with report.stage('write'):
+        for name in regions:
+            df[df['region'] == name].to_csv(f'annualized_extent_{name}.csv', index=False)
+
+    report.write(os.path.join(REPORT_DIR, 'compute_annualized_timeseries.json'),
+                 os.path.join(REPORT_DIR, 'compute_annualized_timeseries.prom'))
+
+
+def annualized_from_pyramid(pyramid, regions, years, today=None):
+    """Reads the water-year means of the regions from the monthly level of the pyramid.
+
+    A year is covered when, in every region, each of its months that ended before ``today``
+    holds all of its days; its mean is the mean of those monthly means.
+
+    Returns:
+        tuple: (region, year, extent table of the covered years, list of the other years)
+    """
+    # Months starting before the current one have ended
+    ended = pd.Timestamp(today if today is not None else datetime.now()).to_period('M').start_time
+    covered = set(years)
+    frames = []
+    for name in regions:
+        monthly = pyramid.read(name, 'monthly')
+        monthly = monthly[(monthly['date'] < ended) & (monthly['days'] == monthly['date'].dt.days_in_month)]
+        complete = set(monthly['date'])
+        for year in years:
+            months = pd.date_range(f'{year - 1}-09-01', f'{year}-08-01', freq='MS')
+            months = months[months < ended]
+            if months.empty or not complete.issuperset(months):
+                covered.discard(year)
+        frames.append(monthly.assign(region=name, year=water_year(monthly['date'])))
+
+    df = pd.concat(frames)
+    df = (df[df['year'].isin(covered)]
+          .groupby(['region', 'year'], sort=False)['seaice_extent'].mean()
+          .rename('extent')
+          .reset_index())
+    return df[['region', 'year', 'extent']], [year for year in years if year not in covered]
+
+
+def annualized_from_grids(regions, years, report):
+    """Computes the water-year means of the regions from the monthly CDR and NRT grids."""
 
-            # Store the computed extent along with the region name and year in the list
-            extents.append({'region': name, 'year': year, 'extent': np.mean(ext.values)})
+    # Initialize Dask Client for parallel computing. You can customize the cluster if needed.
+    # cluster = LocalCluster(n_workers=4, threads_per_worker=2)  # Optional: custom cluster configuration
+    client = Client()  # Start a Dask client using the default settings
+    print(f"Dashboard is running on: {client.dashboard_link}")  # Print Dask dashboard link for monitoring
 
-            # Clean up memory after each iteration to avoid excessive memory usage
-            del ds, sic, ext
+    # Read all regional shapefiles so only their grid window is transferred
+    shapes = read_regions(regions, 'resources/akmarineeco', CRS)
 
-        # Get the latest from NRT dataset (e.g. Year 2024 refers to 2023-09-01 to 2024-08-31)
-        year = thisyear
-        sic_latest = SIC25k(NRT_DATA_ID, VAR_NAME, CRS)  # Initialize SIC25k with ERDDAP data
-        ds, area = sic_m.subset_dim([f'{year-1}-09-01', f'{year}-08-31'], alaska_shp_proj)
-        sic = sic_latest.format_sic(ds, 0.15)  # convert values to be 0 or 1 based on threshold
+    # Instantiate SIC25k objects for the CDR and NRT products and load grid data
+    sic_m = SIC25k(CDR_DATA_ID, VAR_NAME, CRS, cache_dir=CACHE_DIR, window_shapes=shapes, report=report)  # Initialize SIC25k with (cached) ERDDAP data
+    sic_latest = SIC25k(NRT_DATA_ID, VAR_NAME, CRS, cache_dir=CACHE_DIR, window_shapes=shapes, report=report)
+    sic_m.load_area(AREA_ID)  # Load the corresponding grid cell area data
 
-        # Compute the sea ice extent in square kilometers for the subset data
-        ext = sic_latest.compute_extent_km(sic, area)
+    # Build the region index once (cached on disk)
+    index = sic_m.build_region_index(shapes, cache_dir=CACHE_DIR)
 
-        # Store the computed extent along with the region name and year in the list
-        extents.append({'region': name, 'year': year, 'extent': np.mean(ext.values)})
+    # Use CDR months where available and NRT months otherwise
+    sic = stitch_sources(sic_m.ds, sic_latest.ds, (CDR_DATA_ID, NRT_DATA_ID))
 
-        # Clean up memory after each iteration to avoid excessive memory usage
-        del ds, sic, ext
-        gc.collect()
+    # Monthly extent of all regions (lazy), averaged over each September-August water year
+    # (e.g. Year 2024 refers to 2023-09-01 to 2024-08-31) in one computation
+    ext = index.extent(sic, 0.15)
+    report.track_dask('extent', ext)
+    with report.stage('reduce'):
+        return annualized_extent(ext, years)
 
-        # Convert the list of extents into a pandas DataFrame and export it to a CSV file
-        df = pd.DataFrame(extents)
-        df.to_csv(f'annualized_extent_{name}.csv', index=False)  # Save the results for each region
 
-        # Clean up memory after processing each region
-        del alaska_shp_proj
-        
 # Entry point of the script
 if __name__ == "__main__":
     main()  # Run the main function
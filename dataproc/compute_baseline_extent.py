@@ -2,12 +2,15 @@
 # coding: utf-8
 
 # Import necessary libraries
-from pw_data import SIC25k  # Custom class to handle sea ice concentration data (NSIDC 25k)
-import numpy as np  # For numerical operations
-import pandas as pd  # For working with DataFrames and exporting data
-import geopandas as gpd
-from pathlib import Path
+from pw_data import SIC25k, BaselineAccumulator, read_regions  # Custom classes to handle sea ice concentration data (NSIDC 25k)
+from pw_engine import ExtentEngine, ExtentBackfill  # Parallel and checkpointed extent computation
+from pw_baseline import BaselineDistribution  # Sorted per-day baseline sample for anomaly/percentile/rank
+from pw_metrics import RunReport  # Stage timings and counters of the run
+from pw_store import ExtentStore  # Daily extent history written by backfill_extent.py
+from pw_paths import ROOT, DATA_DIR, BASELINE_DIST, EXTENT_HISTORY  # Files shared with the other scripts
 import xarray as xr
+import logging
+import os
 
 #from dask.distributed import Client  # Dask for distributed computing
 
@@ -19,7 +22,19 @@ def main():
     GRID_AREA_ID = 'pstere_gridcell_N25k'  # Grid cell area
     CRS = 'epsg:3413'  # EPSG code for the polar stereographic (north) projection
     VAR_NAME = 'cdr_seaice_conc'  # The variable name in the daily dataset
-    RESOURCE_DIR = "resources/akmarineeco"
+    # Paths are anchored to this script and the repository root, not the working directory
+    RESOURCE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'resources', 'akmarineeco')
+    CACHE_DIR = os.path.join(ROOT, 'cache')  # Local copy of the ERDDAP data, synced incrementally
+    BASELINE_YEARS = range(1991, 2021)  # Baseline from 1991 to 2020
+    STATE_FILE = os.path.join(CACHE_DIR, 'baseline_state.npz')  # Partial baseline state, reused on reruns
+    DIST_FILE = BASELINE_DIST  # Sorted baseline distribution per region and day, read by the daily update
+    REPORT_DIR = os.path.join(ROOT, 'reports')  # JSON run report and Prometheus text file
+    HISTORY_DIR = EXTENT_HISTORY  # Daily extent history (backfill_extent.py); its years are not recomputed
+    WORKERS = None  # Worker processes (default: number of CPUs; with 1, the next blocks are read while one is reduced)
+    MEMORY_BUDGET = '2GB'  # Memory for the data blocks in flight, across all workers
+
+    logging.basicConfig(level=logging.INFO)
+    report = RunReport('compute_baseline_extent')
 
     # Define regions and corresponding shapefiles
     REGIONS = dict([('AlaskanArctic', 'arctic_sf.shp'),
@@ -27,65 +42,81 @@ def main():
                     ('EasternBering', 'ebering_sf.shp'),
                     ('SoutheasternBering', 'se_bering_sf.shp')])
 
+    # Read all regional shapefiles so only their grid window is transferred
+    shapes = read_regions(REGIONS, RESOURCE_DIR, CRS)
+
    # Instantiate an SIC25k object and load sea ice concentration and grid data
-    sic_m = SIC25k(CDR_DAILY_ID, VAR_NAME, CRS)  # Initialize SIC25k with ERDDAP data
+    sic_m = SIC25k(CDR_DAILY_ID, VAR_NAME, CRS, cache_dir=CACHE_DIR, window_shapes=shapes, report=report)  # Initialize SIC25k with (cached) ERDDAP data
     sic_m.load_area(GRID_AREA_ID)  # Load the corresponding grid cell area data
 
-
-    # Loop over each region and its corresponding shapefile
-    for name, shp in REGIONS.items():
-        # Load the shapefile for the region and transform it to the dataset's CRS
-        print(f'name is {name}, and shape file is {shp}')
-        alaska_shp = gpd.read_file(f'{RESOURCE_DIR}/{shp}')
-        alaska_shp_proj = alaska_shp.to_crs(CRS)
-
-        # List to store annual sea ice extent for each region and year
-        extents = []
-        # Baseline from 1991 to 2020
-        for year in range(1991, 2021):
-
-            # Subset the dataset by time (September 1 to August 31) and region (clip to the shapefile)
-            ds, area = sic_m.subset_dim([f'{year}-01-01', f'{year}-12-31'], alaska_shp_proj)
-
-            # Format the sea ice concentration data to binary (0, 1, or nan) using a threshold of 0.15
-            sic = sic_m.format_sic(ds, 0.15)  # Sea ice concentration thresholding
-
-            # Compute the sea ice extent in square kilometers for the subset data
-            ext = sic_m.compute_extent_km(sic, area)
-
-            # Append to the list of all years data
-            extents.append(ext)
-
-            # Clean up memory after each iteration to avoid excessive memory usage
-            del ds, sic, ext
-        
-        # Combine each year data into one dataset
-        combined_ext = xr.concat(extents, dim = 'time')
-
-        # Transform to data frame 
-        ext_df = (combined_ext
-                .to_dataframe()
-                .reset_index()
-                .drop(['spatial_ref'], axis='columns'))
-        
-        # For saving the data into csv file
-#
-        #ext_df.to_csv(f'ext_{name}.csv', index=False)
-
-        # Reformat date
-        ext_df['time'] = pd.to_datetime(ext_df['time'])
-        ext_df['month'] = ext_df['time'].dt.month
-        ext_df['day'] = ext_df['time'].dt.day
-        ext_df = ext_df.drop(columns=['time'])
-
-        # Group by month and day, then compute the mean for each group
-        # mean_values = df.groupby(['month', 'day']).mean().reset_index()
-        stats = ext_df.groupby(['month', 'day']).agg(['mean', 'std']).reset_index()
-        stats = stats.round(2)
-        stats.columns = ['_'
-                         .join(col).strip() if col[1] else col[0] for col in stats.columns.values]     
-        stats['month_day'] = stats.apply(lambda row: f"{row['month'].astype(int):02d}-{row['day'].astype(int):02d}", axis=1)
-        stats.to_csv(f'bs_extent_{name}.csv', index=False)
+    # Build the region index once (cached on disk)
+    index = sic_m.build_region_index(shapes, cache_dir=CACHE_DIR)
+
+    # Resume from the saved state if the regions match, so only missing years are computed
+    acc = BaselineAccumulator(REGIONS)
+    if os.path.exists(STATE_FILE):
+        saved = BaselineAccumulator.load(STATE_FILE)
+        if saved.regions == acc.regions:
+            acc = saved
+
+    dist = BaselineDistribution(REGIONS)
+    os.makedirs(os.path.dirname(DIST_FILE), exist_ok=True)
+    if os.path.exists(DIST_FILE):
+        saved = BaselineDistribution.load(DIST_FILE)
+        if saved.regions == dist.regions:
+            dist = saved
+
+    def fold(year, ext):
+        # Fold the year into the running per (month, day) statistics and the sorted
+        # distribution, and save both
+        if year not in acc.labels:
+            acc.update(ext, label=year)
+        if year not in dist.labels:
+            dist.update(ext, label=year)
+        with report.stage('write'):
+            acc.save(STATE_FILE)
+            dist.save(DIST_FILE)
+        print(f'Processed {year}')
+
+    years = [year for year in BASELINE_YEARS if str(year) not in acc.labels or str(year) not in dist.labels]
+
+    # Years the backfill already stored with the same grid, regions and threshold (with any partition
+    # length) are read from the history
+    store = ExtentStore(HISTORY_DIR)
+    backfill = ExtentBackfill(sic_m.ds, index, store, **sic_m.kernel_threshold(0.15))
+    stored = [year for year in years if backfill.covers(f'{year}-01-01', f'{year}-12-31')]
+    with report.stage('open'):
+        for year in stored:
+            ext = xr.concat([store.read(name, f'{year}-01-01', f'{year}-12-31')
+                             .set_index('date')['seaice_extent']
+                             .rename_axis('time')
+                             .to_xarray()
+                             .assign_coords(region=name) for name in REGIONS], dim='region')
+            fold(str(year), ext)
+    years = [year for year in years if year not in stored]
+
+    # One (region, year) job per remaining year, run in parallel across the workers
+    jobs = [(name, (f'{year}-01-01', f'{year}-12-31')) for year in years for name in REGIONS]
+    engine = ExtentEngine(sic_m.ds, index, workers=WORKERS, memory_budget=MEMORY_BUDGET,
+                          **sic_m.kernel_threshold(0.15))
+
+    # Results come back in job order, so years are folded in order and the state is saved after each
+    done = []
+    with report.stage('reduce'):
+        for (name, window), ext in engine.iter_results(jobs):
+            done.append(ext)
+            if len(done) < len(REGIONS):
+                continue
+            fold(window[0][:4], xr.concat(done, dim='region'))
+            done = []
+
+    # Write the baseline statistics of each region
+    with report.stage('write'):
+        for name in REGIONS:
+            acc.to_frame(name).to_csv(os.path.join(DATA_DIR, f'bs_extent_{name}.csv'), index=False)
+
+    report.write(os.path.join(REPORT_DIR, 'compute_baseline_extent.json'),
+                 os.path.join(REPORT_DIR, 'compute_baseline_extent.prom'))
 
 if __name__ == "__main__":
     main()  
@@ -5,8 +5,11 @@ transforms them into the proper coordinate reference system (CRS), and processes
 from the NSIDC dataset to calculate the sea ice extent within the regions.
 
 Sea ice extent is computed for each region for the time period of September 1 (last year) to December 31 (this year). 
-The results are saved as CSV files, where sea ice concentration is thresholded into binary values (0 or 1) 
+All regions are computed in one pass with a region index (sparse area-weight matrix) that is built once
+from the shapefiles and cached in `cache/`. The results are saved as CSV files, where sea ice concentration is thresholded into binary values (0 or 1) 
 and sea ice extent is computed in square kilometers.
+The same pass also computes extent at 30/50/80%, sea ice area and open-water fraction, saved per region
+as `nrt_metrics_{name}.csv` (region, date and one column per metric).
 
 Dependencies:
 - os
@@ -21,11 +24,11 @@ Date: September 27, 2024
 
 """
 
-import os, sys
-import geopandas as gpd
+import os
+import logging
 import datetime
-import matplotlib.pyplot as plt
-from pw_data import SIC25k
+from pw_data import SIC25k, read_regions, metrics_frame
+from pw_metrics import RunReport
 
 def main():
     """
@@ -38,6 +41,12 @@ def main():
     NRT_DAILY_ID = 'nsidcG10016v3nh1day'  # Dataset ID for near real-time sea ice data
     VAR_NAME = 'cdr_seaice_conc'  # Variable name for sea ice concentration
     GRID_CELL_AREA_ID = 'pstere_gridcell_N25k'  # Grid cell area ID for sea ice extent calculations
+    RESOURCE_DIR = 'resources/akmarineeco'  # Regional shapefiles
+    CACHE_DIR = 'cache'  # Persisted region index and local copy of the ERDDAP data
+    REPORT_DIR = 'reports'  # JSON run report and Prometheus text file
+
+    logging.basicConfig(level=logging.INFO)
+    report = RunReport('compute_ext_recent_years')
 
     # Define regions and corresponding shapefiles
     REGIONS = dict([('AlaskanArctic', 'arctic_sf.shp'),
@@ -45,43 +54,38 @@ def main():
                     ('EasternBering', 'ebering_sf.shp'),
                     ('SoutheasternBering', 'se_bering_sf.shp')])
 
-    # Instantiate SIC25k object and load grid area data
-    sic_m = SIC25k(NRT_DAILY_ID, VAR_NAME, CRS)
+    # Read the regional shapefiles
+    shapes = read_regions(REGIONS, RESOURCE_DIR, CRS)
+
+    # Instantiate SIC25k object (only the grid window covering the regions is transferred) and load grid area data
+    sic_m = SIC25k(NRT_DAILY_ID, VAR_NAME, CRS, cache_dir=CACHE_DIR, window_shapes=shapes, report=report)
     sic_m.load_area(GRID_CELL_AREA_ID)  
 
+    # Build the region index once (cached on disk)
+    index = sic_m.build_region_index(shapes, cache_dir=CACHE_DIR)
 
     # If the current month is September (9) or later, use the current year, otherwise use the previous year.
     today = datetime.date.today()
     lastyear = today.year if today.month > 8 else today.year - 1
 
-    # Loop over each region and its corresponding shapefile
-    for name, shp in REGIONS.items():
-        # Load the shapefile and project it to the dataset's CRS
-        alaska_shp = gpd.read_file(f'resources/akmarineeco/{shp}')
-        alaska_shp_proj = alaska_shp.to_crs(CRS)
-
-        # Subset the dataset by time and region (ex: 2023-09-01 to 2025-08-31)
-        ds, area = sic_m.subset_dim([f'{lastyear-1}-09-01', f'{lastyear+1}-12-31'], alaska_shp_proj)
-
-        # Format sea ice concentration data to binary using a 0.15 threshold
-        sic = sic_m.format_sic(ds, 0.15)
-
-        # Compute sea ice extent in square kilometers
-        ext = sic_m.compute_extent_km(sic, area)
-        
-        # Clean up memory to avoid excessive usage
-        del alaska_shp, alaska_shp_proj, ds, sic 
-
-        print(ext)
-        # Convert xarray object to a dataframe, reformat, and save as CSV
-        ext_df = (ext
-                  .to_dataframe()
-                  .reset_index()
-                  .drop(['spatial_ref'], axis='columns')
-                  .rename(columns={'time': 'date'}))
-        
-        ext_df.to_csv(f'nrt_extent_{name}.csv', index=False)  
+    # Compute sea ice extent (km^2) at 15/30/50/80%, sea ice area and open-water fraction
+    # for all regions in one pass (ex: 2023-09-01 to 2025-08-31)
+    metrics = sic_m.compute_region_metrics([f'{lastyear-1}-09-01', f'{lastyear+1}-12-31'], index)
+    report.track_dask('metrics', metrics)
+    with report.stage('reduce'):
+        df = metrics_frame(metrics.compute())
+
+    for name in REGIONS:
+        # Extent at 15% keeps the published date,seaice_extent format; all metrics go to a separate table
+        region_df = df[df['region'] == name].drop(columns='region')
+        ext_df = region_df[['date', 'extent_15']].rename(columns={'extent_15': 'seaice_extent'})
+
+        with report.stage('write'):
+            ext_df.to_csv(f'nrt_extent_{name}.csv', index=False)  
+            region_df.to_csv(f'nrt_metrics_{name}.csv', index=False)
 
+    report.write(os.path.join(REPORT_DIR, 'compute_ext_recent_years.json'),
+                 os.path.join(REPORT_DIR, 'compute_ext_recent_years.prom'))
 
 if __name__ == "__main__":
     main()
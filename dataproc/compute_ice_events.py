@@ -0,0 +1,68 @@
+"""
+Title: Freeze-up, break-up and ice-season length per region
+Description:
+    Replays a daily extent history through the seasonal event detector (`SeasonEventDetector` in
+    `pw_events.py`) to seed its state, and writes the events of each region, one row per
+    September-August water year, to `ice_events_{name}.csv`.
+
+    The history is the extent store written by `backfill_extent.py` (`data/extent_history`). The
+    state is written where the nightly `scripts/update_daily_extent.py` reads it
+    (`data/ice_events_state.json`), so the nightly job then only steps through its new days.
+    Seasons the nightly store does not cover are kept in the state when it replays its own days.
+
+    The threshold of a region is at `--fraction` of the range of its 1991-2020 mean annual cycle,
+    from the baseline distribution (`bs_extent_dist.npz`) or else the mean files (`bs_extent_{name}.csv`).
+
+Usage:
+    python compute_ice_events.py
+    python compute_ice_events.py --history data/extent_history --window 5 --persist 5
+"""
+
+import argparse
+import os
+
+import pandas as pd
+
+from pw_baseline import BaselineDistribution
+from pw_events import SeasonEventDetector, cycle_threshold, thresholds_from_baseline
+from pw_store import ExtentStore
+from pw_paths import DATA_DIR, BASELINE_DIST, EVENTS_STATE, EXTENT_HISTORY
+
+REGIONS = ['AlaskanArctic', 'NorthernBering', 'EasternBering', 'SoutheasternBering']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    # Defaults are the files of the repository root that the other scripts and the nightly job use
+    parser.add_argument('--history', default=EXTENT_HISTORY,
+                        help='Extent store to replay (default: data/extent_history)')
+    parser.add_argument('--state', default=EVENTS_STATE,
+                        help='Detector state file (default: data/ice_events_state.json)')
+    parser.add_argument('--out', default=DATA_DIR, help='Directory of the ice_events_{name}.csv files (default: data)')
+    parser.add_argument('--fraction', type=float, default=0.15,
+                        help='Threshold position in the climatological range (default: 0.15)')
+    parser.add_argument('--window', type=int, default=5, help='Days in the running mean (default: 5)')
+    parser.add_argument('--persist', type=int, default=5, help='Days a crossing must last (default: 5)')
+    args = parser.parse_args()
+
+    if os.path.exists(BASELINE_DIST):
+        thresholds = thresholds_from_baseline(BaselineDistribution.load(BASELINE_DIST), args.fraction)
+    else:
+        thresholds = {name: cycle_threshold(pd.read_csv(os.path.join(DATA_DIR, f'bs_extent_{name}.csv'))['seaice_extent_mean'],
+                                            args.fraction) for name in REGIONS}
+    events = SeasonEventDetector({name: thresholds[name] for name in REGIONS},
+                                 window=args.window, persist=args.persist)
+
+    store = ExtentStore(args.history)
+    for name in REGIONS:
+        ext_df = store.read(name, columns=['seaice_extent'])
+        n = events.replay(name, ext_df['date'], ext_df['seaice_extent'])
+        events.to_csv(name, os.path.join(args.out, f'ice_events_{name}.csv'))
+        print(f'{name}: replayed {n} days, {len(events.events(name))} seasons')
+
+    os.makedirs(os.path.dirname(args.state) or '.', exist_ok=True)
+    events.save(args.state)
+
+
+if __name__ == '__main__':
+    main()
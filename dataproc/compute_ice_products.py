@@ -0,0 +1,82 @@
+"""
+Title: Gridded sea ice products for the Alaska window
+Description:
+    Computes per-cell sea ice products on the NSIDC 25 km grid window covering the Alaska regions,
+    one file per September-August season (`IceProducts` in `pw_products.py`):
+    monthly ice frequency (share of valid days with concentration >= 15%), ice days per month and
+    per season, and the first and last ice dates of the season.
+
+    The daily CDR data, completed with NRT days where the CDR has no data yet (`stitch_sources`), are
+    thresholded and reduced one month at a time, so memory stays constant. Outputs are compressed,
+    chunked NetCDF files `{out}/ice_products_{season}.nc`. Rerunning the command only processes days
+    after the last processed day of each season, so earlier seasons are never reprocessed; use
+    `--rebuild-from` to recompute the seasons from a date on (e.g., once the CDR replaces NRT days).
+
+Usage:
+    python compute_ice_products.py
+    python compute_ice_products.py --start 2020-09-01 --rebuild-from 2024-09-01
+"""
+
+import argparse
+import logging
+import os
+
+from pw_data import SIC25k, read_regions, stitch_sources
+from pw_products import IceProducts
+from pw_metrics import RunReport
+
+CDR_DAILY_ID = 'nsidcG02202v5nh1day'  # CDR daily sea ice conc
+NRT_DAILY_ID = 'nsidcG10016v3nh1day'  # NRT daily sea ice conc
+CRS = 'epsg:3413'  # EPSG code for the polar stereographic (north) projection
+VAR_NAME = 'cdr_seaice_conc'
+RESOURCE_DIR = 'resources/akmarineeco'
+CACHE_DIR = 'cache'  # Local copy of the ERDDAP data, synced incrementally
+REPORT_DIR = 'reports'  # JSON run report and Prometheus text file
+REGIONS = dict([('AlaskanArctic', 'arctic_sf.shp'),
+                ('NorthernBering', 'nbering_sf.shp'),
+                ('EasternBering', 'ebering_sf.shp'),
+                ('SoutheasternBering', 'se_bering_sf.shp')])
+
+
+def compute(args, report):
+    # The grid window covering all regions, byte-scaled so a month of days is one byte per cell and day
+    shapes = read_regions(REGIONS, RESOURCE_DIR, CRS)
+    with report.stage('open'):
+        sic_cdr = SIC25k(CDR_DAILY_ID, VAR_NAME, CRS, cache_dir=CACHE_DIR, window_shapes=shapes, raw=True,
+                         report=report)
+        sic_nrt = SIC25k(NRT_DAILY_ID, VAR_NAME, CRS, cache_dir=CACHE_DIR, window_shapes=shapes, raw=True,
+                         report=report)
+    sic = stitch_sources(sic_cdr.ds, sic_nrt.ds, (CDR_DAILY_ID, NRT_DAILY_ID))
+
+    products = IceProducts(sic_cdr, args.out, threshold=args.threshold, ds=sic)
+    written = []
+    if args.rebuild_from is not None:
+        written += products.update(start=args.rebuild_from, rebuild=True)
+    written += products.update(start=args.start)
+    print(f'Wrote {len(written)} seasons: {sorted(set(written))}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--out', default=os.path.join('data', 'ice_products'),
+                        help='Output directory (default: data/ice_products)')
+    parser.add_argument('--start', default=None, help='First date (default: first day of the data)')
+    parser.add_argument('--threshold', type=float, default=0.15, help='Ice concentration threshold (default: 0.15)')
+    parser.add_argument('--rebuild-from', default=None,
+                        help='Recompute the seasons from this date on (default: only extend with new days)')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    report = RunReport('compute_ice_products')
+    try:
+        compute(args, report)
+    except Exception as e:
+        report.error(f'{type(e).__name__}: {e}')
+        raise
+    finally:
+        report.write(os.path.join(REPORT_DIR, 'compute_ice_products.json'),
+                     os.path.join(REPORT_DIR, 'compute_ice_products.prom'))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,10 +1,16 @@
 """
 Title: Compute total area in square km for Alaska Ecosystem Regions
 
-Description: 
-    For each defined region, it calculates the total sea ice extent in square kilometers
+Description:
+    For each defined region, it calculates the total area in square kilometers of the grid cells
+    that carry sea ice concentrations (land, coast, lakes and the pole hole are excluded),
     based on 25K polar stereographic projection and the regional shapefiles.
-    The results are printed for each region.
+    Clipped area, valid-cell mask and total are kept in the area cache (`cache/region_area`),
+    keyed by the shapefile, grid and dataset IDs, so reruns do not fetch or clip the area again.
+
+    Outputs:
+    - area_{name}.nc: clipped grid cell area (m^2) of each region
+    - region_area.csv: total area (km^2) of each region, read by the site pages
 
 Regions:
 - Alaskan Arctic
@@ -15,45 +21,36 @@ Regions:
 Dependencies:
 - os
 - sys
-- geopandas
-- datetime
-- matplotlib
-- pw_data (specifically, the pwSIC25k class)
+- pandas
+- pw_data (specifically, the SIC25k class)
 
 Parameters:
 - CRS: EPSG:3413 (Polar Stereographic)
-- NRT_DAILY_ID: 'nsidcG10016v2nh1day'
+- NRT_DAILY_ID: 'nsidcG10016v3nh1day'
 - GRID_CELL_AREA_ID: 'pstere_gridcell_N25k'
 - VAR_NAME: 'cdr_seaice_conc'
 
 Usage:
-    Run this script to compute and display total sea ice extent for each region.
+    Run this script to compute total area for each region, then copy region_area.csv to data/.
 
 Author: Sunny Bak Hospital
 Date: October 8, 2024
 """
-# import matplotlib.pyplot as plt
-import os, sys
-import geopandas as gpd
-import datetime
-import matplotlib.pyplot as plt
-
-# Import the utils module from parent directory
-current_dir = os.path.dirname(os.path.abspath(__file__))
-parent_dir = os.path.abspath(os.path.join(current_dir, '../..'))
-sys.path.insert(0, parent_dir)
+import pandas as pd
 
-from pw_data import SIC25k
+from pw_data import SIC25k, read_regions
 
 def main():
     # server and data set info
-    
+
     CRS = 'epsg:3413'
-    NRT_DAILY_ID = 'nsidcG10016v2nh1day'
+    NRT_DAILY_ID = 'nsidcG10016v3nh1day'
     AREA_ID = 'pstere_gridcell_N25k'  # ID for the corresponding area grid
     VAR_NAME = 'cdr_seaice_conc'
+    RESOURCE_DIR = 'resources/akmarineeco'  # Regional shapefiles
+    CACHE_DIR = 'cache'  # Area cache and local copy of the ERDDAP data
 
-    Define regions and corresponding shapefiles for spatial subsetting
+    # Define regions and corresponding shapefiles for spatial subsetting
     REGIONS = dict([
        ('AlaskanArctic', 'arctic_sf.shp'),  # Alaskan Arctic region
        ('NorthernBering', 'nbering_sf.shp'),  # Northern Bering Sea region
@@ -61,27 +58,21 @@ def main():
         ('SoutheasternBering', 'se_bering_sf.shp') # Southeastern Bering Sea region
     ])
 
+    shapes = read_regions(REGIONS, RESOURCE_DIR, CRS)
 
-    sic = SIC25k(NRT_DAILY_ID, VAR_NAME, CRS)  # Initialize SIC25k with ERDDAP data
-    sic.load_area(AREA_ID)  # Load the corresponding grid cell area data
-    
-    for name, shp in REGIONS.items():
-        # print(f'name is {name}, and shape file is {shp}')
-
-        # print("reading shapefile : ")
-        alaska_shp = gpd.read_file(f'resources/akmarineeco/{shp}')
+    # The grid cell area is only fetched when a region misses the area cache
+    sic = SIC25k(NRT_DAILY_ID, VAR_NAME, CRS, cache_dir=CACHE_DIR, window_shapes=shapes, area_id=AREA_ID)
 
-    # Transform projection to Polar Stereographic Projection
-        alaska_shp_proj = alaska_shp.to_crs(CRS)
+    totals = []
+    for name, shp in shapes.items():
+        entry = sic.regional_area(shp)
+        total_area = entry.attrs['total_area_km2']
+        print(f'total area for {name}: {total_area:.2f}')
 
-        _, area = sic.subset_dim([f'2023-09-01', f'2023-09-01'], alaska_shp_proj) # Get one time step
-        total_area = sic.get_total_area_km(alaska_shp_proj)
-        print(f'total area for {name}: {total_area}')
+        entry['cell_area'].to_netcdf(f'area_{name}.nc')
+        totals.append({'region': name, 'total_area_km2': round(total_area, 2)})
 
-    # Get Area data
-        area.plot()
-        plt.show()
-        area.to_netcdf(f'area_{name}.nc')
+    pd.DataFrame(totals).to_csv('region_area.csv', index=False)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,156 @@
+"""
+Title: Baseline distribution of the daily regional sea ice extent
+Description: Sorted per-calendar-day extents of the baseline years (1991-2020) of each region, stored
+compactly in one ``.npz`` file, so a day's anomaly, z-score, percentile and rank among the baseline
+years are computed with a binary search instead of reprocessing the baseline.
+
+Layout of the file:
+    regions  region names
+    labels   baseline years (one per column of values)
+    values   float32 (regions, 366, years), each row sorted ascending, NaN (missing days, e.g.
+             Feb 29 in non-leap years) at the end
+
+Main Classes and Functions:
+- BaselineDistribution: Sorted per-(region, calendar day) baseline sample, built year by year, with
+  anomaly/z-score/percentile/rank scoring of new days.
+- CALENDAR / day_slot: The 366 calendar-day slots of a year and the slot of each day.
+- water_year: September-August water year of each day.
+"""
+
+import os
+import warnings
+
+import numpy as np
+import pandas as pd
+
+# Calendar days of a leap year; Feb 29 has its own slot
+CALENDAR = pd.date_range("2000-01-01", "2000-12-31", freq="D")
+
+
+def day_slot(times) -> np.ndarray:
+    """Maps time stamps to their calendar-day slot (0-365) in ``CALENDAR``."""
+    times = pd.DatetimeIndex(times)
+    return np.searchsorted(CALENDAR.month * 100 + CALENDAR.day, times.month * 100 + times.day)
+
+
+def water_year(times) -> np.ndarray:
+    """Returns the September-August water year of each time stamp (Sep 2023 - Aug 2024 is 2024)."""
+    times = pd.DatetimeIndex(times)
+    return (times.year + (times.month >= 9)).values
+
+
+class BaselineDistribution:
+    """Sorted baseline extents per region and calendar day."""
+
+    def __init__(self, regions: list):
+        """
+        Args:
+            regions (list): Region names.
+        """
+        self.regions = list(regions)
+        self.labels = []
+        self.values = np.empty((len(self.regions), len(CALENDAR), 0), dtype=np.float32)
+        # Count, mean and std per (region, calendar day), computed on the first score after a change
+        self._stats = None
+
+    def __str__(self):
+        return f"BaselineDistribution:\nregions={self.regions}\n, labels={self.labels}"
+
+    def update(self, ext, label: str):
+        """Adds one baseline year of daily extents.
+
+        Args:
+            ext (xr.DataArray): Sea ice extent with dimensions (time, region), at most one value
+                per calendar day (e.g., one year). NaNs are skipped.
+            label (str): Name of the year, recorded in ``labels``.
+
+        Raises:
+            ValueError: If the year is already included or has more than one value per calendar day.
+        """
+        if str(label) in self.labels:
+            raise ValueError(f"{label} is already in the baseline")
+        ext = ext.transpose("time", "region").sel(region=self.regions)
+        slot = day_slot(ext["time"].values)
+        if len(np.unique(slot)) != len(slot):
+            raise ValueError(f"{label} has more than one value per calendar day")
+
+        column = np.full((len(self.regions), len(CALENDAR), 1), np.nan, dtype=np.float32)
+        column[:, slot, 0] = np.asarray(ext.values, dtype=np.float32).T
+        # np.sort puts NaN last, so the valid values of a row are its first ``count`` entries
+        self.values = np.sort(np.concatenate([self.values, column], axis=2), axis=2)
+        self.labels.append(str(label))
+        self._stats = None
+
+    def count(self) -> np.ndarray:
+        """Number of baseline values per (region, calendar day)."""
+        return (~np.isnan(self.values)).sum(axis=2)
+
+    def _day_stats(self) -> tuple:
+        """Count, mean and standard deviation (ddof=1) per (region, calendar day), computed once per baseline."""
+        if self._stats is None:
+            with warnings.catch_warnings():
+                # Calendar days without baseline values (all NaN) are NaN
+                warnings.simplefilter("ignore", RuntimeWarning)
+                mean = np.nanmean(self.values, axis=2)
+                std = np.nanstd(self.values, axis=2, ddof=1)
+            self._stats = (self.count(), mean, std)
+        return self._stats
+
+    def score(self, region: str, dates, values) -> pd.DataFrame:
+        """Scores days against the baseline of their calendar day.
+
+        Each day takes a binary search in its sorted baseline row (O(log n) for n baseline years).
+
+        Args:
+            region (str): Region name.
+            dates (array-like): Days.
+            values (array-like): Sea ice extent of each day.
+
+        Returns:
+            pd.DataFrame: Per day (NaN without a value or baseline):
+                - anomaly: extent minus the baseline mean
+                - zscore: anomaly in baseline standard deviations (ddof=1)
+                - percentile: share (0-100) of baseline years below the extent, ties counted half
+                - rank: position of the extent among the baseline years, from the lowest (1 is
+                  lower than every baseline year, n + 1 higher than all of them)
+        """
+        r = self.regions.index(region)
+        rows = self.values[r]
+        counts, mean, std = (stat[r] for stat in self._day_stats())
+
+        slots = day_slot(dates)
+        values = np.asarray(values, dtype=np.float64)
+        percentile = np.full(len(values), np.nan)
+        rank = np.full(len(values), np.nan)
+        for i, (slot, value) in enumerate(zip(slots, values)):
+            n = counts[slot]
+            if n == 0 or np.isnan(value):
+                continue
+            row = rows[slot, :n]
+            below = np.searchsorted(row, value, side="left")
+            ties = np.searchsorted(row, value, side="right") - below
+            percentile[i] = 100 * (below + ties / 2) / n
+            rank[i] = below + 1
+
+        anomaly = values - mean[slots]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            zscore = anomaly / std[slots]
+        return pd.DataFrame({"anomaly": anomaly, "zscore": zscore, "percentile": percentile, "rank": rank},
+                            index=pd.DatetimeIndex(dates, name="date"))
+
+    def save(self, path: str):
+        """Writes the distribution to a compressed ``.npz`` file (atomically)."""
+        tmp = path + ".tmp.npz"
+        np.savez_compressed(tmp, regions=np.array(self.regions), labels=np.array(self.labels, dtype=str),
+                            values=self.values)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> "BaselineDistribution":
+        """Reads a distribution written by ``save``."""
+        with np.load(path) as f:
+            dist = cls(f["regions"].tolist())
+            dist.labels = f["labels"].tolist()
+            dist.values = f["values"]
+        dist._stats = None
+        return dist
@@ -18,10 +18,30 @@ Modules used:
 Main Classes and Functions:
 - cwData: Base class for loading and manipulating data from ERDDAP.
 - SIC25k: Derived class for processing sea ice concentration data at 25 km resolution.
-- Helper Functions: Utility functions like `clip_data` to perform spatial clipping.
+- RegionIndex: Sparse (regions x grid cells) area-weight matrix, built once per shapefile/grid and cached on disk.
+- BaselineAccumulator: Streaming, mergeable per-(month, day) mean/std of regional extents.
+- GridCache: Local time-partitioned NetCDF copy of an ERDDAP dataset, synced incrementally
+  (optionally through the concurrent `GriddapDownloader` of `pw_fetch`).
+- AreaCache: Content-addressed cache of clipped grid cell area, valid-cell mask and total area per region.
+- Runs are instrumented with a `pw_metrics.RunReport` (stage times, bytes fetched, Dask tasks and chunks,
+  peak memory); load errors are logged with `logging` and raised.
+- Helper Functions: Utility functions like `clip_data` to perform spatial clipping, `pack_conc` for the
+  byte-scaled (raw) representation, and `grid_window` (with `pw_fetch.griddap_query`, imported here)
+  to request only the grid window covering the regions, `stitch_sources`/`annualized_extent` for
+  CDR/NRT water-year series, and `metrics_frame` for multi-threshold extent, ice area and
+  open-water fraction from one read.
+- The fused extent kernels (`fused_extent`, `fused_metrics`) and the region index loader are in
+  `pw_kernels`, shared with the nightly job, and are imported here.
+- `ExtentEngine`, `Prefetcher` and `ExtentBackfill` are in `pw_engine`, `PolygonExtentService` in
+  `pw_polygon` and `IceProducts` in `pw_products`.
 """
 
 
+import hashlib
+import json
+import logging
+import os
+
 import pandas as pd
 import rioxarray
 from shapely.geometry import mapping
@@ -29,13 +49,25 @@ import numpy as np
 import xarray as xr
 import geopandas as gpd
 import rasterio
+import rasterio.features
+from rasterio.transform import Affine
 
 import dask 
-from typing import Tuple
+import dask.array
+from typing import Dict, Tuple
+
+from pw_fetch import GriddapDownloader, griddap_query
+from pw_kernels import fused_extent, fused_metrics, metric_names, region_matrix, load_region_index
+from pw_baseline import CALENDAR, day_slot, water_year
+from pw_engine import ExtentEngine, Prefetcher
+from pw_metrics import RunReport
+
+logger = logging.getLogger(__name__)
 
 
 class cwData:
-    def __init__(self, id, varname, crs, server, grids = None, shape=None):      
+    def __init__(self, id, varname, crs, server, grids = None, shape=None, cache_dir=None, window_shapes=None,
+                 raw=False, downloader=None, report=None, refresh_since=None):      
         """
         Initializes the cwData object, loads sea ice data, and optionally clips it to a shape.
 
@@ -46,8 +78,29 @@ class cwData:
             server (str): The base URL of the ERDDAP server.
             grids (dict, optional): A dictionary with 'x' and 'y' key names for grid dimensions (e.g., xgrid, ygrid for sic data).
             shape (geopandas.GeoDataFrame, optional): Shape geometries projected to the data's CRS. Defaults to None.
+            cache_dir (str, optional): Directory of a local GridCache. When set, data are synced to and read
+                from the local copy instead of the server. Defaults to None.
+            window_shapes (list or dict, optional): Shape geometries (GeoDataFrames) of all regions of interest.
+                When set, only the grid window covering their union bounding box is requested from the server.
+                Defaults to None (full grid).
+            raw (bool, optional): Keep the byte-scaled (uint8) representation instead of decoding to floats.
+                Thresholds and flags are then evaluated on the integers. Defaults to False.
+            downloader (GriddapDownloader, optional): Syncs the local cache with concurrent, retried
+                time-chunk requests instead of OPeNDAP reads. Requires ``cache_dir``. Defaults to None.
+            report (RunReport, optional): Run report the stages are recorded in; share one between the
+                objects of a script. Defaults to a new report named after the dataset ID.
+            refresh_since (str, optional): Refetch cached time partitions from this date on when syncing,
+                e.g. after the server reprocessed recent data. Defaults to None.
+
+        Raises:
+            ValueError: If a downloader is set without a cache directory.
+            Exception: If the data cannot be loaded (logged and recorded in the report).
         """
-        
+        # Without a cache, the data are read lazily over OPeNDAP; a downloader would fetch
+        # the whole time axis up front
+        if downloader is not None and cache_dir is None:
+            raise ValueError("A downloader requires a cache_dir to sync the data to")
+
         # Store the provided arguments as instance variables.
         self.crs = crs
         self.varname = varname
@@ -55,73 +108,176 @@ class cwData:
         self.server = server
         self.grids = grids
         self.id = id
+        self.cache_dir = cache_dir
+        self.window_shapes = window_shapes
+        self.window = None
+        self.raw = raw
+        self.downloader = downloader
+        self.refresh_since = refresh_since
+        self.report = report if report is not None else RunReport(id)
         try: 
-            if shape is not None:
+            with self.report.stage("open"):
                 ds = self.load_data()
-                self.ds = clip_data(ds, shape)
-            else:       
-                self.ds = self.load_data()
+            if shape is not None:
+                with self.report.stage("clip"):
+                    ds = clip_data(ds, shape)
+            self.ds = ds
         except Exception as e:
-            print(f'Unable to load data: {e}')
+            logger.exception("Unable to load %s", id)
+            self.report.error(f"Unable to load {id}: {e}")
+            raise
             
     
     def __str__(self):
         """String representation of the cwData object, showing key metadata."""
 
         return (f"cwData:\nid={self.id}\n, varname={self.varname}\n, crs={self.crs}\n, "
-                f"server={self.server}\n, grids={self.grids}\n, shape={self.shape}\n"
+                f"server={self.server}\n, grids={self.grids}\n, shape={self.shape}\n, cache_dir={self.cache_dir}\n, window={self.window}\n, raw={self.raw}\n"
                 f"metadata = {self.ds}")
 
+    def get_window(self, ds: xr.Dataset) -> dict:
+        """Returns the grid window (index slices) covering ``window_shapes``, or None for the full grid.
+
+        The window is computed once from the dataset coordinates and reused for
+        every dataset on the same grid (e.g., grid cell area).
+        """
+        if self.window is None and self.window_shapes is not None:
+            self.window = grid_window(ds[self.grids['x']].values, ds[self.grids['y']].values,
+                                      self.window_shapes, self.crs, self.grids)
+        return self.window
+
+    def open_source(self, id: str, varname: str, mask_and_scale: bool = True) -> xr.Dataset:
+        """Opens an ERDDAP dataset, through the local cache when ``cache_dir`` is set.
+        With ``window_shapes``, the dataset is sliced to the grid window before any
+        data are read, so the server only sends that hyperslab.
+
+        Args:
+            id (str): PolarWatch ERDDAP dataset ID.
+            varname (str): Variable to sync when reading through the cache.
+            mask_and_scale (bool, optional): Decode packed values to floats. Defaults to True.
+
+        Returns:
+            xarray.Dataset: Lazily loaded dataset.
+        """
+        # The remote is opened here only to compute the grid window once; the cache opens
+        # it again to list the time steps it has to sync
+        if self.cache_dir is None or (self.window is None and self.window_shapes is not None):
+            full_URL = '/'.join([self.server,id])
+            ds = xr.open_dataset(full_URL, mask_and_scale=mask_and_scale)
+            if ds is None:
+                raise ValueError(f"Failed to load dataset from {full_URL}")
+            self.get_window(ds)
+        window = self.window
+
+        if self.cache_dir is not None:
+            cache = GridCache(self.cache_dir, self.server, id, varname, window=window,
+                              downloader=self.downloader, report=self.report)
+            cache.sync(refresh_since=self.refresh_since)
+            return cache.open(mask_and_scale=mask_and_scale)
+
+        # Slice before chunking so each read is a hyperslab request on the window only
+        if window is not None:
+            ds = ds.isel(window)
+        return ds.chunk({"time": "auto"}) if "time" in ds.dims else ds
+
     def load_data(self):
-        """Loads sea ice data from the PolarWatch ERDDAP server.
+        """Loads sea ice data from the PolarWatch ERDDAP server (or its local cache).
         The dataset is loaded using the provided ERDDAP ID, variable name, 
-        and grid details. The data is then clipped to a valid range of 0-1.
+        and grid details. The data is then clipped to a valid range of 0-1,
+        or, in raw mode, kept as byte-scaled uint8 values (see `pack_conc`).
 
         Returns:
             xarray.Dataset: Loaded sea ice concentration data, spatially aware and ready for further operations.
         """
 
-        full_URL = '/'.join([self.server,self.id])
-
-        ds = xr.open_dataset(full_URL, chunks={"time":"auto"})
-        if ds is None:
-            raise ValueError(f"Failed to load dataset from {full_URL}")
-        
+        ds = self.open_source(self.id, self.varname, mask_and_scale=not self.raw)
         ds = ds[self.varname]
+        if self.raw:
+            ds = pack_conc(ds)
+            # Clipping fills outside cells with a flag value instead of NaN
+            ds.rio.write_nodata(255, inplace=True)
+        else:
+            ds = ds.clip(min=0, max=1)
         ds.rio.set_spatial_dims(x_dim=self.grids['x'], y_dim=self.grids['y'], inplace=True)
         ds.rio.write_crs(self.crs, inplace=True)
-        ds = ds.clip(min=0, max=1)
+        self.report.track_dask(self.id, ds)
         
         return ds
+
+    def raw_threshold(self, threshold: float) -> int:
+        """Converts a concentration threshold (0-1) to the byte-scaled units of raw mode."""
+        return int(np.ceil(threshold / self.ds.attrs['scale_factor'] - 1e-9))
+
+    def decode(self, ds: xr.DataArray = None) -> xr.DataArray:
+        """Decodes byte-scaled concentrations to float32 (0-1, NaN for flagged or missing cells).
+
+        Args:
+            ds (xr.DataArray, optional): Raw data to decode. Defaults to the loaded dataset.
+
+        Returns:
+            xr.DataArray: Sea ice concentration; data that are not raw are returned unchanged.
+        """
+        ds = self.ds if ds is None else ds
+        if not self.raw:
+            return ds
+        scale = np.float32(self.ds.attrs['scale_factor'])
+        conc = (ds * scale).astype(np.float32).where(ds <= self.ds.attrs['valid_max'])
+        conc.attrs = {k: v for k, v in ds.attrs.items() if k not in ('scale_factor', 'valid_max', 'flag_values')}
+        return conc
  
-    def compute_clim(self, year_range: list, frequency: str)-> xr.Dataset:
-        """Computes climatology (long-term mean) for a given time period and frequency.
+    def compute_clim(self, year_range: list, frequency: str, out: str = None) -> xr.Dataset:
+        """Computes the pixel-level climatology (multi-year mean) for a given time period and frequency.
+
+        Time steps are binned by their position in the year, across years (e.g., all Januaries of
+        the period form one 'M' bin), and averaged per pixel with a chunk-parallel grouped reduction
+        (see `grouped_mean`): each time chunk is reduced to per-bin sums and counts, and the partial
+        results are added up per spatial chunk, so the full cube is never in memory.
 
         Args:
             year_range (list): Start and end years to define the time period for climatology.
-            frequency (str): Frequency to group the data by ('15D', 'W', 'D', 'M', 'Q').
+            frequency (str): Bins of the year: '15D' (15-day periods), 'W' (weeks), 'D' (calendar
+                days), 'M' (months) or 'Q' (quarters); see `clim_bins`.
+            out (str, optional): NetCDF file the climatology is streamed to, one spatial chunk at a
+                time, with the same chunking. Defaults to None (the result stays lazy).
 
         Raises:
             ValueError: If the provided year range is out of bounds or if the frequency is not valid.
 
         Returns:
-            xarray.Dataset: Climatology data averaged over the specified frequency.
+            xarray.Dataset: Mean (named after the variable) and number of valid time steps ('count')
+                per bin and pixel; read back from ``out`` when it is given.
         """
         start_year = pd.Timestamp(self.ds['time'].min().values).year
         end_year = pd.Timestamp(self.ds['time'].max().values).year
 
         if year_range[0] < start_year or year_range[1] > end_year:
             raise ValueError("Year range provided must be within the dataset's date range.")
-      
-        ds_selected = self.ds.sel(time=slice(f"{year_range[0]}-01-01", f"{year_range[1]}-12-31")).chunk({'xgrid': 'auto', 'ygrid': 'auto'})
 
-        if frequency == "15D":
-            ds_clim = ds_selected.groupby(custom_15day_interval(ds_selected.time)).mean("time")
-        elif frequency in ["W", "D", "M", "Q"]:
-            ds_clim = ds_selected.resample(time=frequency).mean()
-        else:
-            raise ValueError("Frequency should be one of ['15D', 'W', 'D', 'M', 'Q']")
-        return ds_clim
+        x_dim, y_dim = self.grids['x'], self.grids['y']
+        ds_selected = self.decode(self.ds.sel(time=slice(f"{year_range[0]}-01-01", f"{year_range[1]}-12-31")))
+        ds_selected = ds_selected.transpose("time", y_dim, x_dim)
+        if ds_selected.chunks is None:
+            ds_selected = ds_selected.chunk({"time": "auto"})
+
+        bins, labels, dim = clim_bins(ds_selected["time"].values, frequency)
+        with self.report.stage("reduce"):
+            mean, count = grouped_mean(ds_selected.data, bins, len(labels))
+        coords = {dim: labels, y_dim: ds_selected[y_dim].values, x_dim: ds_selected[x_dim].values}
+        ds_clim = xr.Dataset({self.varname: ((dim, y_dim, x_dim), mean), "count": ((dim, y_dim, x_dim), count)},
+                             coords=coords)
+        ds_clim.attrs = {"climatology_years": f"{year_range[0]}-{year_range[1]}", "frequency": frequency}
+        if "spatial_ref" in self.ds.coords:
+            ds_clim = ds_clim.assign_coords(spatial_ref=self.ds["spatial_ref"])
+
+        if out is None:
+            return ds_clim
+        with self.report.stage("write"):
+            chunks = tuple(c[0] for c in mean.chunks)
+            encoding = {v: {"zlib": True, "chunksizes": chunks} for v in (self.varname, "count")}
+            tmp = out + ".tmp"
+            ds_clim.to_netcdf(tmp, encoding=encoding)
+            os.replace(tmp, out)
+        return xr.open_dataset(out, chunks={})
 
 class SIC25k(cwData):
     """ Class that handles sea ice concentration (SIC) data at 25 km resolution, inherited from cwData class.
@@ -130,7 +286,8 @@ class SIC25k(cwData):
         cwData (class): Base class for loading and processing ERDDAP data.
     """
     def __init__(self, id, varname, crs, 
-                 server="https://polarwatch.noaa.gov/erddap/griddap", shape=None):      
+                 server="https://polarwatch.noaa.gov/erddap/griddap", shape=None, cache_dir=None,
+                 window_shapes=None, raw=False, area_id=None, downloader=None, report=None, refresh_since=None):      
         """
         Initializes the SIC25k object, loads data, and optionally clips it to a shape if provided.
 
@@ -140,17 +297,23 @@ class SIC25k(cwData):
             crs (str): Coordinate reference system (EPSG code or Proj4 string).
             server (str, optional): ERDDAP server URL. Defaults to PolarWatch ERDDAP server.
             shape (gpd.GeoDataFrame, optional): Shape geometries projected to the data's CRS. Defaults to None.
+            cache_dir (str, optional): Directory of a local GridCache for the data and grid cell area. Defaults to None.
+            window_shapes (list or dict, optional): Shapes of all regions of interest; only their grid window
+                is transferred. Defaults to None (full grid).
+            raw (bool, optional): Keep byte-scaled uint8 values; decode with `decode`. Defaults to False.
+            area_id (str, optional): ERDDAP ID of the grid cell area. When set, the area is only loaded
+                if `regional_area` misses the area cache. Defaults to None.
+            downloader (GriddapDownloader, optional): Concurrent time-chunk downloader of the cache
+                syncs. Requires ``cache_dir``. Defaults to None.
+            report (RunReport, optional): Run report the stages are recorded in. Defaults to a new report.
+            refresh_since (str, optional): Refetch cached time partitions from this date on. Defaults to None.
         """
-        super().__init__(id, varname, crs, server)
         # self.grids = {'x': 'xgrid', 'y':'ygrid'}
-        self.grids = {'x': 'x', 'y':'y'}
         self.area = None
-
-        if shape is not None:
-            ds = self.load_data()
-            self.ds = clip_data(ds, shape)
-        else:       
-            self.ds = self.load_data()
+        self.area_id = area_id
+        super().__init__(id, varname, crs, server, grids={'x': 'x', 'y':'y'}, shape=shape, cache_dir=cache_dir,
+                         window_shapes=window_shapes, raw=raw, downloader=downloader, report=report,
+                         refresh_since=refresh_since)
 
     def has_area(self):
         if self.area is None: 
@@ -170,33 +333,43 @@ class SIC25k(cwData):
         Returns:
             float: Total area in square kilometers.
         """
+        return self.regional_area(shp).attrs['total_area_km2']
 
-        # If if area is loaded
-        if self.area is None:
-            raise ValueError("Grid cell area is not loaded")
-        try:    
-            # Select the first timestep
-            ds = self.ds.isel(time=0)
+    def regional_area(self, shp: gpd.GeoDataFrame) -> xr.Dataset:
+        """Returns the clipped grid cell area, valid-cell mask and total area of a region.
 
-            # Clip the dataset and area
-            ds, area = clip_data(ds, shp), clip_data(self.area, shp)
+        With ``cache_dir``, entries come from the `AreaCache`, so the grid cell area is only
+        fetched and clipped the first time a region is seen on this grid.
 
-            # Mask dataset where ds is valid (1 otherwise NaN)
-            ds = xr.where(ds.notnull(), 1, np.nan)
+        Args:
+            shp (gpd.GeoDataFrame): Shape geometries projected to the data's CRS.
 
-            # Perform element-wise multiplication
-            ice_ext = ds * self.area
-            ice_ext.name = 'area_km2'
+        Raises:
+            ValueError: If the entry is not cached and the grid cell area is not loaded.
 
-            # Sum over xgrid and ygrid, skipping Nan values
-            tot_area = ice_ext.sum(dim=["xgrid", "ygrid"], skipna = True).values 
-        
-            # Convert total area from m^2 to km^2
-            return tot_area / 1e6           
-            
-        except Exception as e:
-            print(f'Failed to load grid area and compute total area {e}')
+        Returns:
+            xr.Dataset: 'cell_area' (m^2) and 'valid_mask', with the 'total_area_km2' attribute.
+        """
+        key = AreaCache.make_key(shp, self.crs, self.ds[self.grids['x']].values,
+                                 self.ds[self.grids['y']].values, [self.id, self.area_id])
+        cache = AreaCache(self.cache_dir) if self.cache_dir is not None else None
+        entry = cache.get(key) if cache is not None else None
+        if entry is not None:
+            return entry
 
+        if self.area is None and self.area_id is not None:
+            self.load_area(self.area_id)
+        if self.area is None:
+            raise ValueError("Grid cell area is not loaded")
+
+        # Cells with a concentration on the first time step, i.e. not land, coast, lake or pole hole
+        with self.report.stage("clip"):
+            ds = clip_data(self.ds.isel(time=0), shp)
+            valid = (ds <= self.ds.attrs['valid_max']) if self.raw else ds.notnull()
+            entry = AreaCache.entry(clip_data(self.area, shp), valid, key)
+        if cache is not None:
+            cache.put(entry)
+        return entry
 
     def subset_dim(self, dates: list, shp: gpd.GeoDataFrame)-> Tuple[xr.Dataset, ...]:
         """Subsets the dataset by time range and optional shape geometry
@@ -210,9 +383,10 @@ class SIC25k(cwData):
             tuple: A tuple of (subset dataset, subset area).
         """
         ds = self.ds.sel(time=slice(dates[0], dates[1]))
-        if shp is not None and not shp.empty and self.area is not None:
-            ds, area = clip_data(ds, shp), clip_data(self.area, shp)
-            return (ds, area)
+        if shp is not None and not shp.empty and (self.area is not None or self.area_id is not None):
+            area = self.regional_area(shp)['cell_area']
+            with self.report.stage("clip"):
+                return (clip_data(ds, shp), area)
         else:
             return (ds, self.area)
         
@@ -226,8 +400,16 @@ class SIC25k(cwData):
 
         Returns:
             xr.Dataset: Binary sea ice concentration dataset (0 for below threshold, 1 for above).
+                In raw mode this is uint8, with 0 for flagged and missing cells.
         """
-        ds_transformed = xr.where(ds.isnull(), np.nan, xr.where(ds >= threshold, 1, 0))
+        with self.report.stage("threshold"):
+            if self.raw:
+                # Integer comparisons on the byte-scaled values; flagged and missing cells are 0
+                ice = (ds >= self.raw_threshold(threshold)) & (ds <= self.ds.attrs['valid_max'])
+                return ice.astype(np.uint8)
+
+            # One comparison and one mask, kept in float32 (NaN where the input is missing)
+            ds_transformed = (ds >= threshold).astype(np.float32).where(ds.notnull())
 
         return ds_transformed         
 
@@ -245,22 +427,50 @@ class SIC25k(cwData):
 
         if isinstance(ds, xr.Dataset):
             if len(ds.data_vars) == 1:
-                ds = ds[list(ds.datavars)[0]]
+                ds = ds[list(ds.data_vars)[0]]
             else:
                 raise TypeError(f"Input `ds` is a multi-variable xarray. Provide a DataArray or single variable dataset")
 
         # Multiply sea ice concentration data by grid cell area to compute extent
-        ice_cell = ds * area / 1e6 # Convert area to square km
-        if isinstance(ice_cell, xr.DataArray):
-            # Sum sea ice extent overxgrid and ygrid, group by time
-            ice_cell.name = 'seaice_extent'  
-            ice_ext = (ice_cell
-                    .groupby("time")
-                    .sum(dim=["x", "y"])) 
-            return ice_ext
-        
-        else:
-            raise TypeError(f"extent values should be in an xarray.DataArray {type(ice_cell)}")
+        with self.report.stage("reduce"):
+            ice_cell = ds * area / 1e6 # Convert area to square km
+            if isinstance(ice_cell, xr.DataArray):
+                # Sum sea ice extent over x and y for each time step
+                ice_cell.name = 'seaice_extent'  
+                ice_ext = ice_cell.sum(dim=["x", "y"])
+                return ice_ext
+
+        raise TypeError(f"extent values should be in an xarray.DataArray {type(ice_cell)}")
+
+    def extent_from_conc(self, ds: xr.DataArray, area: xr.DataArray, threshold=0.15) -> xr.DataArray:
+        """ Computes sea ice extent in square kilometers straight from sea ice concentration.
+
+        Equivalent to ``compute_extent_km(format_sic(ds, threshold), area)`` but fused: the
+        threshold and the area-weighted sum run block by block over time, without full-size
+        intermediate arrays, and the input may stay float32 (or uint8, with an integer threshold).
+
+        Args:
+            ds (xr.DataArray): Sea ice concentration on the grid of ``area``.
+            area (xr.DataArray): Grid cell area (m^2), NaN outside the region.
+            threshold (float): Threshold value for sea ice concentration (e.g., 0.15).
+
+        Returns:
+            xr.DataArray: Sea ice extent (km^2) per time step.
+        """
+        area = area.squeeze(drop=True).transpose("y", "x")
+        weights = np.nan_to_num(area.values.astype(np.float64) / 1e6).ravel()
+        cells = np.flatnonzero(weights)
+
+        with self.report.stage("reduce"):
+            ext = xr.apply_ufunc(
+                fused_extent, ds,
+                input_core_dims=[["y", "x"]], output_core_dims=[["region"]],
+                kwargs={"cells": cells, "weights": weights[cells, None], **self.kernel_threshold(threshold)},
+                dask="parallelized", output_dtypes=[np.float64],
+                dask_gufunc_kwargs={"output_sizes": {"region": 1}})
+        ext = ext.isel(region=0, drop=True)
+        ext.name = 'seaice_extent'
+        return ext
   
 
     def load_area(self, id: str):
@@ -273,9 +483,9 @@ class SIC25k(cwData):
         """
         try:
 
-            full_URL = '/'.join([self.server,id])
-
-            ds = xr.open_dataset(full_URL, chunks={"time":"auto"})
+            with self.report.stage("open"):
+                ds = self.open_source(id, 'cell_area')
+            self.area_id = id
             da = ds['cell_area']
             da.rio.set_spatial_dims(x_dim="x", y_dim="y", inplace=True)
             # da = da.rename({'x': 'xgrid', 'y': 'ygrid'}) #v3 of sic now use x and y instead of xgrid
@@ -288,13 +498,759 @@ class SIC25k(cwData):
                 self.area = clipped_area
 
         except Exception as e:
-            print(f"Error loading grid area data: {e}")
+            logger.exception("Error loading grid area data %s", id)
+            self.report.error(f"Error loading grid area data {id}: {e}")
             raise 
     
     def get_area(self):
         if self.has_area():
             return self.area()
-        
+
+    def build_region_index(self, shapes: Dict[str, gpd.GeoDataFrame], cache_dir: str = None,
+                           fractional: bool = False) -> "RegionIndex":
+        """Builds (or loads from cache) the sparse region-weight matrix for the loaded grid.
+
+        Args:
+            shapes (dict): Region name -> shape geometries, in the order the regions should be reported.
+            cache_dir (str, optional): Directory where the index is persisted. Defaults to None (no caching).
+            fractional (bool, optional): Weight boundary cells by their fractional coverage. Defaults to False.
+
+        Raises:
+            ValueError: If the grid cell area is not loaded.
+
+        Returns:
+            RegionIndex: Index over the grid of the loaded area.
+        """
+        if self.area is None:
+            raise ValueError("Grid cell area is not loaded")
+
+        if cache_dir is None:
+            return RegionIndex.build(shapes, self.area, fractional=fractional)
+        return RegionIndex.cached(shapes, self.area, cache_dir, fractional=fractional)
+
+    def compute_region_extents(self, dates: list, index: "RegionIndex", threshold=0.15) -> xr.DataArray:
+        """Computes sea ice extent (km^2) for every region of the index in one pass.
+
+        Args:
+            dates (list): List of two dates (start and end) in 'YYYY-MM-DD' format.
+            index (RegionIndex): Region index built on the same grid as the dataset.
+            threshold (float): Threshold value for sea ice concentration (e.g., 0.15).
+
+        Returns:
+            xr.DataArray: Sea ice extent with dimensions (time, region).
+        """
+        ds = self.ds.sel(time=slice(dates[0], dates[1]))
+        with self.report.stage("reduce"):
+            return index.extent(ds, **self.kernel_threshold(threshold))
+
+    def compute_region_metrics(self, dates: list, index: "RegionIndex",
+                               thresholds=(0.15, 0.3, 0.5, 0.8)) -> xr.DataArray:
+        """Computes, for every region of the index and in one pass over each time chunk, the sea ice
+        extent (km^2) at each threshold, the sea ice area (km^2) and the open-water fraction.
+
+        Args:
+            dates (list): List of two dates (start and end) in 'YYYY-MM-DD' format.
+            index (RegionIndex): Region index built on the same grid as the dataset.
+            thresholds (tuple): Sea ice concentration thresholds (0-1). Defaults to 15, 30, 50 and 80%.
+
+        Returns:
+            xr.DataArray: Metrics with dimensions (time, metric, region); see `metrics_frame`
+                for a (region, date) x metric table.
+        """
+        ds = self.ds.sel(time=slice(dates[0], dates[1]))
+        kwargs = {"thresholds": list(thresholds), "names": metric_names(thresholds)}
+        if self.raw:
+            kwargs.update(thresholds=[self.raw_threshold(t) for t in thresholds],
+                          valid_max=self.ds.attrs['valid_max'], scale=self.ds.attrs['scale_factor'])
+        with self.report.stage("reduce"):
+            return index.metrics(ds, **kwargs)
+
+    def iter_region_extents(self, windows: list, index: "RegionIndex", threshold=0.15, prefetch: int = 2):
+        """Computes sea ice extent (km^2) for every region of the index, one time window at a time,
+        reading the next windows in the background (see `Prefetcher`) while the current one is reduced.
+
+        Args:
+            windows (list): (start, end) time windows, dates in 'YYYY-MM-DD' format.
+            index (RegionIndex): Region index built on the same grid as the dataset.
+            threshold (float): Threshold value for sea ice concentration (e.g., 0.15).
+            prefetch (int, optional): Windows read ahead. Defaults to 2.
+
+        Yields:
+            tuple: The window and its sea ice extent with dimensions (time, region), in window order.
+        """
+        kwargs = self.kernel_threshold(threshold)
+        for window, block in Prefetcher(self.ds, windows, depth=prefetch, report=self.report):
+            with self.report.stage("reduce"):
+                ext = index.extent(block, **kwargs).load()
+            yield window, ext
+
+    def run_extent_jobs(self, jobs: list, index: "RegionIndex", threshold=0.15, workers: int = None,
+                        memory_budget="2GB", client=None) -> list:
+        """Computes sea ice extent (km^2) for (region, time window) jobs in parallel, see `ExtentEngine`.
+
+        Args:
+            jobs (list): (region, (start, end)) tuples, dates in 'YYYY-MM-DD' format.
+            index (RegionIndex): Region index built on the same grid as the dataset.
+            threshold (float): Threshold value for sea ice concentration (e.g., 0.15).
+            workers (int, optional): Worker processes. Defaults to the number of CPUs.
+            memory_budget (int or str, optional): Memory for the blocks in flight. Defaults to '2GB'.
+            client (dask.distributed.Client, optional): Dask cluster to run on. Defaults to None (process pool).
+
+        Returns:
+            list: Sea ice extent of each job (DataArray over time), in job order.
+        """
+        with self.report.stage("reduce"):
+            engine = ExtentEngine(self.ds, index, workers=workers, memory_budget=memory_budget, client=client,
+                                  **self.kernel_threshold(threshold))
+            return engine.run(jobs)
+
+    def kernel_threshold(self, threshold=0.15) -> dict:
+        """Threshold arguments of `fused_extent` for the loaded representation (float or raw)."""
+        if self.raw:
+            return {"threshold": self.raw_threshold(threshold), "valid_max": self.ds.attrs['valid_max']}
+        return {"threshold": threshold}
+
+
+class RegionIndex:
+    """Sparse (regions x grid cells) matrix of grid cell area weights.
+
+    The non-zero entries are stored CSR-style: the cells of region ``i`` are
+    ``cell_idx[ptr[i]:ptr[i+1]]`` (flat indices into the ``(y, x)`` grid) and
+    their weights, in square kilometers, are ``weights[ptr[i]:ptr[i+1]]``.
+    Sea ice extent for all regions and time steps is then a single sparse
+    matrix-vector product over the flattened grid, with no geometry work.
+    """
+
+    def __init__(self, names: list, ptr: np.ndarray, cell_idx: np.ndarray, weights: np.ndarray,
+                 x: np.ndarray, y: np.ndarray, key: str = None):
+        """
+        Args:
+            names (list): Region names (matrix rows).
+            ptr (np.ndarray): Row pointers, of length ``len(names) + 1``.
+            cell_idx (np.ndarray): Flat grid cell index of each non-zero entry.
+            weights (np.ndarray): Area weight (km^2) of each non-zero entry.
+            x (np.ndarray): x coordinates of the grid.
+            y (np.ndarray): y coordinates of the grid.
+            key (str, optional): Hash of the shapes and grid the index was built from.
+        """
+        self.names = list(names)
+        self.ptr = np.asarray(ptr, dtype=np.int64)
+        self.cell_idx = np.asarray(cell_idx, dtype=np.int64)
+        self.weights = np.asarray(weights, dtype=np.float64)
+        self.x = np.asarray(x)
+        self.y = np.asarray(y)
+        self.key = key
+
+        # Same matrix as (distinct cells x regions), the form the fused kernel consumes
+        self.cells, self.matrix = region_matrix(self.ptr, self.cell_idx, self.weights)
+
+    def __str__(self):
+        return (f"RegionIndex:\nregions={self.names}\n, grid=({len(self.y)}, {len(self.x)})\n, "
+                f"cells={np.diff(self.ptr).tolist()}\n, key={self.key}")
+
+    @staticmethod
+    def make_key(shapes: Dict[str, gpd.GeoDataFrame], area: xr.DataArray,
+                 fractional: bool = False, supersample: int = 4) -> str:
+        """Hashes the region geometries and the grid (coordinates, CRS and cell areas).
+
+        Args:
+            shapes (dict): Region name -> shape geometries.
+            area (xr.DataArray): Grid cell area (m^2) with spatial dims set.
+            fractional (bool, optional): Whether fractional coverage is used.
+            supersample (int, optional): Subcells per axis used for fractional coverage.
+
+        Returns:
+            str: Hex digest identifying the index.
+        """
+        crs = area.rio.crs
+        h = hashlib.sha256()
+        for name, shp in shapes.items():
+            h.update(name.encode())
+            for geom in shp.to_crs(crs).geometry:
+                h.update(geom.wkb)
+        h.update(str(crs).encode())
+        h.update(np.ascontiguousarray(area[area.rio.x_dim].values, dtype=np.float64).tobytes())
+        h.update(np.ascontiguousarray(area[area.rio.y_dim].values, dtype=np.float64).tobytes())
+        h.update(np.ascontiguousarray(area.values, dtype=np.float64).tobytes())
+        h.update(f"{fractional}:{supersample}".encode())
+        return h.hexdigest()
+
+    @classmethod
+    def build(cls, shapes: Dict[str, gpd.GeoDataFrame], area: xr.DataArray,
+              fractional: bool = False, supersample: int = 4) -> "RegionIndex":
+        """Rasterizes each region once onto the area grid.
+
+        Cells are selected the same way ``rio.clip`` selects them (cell center inside
+        the polygon), so extents match the clip-based computation. With ``fractional``,
+        each cell is instead weighted by the share of its ``supersample x supersample``
+        subcells that fall inside the polygon.
+
+        Args:
+            shapes (dict): Region name -> shape geometries.
+            area (xr.DataArray): Grid cell area (m^2) with spatial dims and CRS set.
+            fractional (bool, optional): Weight cells by fractional coverage. Defaults to False.
+            supersample (int, optional): Subcells per axis for fractional coverage. Defaults to 4.
+
+        Returns:
+            RegionIndex: The region index.
+        """
+        area = area.squeeze(drop=True)
+        x_dim, y_dim = area.rio.x_dim, area.rio.y_dim
+        area = area.transpose(y_dim, x_dim)
+        crs = area.rio.crs
+        transform = area.rio.transform()
+        out_shape = area.shape
+        cell_km2 = np.nan_to_num(area.values.astype(np.float64) / 1e6).ravel()
+
+        ptr, cell_idx, weights = [0], [], []
+        for name, shp in shapes.items():
+            geoms = list(shp.to_crs(crs).geometry.apply(mapping))
+            if fractional:
+                fine = rasterio.features.geometry_mask(
+                    geoms, (out_shape[0] * supersample, out_shape[1] * supersample),
+                    transform * Affine.scale(1 / supersample), invert=True)
+                cover = fine.reshape(out_shape[0], supersample, out_shape[1], supersample).mean(axis=(1, 3))
+            else:
+                cover = rasterio.features.geometry_mask(geoms, out_shape, transform, invert=True)
+            w = cover.ravel() * cell_km2
+            idx = np.flatnonzero(w > 0)
+            cell_idx.append(idx)
+            weights.append(w[idx])
+            ptr.append(ptr[-1] + len(idx))
+
+        return cls(list(shapes), ptr, np.concatenate(cell_idx), np.concatenate(weights),
+                   area[x_dim].values, area[y_dim].values,
+                   key=cls.make_key(shapes, area, fractional, supersample))
+
+    @classmethod
+    def from_areas(cls, areas: Dict[str, xr.DataArray]) -> "RegionIndex":
+        """Builds the index from clipped per-region grid cell areas, without any geometry.
+
+        Each region's cells are those with a non-missing area, e.g. in the ``area_{name}.nc``
+        files written by compute_regional_area.py, so extents match a clip-based computation
+        with those files. The index grid is the window of the grid spanning all regions.
+
+        Args:
+            areas (dict): Region name -> clipped grid cell area (m^2), NaN outside the region.
+
+        Returns:
+            RegionIndex: The region index.
+        """
+        areas = {name: a.squeeze(drop=True).rename({d: d[0] for d in a.dims if d in ("xgrid", "ygrid")})
+                 for name, a in areas.items()}
+        xs = np.unique(np.concatenate([a["x"].values for a in areas.values()]))
+        ys = np.unique(np.concatenate([a["y"].values for a in areas.values()]))
+        step = min(np.diff(xs).min(), np.diff(ys).min())
+        x = xs[0] + step * np.arange(round((xs[-1] - xs[0]) / step) + 1)
+        y = ys[-1] - step * np.arange(round((ys[-1] - ys[0]) / step) + 1)
+
+        h = hashlib.sha256()
+        ptr, cell_idx, weights = [0], [], []
+        for name, a in areas.items():
+            a = a.transpose("y", "x").reindex(x=x, y=y, method="nearest", tolerance=step / 4)
+            w = np.nan_to_num(a.values.astype(np.float64) / 1e6).ravel()
+            idx = np.flatnonzero(w > 0)
+            cell_idx.append(idx)
+            weights.append(w[idx])
+            ptr.append(ptr[-1] + len(idx))
+            h.update(name.encode())
+            h.update(idx.tobytes())
+            h.update(w[idx].tobytes())
+        h.update(x.tobytes())
+        h.update(y.tobytes())
+        return cls(list(areas), ptr, np.concatenate(cell_idx), np.concatenate(weights), x, y, key=h.hexdigest())
+
+    @classmethod
+    def cached(cls, shapes: Dict[str, gpd.GeoDataFrame], area: xr.DataArray, cache_dir: str,
+               fractional: bool = False, supersample: int = 4) -> "RegionIndex":
+        """Loads the index for these shapes and grid from ``cache_dir``, building it on a miss.
+
+        Args:
+            shapes (dict): Region name -> shape geometries.
+            area (xr.DataArray): Grid cell area (m^2) with spatial dims and CRS set.
+            cache_dir (str): Directory holding persisted indexes.
+            fractional (bool, optional): Weight cells by fractional coverage. Defaults to False.
+            supersample (int, optional): Subcells per axis for fractional coverage. Defaults to 4.
+
+        Returns:
+            RegionIndex: The region index.
+        """
+        key = cls.make_key(shapes, area.squeeze(drop=True), fractional, supersample)
+        path = os.path.join(cache_dir, f"region_index_{key[:16]}.npz")
+        if os.path.exists(path):
+            index = cls.load(path)
+            if index.key == key:
+                return index
+
+        index = cls.build(shapes, area, fractional, supersample)
+        os.makedirs(cache_dir, exist_ok=True)
+        index.save(path)
+        return index
+
+    def save(self, path: str):
+        """Writes the index to a compressed ``.npz`` file."""
+        np.savez_compressed(path, names=np.array(self.names), ptr=self.ptr, cell_idx=self.cell_idx,
+                            weights=self.weights, x=self.x, y=self.y, key=np.array(self.key or ""))
+
+    @classmethod
+    def load(cls, path: str) -> "RegionIndex":
+        """Reads an index written by ``save``."""
+        index = load_region_index(path)
+        return cls(index["names"], index["ptr"], index["cell_idx"], index["weights"],
+                   index["x"], index["y"], key=index["key"])
+
+    def extent(self, ds: xr.DataArray, threshold=0.15, valid_max=None) -> xr.DataArray:
+        """Computes sea ice extent (km^2) of every region from sea ice concentration.
+
+        Works lazily on dask-backed data, one time chunk at a time.
+
+        Args:
+            ds (xr.DataArray): Sea ice concentration on the grid of the index, with a time dimension.
+            threshold (float): Threshold value for sea ice concentration (e.g., 0.15), in the units of ``ds``.
+            valid_max (optional): Values above it are flags, not ice (byte-scaled data). Defaults to None.
+
+        Raises:
+            ValueError: If the data grid does not match the grid of the index.
+
+        Returns:
+            xr.DataArray: Sea ice extent with dimensions (time, region).
+        """
+        x_dim, y_dim = ds.rio.x_dim, ds.rio.y_dim
+        if ds.sizes[x_dim] != len(self.x) or ds.sizes[y_dim] != len(self.y):
+            raise ValueError(f"Data grid ({ds.sizes[y_dim]}, {ds.sizes[x_dim]}) does not match "
+                             f"region index grid ({len(self.y)}, {len(self.x)})")
+
+        ext = xr.apply_ufunc(
+            fused_extent, ds,
+            input_core_dims=[[y_dim, x_dim]], output_core_dims=[["region"]],
+            kwargs={"cells": self.cells, "weights": self.matrix, "threshold": threshold,
+                    "valid_max": valid_max},
+            dask="parallelized", output_dtypes=[np.float64],
+            dask_gufunc_kwargs={"output_sizes": {"region": len(self.names)}})
+        ext = ext.assign_coords(region=self.names)
+        ext.name = 'seaice_extent'
+        return ext
+
+    def metrics(self, ds: xr.DataArray, thresholds, valid_max=None, scale: float = 1.0,
+                names: list = None) -> xr.DataArray:
+        """Computes extents at several thresholds, ice area and open-water fraction of every region
+        in one pass over the data (see `fused_metrics`).
+
+        Works lazily on dask-backed data, one time chunk at a time.
+
+        Args:
+            ds (xr.DataArray): Sea ice concentration on the grid of the index, with a time dimension.
+            thresholds (list): Concentration thresholds, in the units of ``ds``.
+            valid_max (optional): Values above it are flags, not data (byte-scaled data). Defaults to None.
+            scale (float, optional): Concentration (0-1) per unit of ``ds``. Defaults to 1.
+            names (list, optional): Metric names. Defaults to `metric_names` of ``thresholds``.
+
+        Raises:
+            ValueError: If the data grid does not match the grid of the index.
+
+        Returns:
+            xr.DataArray: Metrics with dimensions (time, metric, region).
+        """
+        x_dim, y_dim = ds.rio.x_dim, ds.rio.y_dim
+        if ds.sizes[x_dim] != len(self.x) or ds.sizes[y_dim] != len(self.y):
+            raise ValueError(f"Data grid ({ds.sizes[y_dim]}, {ds.sizes[x_dim]}) does not match "
+                             f"region index grid ({len(self.y)}, {len(self.x)})")
+
+        names = names or metric_names(thresholds)
+        metrics = xr.apply_ufunc(
+            fused_metrics, ds,
+            input_core_dims=[[y_dim, x_dim]], output_core_dims=[["metric", "region"]],
+            kwargs={"cells": self.cells, "weights": self.matrix, "thresholds": list(thresholds),
+                    "valid_max": valid_max, "scale": scale},
+            dask="parallelized", output_dtypes=[np.float64],
+            dask_gufunc_kwargs={"output_sizes": {"metric": len(names), "region": len(self.names)}})
+        metrics = metrics.assign_coords(metric=names, region=self.names)
+        metrics.name = 'seaice_metrics'
+        return metrics
+
+
+class BaselineAccumulator:
+    """Streaming mean and standard deviation of daily extent per (month, day) and region.
+
+    Keeps Welford-style running state (count, mean, sum of squared deviations)
+    for the 366 calendar days of every region, so memory does not depend on the
+    length of the baseline period. Daily extents are consumed chunk by chunk and
+    partial states (e.g., computed in parallel over years) are combined with
+    ``merge``. Labels of the consumed chunks are recorded so a saved state can be
+    extended with new years without a full recompute.
+    """
+
+    def __init__(self, regions: list):
+        """
+        Args:
+            regions (list): Region names, in the order of the extent ``region`` dimension.
+        """
+        self.regions = list(regions)
+        shape = (len(self.regions), len(CALENDAR))
+        self.count = np.zeros(shape)
+        self.mean = np.zeros(shape)
+        self.m2 = np.zeros(shape)
+        self.labels = []
+
+    def __str__(self):
+        return (f"BaselineAccumulator:\nregions={self.regions}\n, labels={self.labels}\n, "
+                f"days={int((self.count > 0).any(axis=0).sum())}")
+
+    def update(self, ext: xr.DataArray, label: str = None):
+        """Adds a chunk of daily extents.
+
+        Args:
+            ext (xr.DataArray): Sea ice extent with dimensions (time, region). NaNs are skipped.
+            label (str, optional): Name of the chunk (e.g., the year), recorded in ``labels``.
+        """
+        ext = ext.transpose("time", "region").sel(region=self.regions)
+        values = np.asarray(ext.values, dtype=np.float64)
+        slot = day_slot(ext["time"].values)
+
+        valid = ~np.isnan(values)
+        shape = self.count.shape[::-1]
+        count, total = np.zeros(shape), np.zeros(shape)
+        np.add.at(count, slot, valid)
+        np.add.at(total, slot, np.where(valid, values, 0))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = np.where(count > 0, total / count, 0)
+        m2 = np.zeros(shape)
+        np.add.at(m2, slot, np.where(valid, values - mean[slot], 0) ** 2)
+
+        self._combine(count.T, mean.T, m2.T)
+        if label is not None:
+            self.labels.append(str(label))
+
+    def merge(self, other: "BaselineAccumulator") -> "BaselineAccumulator":
+        """Combines another partial state into this one (Chan et al. parallel update).
+
+        Args:
+            other (BaselineAccumulator): State over the same regions.
+
+        Raises:
+            ValueError: If the regions differ or the same chunk label was consumed twice.
+
+        Returns:
+            BaselineAccumulator: This accumulator.
+        """
+        if other.regions != self.regions:
+            raise ValueError(f"Cannot merge states over different regions {other.regions}")
+        overlap = set(self.labels) & set(other.labels)
+        if overlap:
+            raise ValueError(f"Chunks already consumed: {sorted(overlap)}")
+
+        self._combine(other.count, other.mean, other.m2)
+        self.labels.extend(other.labels)
+        return self
+
+    def _combine(self, count: np.ndarray, mean: np.ndarray, m2: np.ndarray):
+        n = self.count + count
+        delta = mean - self.mean
+        with np.errstate(invalid="ignore", divide="ignore"):
+            self.mean = np.where(n > 0, self.mean + delta * count / n, 0)
+            self.m2 = np.where(n > 0, self.m2 + m2 + delta ** 2 * self.count * count / n, 0)
+        self.count = n
+
+    def to_frame(self, region: str) -> pd.DataFrame:
+        """Returns the baseline statistics of one region in the ``bs_extent_*.csv`` layout.
+
+        Args:
+            region (str): Region name.
+
+        Returns:
+            pd.DataFrame: Columns month, day, seaice_extent_mean, seaice_extent_std, month_day.
+        """
+        i = self.regions.index(region)
+        n, mean, m2 = self.count[i], self.mean[i], self.m2[i]
+        has = n > 0
+        with np.errstate(invalid="ignore", divide="ignore"):
+            # Sample standard deviation (ddof=1), as pandas computes it
+            std = np.where(n > 1, np.sqrt(m2 / (n - 1)), np.nan)
+
+        stats = pd.DataFrame({'month': CALENDAR.month[has],
+                              'day': CALENDAR.day[has],
+                              'seaice_extent_mean': mean[has],
+                              'seaice_extent_std': std[has]}).round(2)
+        stats['month_day'] = CALENDAR[has].strftime("%m-%d")
+        return stats
+
+    def save(self, path: str):
+        """Writes the state to a ``.npz`` file."""
+        np.savez(path, regions=np.array(self.regions), count=self.count, mean=self.mean,
+                 m2=self.m2, labels=np.array(self.labels, dtype=str))
+
+    @classmethod
+    def load(cls, path: str) -> "BaselineAccumulator":
+        """Reads a state written by ``save``."""
+        with np.load(path) as f:
+            acc = cls(f["regions"].tolist())
+            acc.count, acc.mean, acc.m2 = f["count"], f["mean"], f["m2"]
+            acc.labels = f["labels"].tolist()
+        return acc
+
+
+class GridCache:
+    """Local, time-partitioned NetCDF copy of an ERDDAP griddap dataset.
+
+    Each calendar year is one compressed NetCDF file chunked along time,
+    ``{root}/{id}/{varname}_{year}.nc``; datasets without a time dimension
+    (e.g., grid cell area) are a single ``{varname}.nc``. A JSON manifest
+    records the time steps held by each partition, so ``sync`` only transfers
+    time steps the local copy does not have yet, and refetches a partition
+    only when the source dropped or replaced time steps in it.
+    """
+
+    def __init__(self, root: str, server: str, id: str, varname: str, time_chunk: int = 31,
+                 window: dict = None, downloader: GriddapDownloader = None, report: RunReport = None):
+        """
+        Args:
+            root (str): Cache root directory.
+            server (str): The base URL of the ERDDAP server (or a local directory standing in for it).
+            id (str): PolarWatch ERDDAP dataset ID.
+            varname (str): Variable to cache.
+            time_chunk (int, optional): Time steps per NetCDF chunk. Defaults to 31.
+            window (dict, optional): Dimension -> index slice; only this grid window is cached. Defaults to None.
+            downloader (GriddapDownloader, optional): Transfers time steps with concurrent griddap requests
+                instead of OPeNDAP reads. Defaults to None.
+            report (RunReport, optional): Run report the transferred bytes are recorded in. Defaults to None.
+        """
+        self.server = server
+        self.id = id
+        self.varname = varname
+        self.time_chunk = time_chunk
+        self.window = window
+        self.downloader = downloader
+        self.report = report
+        if window is None:
+            self.path = os.path.join(root, id)
+        else:
+            tag = "_".join(f"{d}{sl.start}-{sl.stop}" for d, sl in sorted(window.items()))
+            self.path = os.path.join(root, f"{id}_{tag}")
+        self.manifest_path = os.path.join(self.path, f"{varname}_manifest.json")
+
+    def __str__(self):
+        return (f"GridCache:\nid={self.id}\n, varname={self.varname}\n, server={self.server}\n, "
+                f"path={self.path}\n, partitions={sorted(self.read_manifest())}")
+
+    def read_manifest(self) -> dict:
+        """Returns the manifest: partition name -> list of ISO time stamps."""
+        if not os.path.exists(self.manifest_path):
+            return {}
+        with open(self.manifest_path) as f:
+            return json.load(f)
+
+    def _write_manifest(self, manifest: dict):
+        tmp = self.manifest_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(manifest, f)
+        os.replace(tmp, self.manifest_path)
+
+    def partition_path(self, name: str) -> str:
+        return os.path.join(self.path, f"{self.varname}_{name}.nc")
+
+    def open_remote(self) -> xr.Dataset:
+        """Opens the source dataset lazily (no data are transferred)."""
+        full_URL = '/'.join([self.server, self.id])
+        ds = xr.open_dataset(full_URL)
+        return ds if self.window is None else ds.isel(self.window)
+
+    def sync(self, start: str = None, end: str = None, refresh_since: str = None) -> list:
+        """Brings the local copy up to date with the source.
+
+        Args:
+            start (str, optional): First date to sync ('YYYY-MM-DD'). Defaults to the start of the source.
+            end (str, optional): Last date to sync ('YYYY-MM-DD'). Defaults to the end of the source.
+            refresh_since (str, optional): Refetch every partition from this date on, e.g. after a
+                reprocessing of the source. Defaults to None.
+
+        Returns:
+            list: Names of the partitions that were written.
+        """
+        os.makedirs(self.path, exist_ok=True)
+        manifest = self.read_manifest()
+        if "static" in manifest and os.path.exists(self.partition_path("static")):
+            return []
+        src = self.open_remote()[[self.varname]]
+
+        if "time" not in src.dims:
+            self._write_partition("static", self.transfer(src))
+            manifest["static"] = []
+            self._write_manifest(manifest)
+            return ["static"]
+
+        times = pd.DatetimeIndex(src["time"].values)
+        keep = np.ones(len(times), dtype=bool)
+        if start is not None:
+            keep &= times >= pd.Timestamp(start)
+        if end is not None:
+            keep &= times <= pd.Timestamp(end)
+
+        written = []
+        for year in np.unique(times[keep].year):
+            name = str(year)
+            wanted = times[keep & (times.year == year)]
+            cached = pd.DatetimeIndex(manifest.get(name, []))
+            exists = os.path.exists(self.partition_path(name))
+            refresh = (refresh_since is not None and wanted.max() >= pd.Timestamp(refresh_since))
+
+            missing = wanted.difference(cached)
+            if exists and not refresh and missing.empty:
+                continue
+
+            if exists and not refresh and cached.difference(times).empty:
+                # Only new time steps: fetch those and append them to the partition
+                new = self.transfer(src, missing)
+                with xr.open_dataset(self.partition_path(name)) as old:
+                    ds = xr.concat([old.load(), new], dim="time").sortby("time")
+            else:
+                ds = self.transfer(src, wanted)
+
+            self._write_partition(name, ds)
+            manifest[name] = [t.isoformat() for t in pd.DatetimeIndex(ds["time"].values)]
+            self._write_manifest(manifest)
+            written.append(name)
+
+        return written
+
+    def transfer(self, src: xr.Dataset, times: pd.DatetimeIndex = None) -> xr.Dataset:
+        """Loads time steps of the (lazily opened) source, with the downloader when one is set."""
+        if self.downloader is None:
+            ds = src.load() if times is None else src.sel(time=times).load()
+            if self.report is not None:
+                self.report.add_bytes(self.id, ds.nbytes)
+            return ds
+        y_dim, x_dim = src[self.varname].dims[-2:]
+        return self.downloader.fetch(self.id, self.varname, src[x_dim].values, src[y_dim].values, times)
+
+    def _write_partition(self, name: str, ds: xr.Dataset):
+        """Writes a partition atomically as compressed, time-chunked NetCDF."""
+        da = ds[self.varname]
+        encoding = {k: v for k, v in da.encoding.items()
+                    if k in ("dtype", "scale_factor", "add_offset", "_FillValue")}
+        encoding["zlib"] = True
+        encoding["complevel"] = 4
+        if "time" in da.dims:
+            encoding["chunksizes"] = tuple(min(self.time_chunk, n) if d == "time" else n
+                                           for d, n in zip(da.dims, da.shape))
+
+        path = self.partition_path(name)
+        tmp = path + ".tmp"
+        ds.to_netcdf(tmp, encoding={self.varname: encoding})
+        os.replace(tmp, path)
+
+    def open(self, start: str = None, end: str = None, **kwargs) -> xr.Dataset:
+        """Opens the local copy lazily, chunked by the on-disk time chunks.
+
+        Args:
+            start (str, optional): First date to include. Defaults to None.
+            end (str, optional): Last date to include. Defaults to None.
+            **kwargs: Passed to ``xr.open_dataset`` (e.g., ``mask_and_scale=False``).
+
+        Raises:
+            FileNotFoundError: If nothing has been synced yet.
+
+        Returns:
+            xarray.Dataset: The cached dataset.
+        """
+        manifest = self.read_manifest()
+        if not manifest:
+            raise FileNotFoundError(f"No cached data for {self.id} in {self.path}")
+        if "static" in manifest:
+            return xr.open_dataset(self.partition_path("static"), **kwargs)
+
+        names = sorted(manifest)
+        if start is not None:
+            names = [n for n in names if int(n) >= pd.Timestamp(start).year]
+        if end is not None:
+            names = [n for n in names if int(n) <= pd.Timestamp(end).year]
+
+        ds = xr.open_mfdataset([self.partition_path(n) for n in names], combine="by_coords",
+                               chunks={"time": self.time_chunk}, **kwargs)
+        if start is not None or end is not None:
+            ds = ds.sel(time=slice(start, end))
+        return ds
+
+
+class AreaCache:
+    """Content-addressed cache of the grid cell area of regions.
+
+    An entry holds a region's clipped cell area (m^2), the mask of cells that carry
+    concentrations (not land, coast, lake or pole hole) and their total area (km^2),
+    in ``{root}/region_area/{key[:16]}.nc``. The key hashes the region geometries, the CRS,
+    the grid coordinates and the dataset IDs, so a changed shapefile, grid window or
+    dataset maps to a new entry rather than a stale one.
+    """
+
+    def __init__(self, root: str):
+        """
+        Args:
+            root (str): Cache root directory.
+        """
+        self.path = os.path.join(root, "region_area")
+
+    def __str__(self):
+        entries = sorted(os.listdir(self.path)) if os.path.isdir(self.path) else []
+        return f"AreaCache:\npath={self.path}\n, entries={entries}"
+
+    @staticmethod
+    def make_key(shp: gpd.GeoDataFrame, crs: str, x: np.ndarray, y: np.ndarray, ids: list) -> str:
+        """Hashes the region geometries, the grid (CRS and coordinates) and the dataset IDs.
+
+        Args:
+            shp (gpd.GeoDataFrame): Shape geometries of the region.
+            crs (str): CRS of the grid.
+            x (np.ndarray): x coordinates of the grid.
+            y (np.ndarray): y coordinates of the grid.
+            ids (list): Dataset IDs the entry is derived from (concentration, area).
+
+        Returns:
+            str: Hex digest identifying the entry.
+        """
+        h = hashlib.sha256()
+        for geom in shp.to_crs(crs).geometry:
+            h.update(geom.wkb)
+        h.update(str(crs).encode())
+        h.update(np.ascontiguousarray(x, dtype=np.float64).tobytes())
+        h.update(np.ascontiguousarray(y, dtype=np.float64).tobytes())
+        h.update("|".join(str(i) for i in ids).encode())
+        return h.hexdigest()
+
+    @staticmethod
+    def entry(area: xr.DataArray, valid: xr.DataArray, key: str) -> xr.Dataset:
+        """Builds an entry from the clipped cell area (m^2) and the valid-cell mask."""
+        valid = valid.astype(bool).drop_vars([c for c in valid.coords if c not in valid.dims])
+        total = float(area.where(valid).sum(skipna=True)) / 1e6
+        area = area.rename("cell_area")
+        return xr.Dataset({"cell_area": area, "valid_mask": valid},
+                          attrs={"total_area_km2": total, "key": key})
+
+    def entry_path(self, key: str) -> str:
+        return os.path.join(self.path, f"{key[:16]}.nc")
+
+    def get(self, key: str) -> xr.Dataset:
+        """Returns the cached entry for ``key``, or None on a miss."""
+        path = self.entry_path(key)
+        if not os.path.exists(path):
+            return None
+        with xr.open_dataset(path, decode_coords="all") as ds:
+            entry = ds.load()
+        if entry.attrs.get("key") != key:
+            return None
+        entry["valid_mask"] = entry["valid_mask"].astype(bool)
+        return entry
+
+    def put(self, entry: xr.Dataset):
+        """Writes an entry atomically."""
+        os.makedirs(self.path, exist_ok=True)
+        path = self.entry_path(entry.attrs["key"])
+        tmp = path + ".tmp"
+        ds = entry.assign(valid_mask=entry["valid_mask"].astype(np.uint8))
+        ds = ds.rio.write_crs(entry["cell_area"].rio.crs)
+        for v in ds.data_vars:
+            ds[v].attrs["grid_mapping"] = "spatial_ref"
+        ds.to_netcdf(tmp, encoding={v: {"zlib": True} for v in ds.data_vars})
+        os.replace(tmp, path)
+
 
 ## Helper Functions
 
@@ -306,14 +1262,254 @@ def clip_data(ds: xr.DataArray, shape:gpd.GeoDataFrame)-> xr.Dataset:
     """
 
     if shape.crs != ds.rio.crs:
-        print("Shape CRS does not match data CRS. Performing CRS transformation")
+        logger.info("Shape CRS does not match data CRS. Performing CRS transformation")
         shape = shape.to_crs(ds.rio.crs)
 
     clipped_ds = ds.rio.clip(shape.geometry.apply(mapping), shape.crs)
     return clipped_ds
 
 
-     
+def pack_conc(da: xr.DataArray, scale: float = 0.01, fill: int = 255) -> xr.DataArray:
+    """Returns sea ice concentration in its byte-scaled uint8 form.
+
+    Packed integer data (opened with ``mask_and_scale=False``) are kept as they are; signed
+    bytes are reinterpreted as unsigned. Float data are packed as ``round(value / scale)``
+    with ``fill`` for missing cells. The result carries ``scale_factor``, ``valid_max``
+    (largest concentration value, e.g. 100) and ``flag_values`` attributes; values above
+    ``valid_max`` are flags (land, coast, lake, pole hole, missing).
 
+    Args:
+        da (xr.DataArray): Sea ice concentration, packed or decoded.
+        scale (float, optional): Scale used to pack float data. Defaults to 0.01.
+        fill (int, optional): Value for missing cells when packing float data. Defaults to 255.
+
+    Returns:
+        xr.DataArray: uint8 data with the packing attributes.
+    """
+    attrs = dict(da.attrs)
+    if np.issubdtype(da.dtype, np.integer):
+        scale = float(attrs.get('scale_factor', 1.0))
+        packed = da.astype(np.uint8)
+    else:
+        packed = xr.where(da.isnull(), fill, np.clip(np.round(da / scale), 0, 255)).astype(np.uint8)
 
+    if 'valid_range' in attrs:
+        valid_max = int(np.asarray(attrs['valid_range'])[-1])
+    else:
+        valid_max = int(attrs.get('valid_max', round(1 / scale)))
+    flags = attrs.get('flag_values', np.arange(valid_max + 1, 256))
+
+    packed.attrs = {k: v for k, v in attrs.items()
+                    if k not in ('scale_factor', 'add_offset', '_FillValue', 'missing_value',
+                                 'valid_range', 'valid_min', 'valid_max', '_Unsigned')}
+    packed.attrs.update(scale_factor=scale, valid_max=valid_max,
+                        flag_values=np.asarray(flags).astype(np.uint8))
+    return packed
+
+
+def read_regions(regions: Dict[str, str], resource_dir: str, crs: str) -> Dict[str, gpd.GeoDataFrame]:
+    """Reads regional shapefiles and projects them to the data CRS.
+
+    Args:
+        regions (dict): Region name -> shapefile name.
+        resource_dir (str): Directory holding the shapefiles.
+        crs (str): Coordinate reference system of the data.
+
+    Returns:
+        dict: Region name -> projected shape geometries.
+    """
+    return {name: gpd.read_file(os.path.join(resource_dir, shp)).to_crs(crs)
+            for name, shp in regions.items()}
+
+
+def clim_bins(times, frequency: str) -> tuple:
+    """Assigns time steps to climatology bins, by their position in the year.
+
+    - '15D': 15-day periods of the year (days 1-15 are period 1; the last period is short)
+    - 'W': 7-day weeks of the year (days 1-7 are week 1)
+    - 'D': calendar days (month-day, Feb 29 has its own bin)
+    - 'M': months
+    - 'Q': quarters
+
+    Args:
+        times (array-like): Time stamps.
+        frequency (str): One of '15D', 'W', 'D', 'M', 'Q'.
+
+    Raises:
+        ValueError: If the frequency is not valid.
+
+    Returns:
+        tuple: Bin index of each time step, bin labels, and the name of the bin dimension.
+    """
+    times = pd.DatetimeIndex(times)
+    if frequency == "15D":
+        return (times.dayofyear.values - 1) // 15, np.arange(1, 26), "period"
+    if frequency == "W":
+        return (times.dayofyear.values - 1) // 7, np.arange(1, 54), "week"
+    if frequency == "D":
+        return day_slot(times), CALENDAR.strftime("%m-%d").values, "month_day"
+    if frequency == "M":
+        return times.month.values - 1, np.arange(1, 13), "month"
+    if frequency == "Q":
+        return times.quarter.values - 1, np.arange(1, 5), "quarter"
+    raise ValueError("Frequency should be one of ['15D', 'W', 'D', 'M', 'Q']")
 
+
+def _bin_sums(values: np.ndarray, bins: np.ndarray, nbins: int) -> np.ndarray:
+    """Per-bin sum and count of valid values of a (time, ...) block: shape (2, nbins, ...)."""
+    flat = values.reshape(values.shape[0], -1)
+    valid = ~np.isnan(flat)
+    # One-hot (bins x time) matrix, so all bins are reduced with one product
+    onehot = np.zeros((nbins, len(bins)))
+    onehot[bins, np.arange(len(bins))] = 1
+    sums = np.stack([onehot @ np.where(valid, flat, 0), onehot @ valid])
+    return sums.reshape((2, nbins) + values.shape[1:])
+
+
+def _add(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    return a + b
+
+
+def _finalize_mean(sums: np.ndarray) -> tuple:
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = np.where(sums[1] > 0, sums[0] / sums[1], np.nan).astype(np.float32)
+    return mean, sums[1].astype(np.int32)
+
+
+def grouped_mean(data, bins: np.ndarray, nbins: int, partial_bytes: int = 2**26) -> tuple:
+    """Chunk-parallel grouped mean over the first (time) axis of a dask array, NaN skipped.
+
+    A map-reduce in the style of flox: every (time, y, x) chunk is reduced to per-bin sums and
+    counts, the partials of the chunks sharing a spatial block are added pairwise (a tree over
+    time), and the result keeps the spatial chunks of the input. Memory per task is one input
+    chunk plus ``2 x nbins`` planes of its spatial block; spatial blocks are split along the
+    second axis so that these partials stay within ``partial_bytes``.
+
+    Args:
+        data (dask.array.Array): Array with time as the first axis.
+        bins (np.ndarray): Bin index (0 to nbins - 1) of each time step.
+        nbins (int): Number of bins.
+        partial_bytes (int, optional): Maximum size of the partial sums of a block. Defaults to 64 MiB.
+
+    Returns:
+        tuple: Mean (float32, NaN without data) and count (int32) dask arrays of shape
+            ``(nbins,) + data.shape[1:]``.
+    """
+    rows = max(1, partial_bytes // (2 * 8 * nbins * int(np.prod(data.shape[2:]))))
+    if max(data.chunks[1]) > rows:
+        data = data.rechunk({1: rows})
+    edges = np.concatenate([[0], np.cumsum(data.chunks[0])])
+    blocks = data.to_delayed()
+    means, counts = np.empty(blocks.shape[1:], dtype=object), np.empty(blocks.shape[1:], dtype=object)
+    for idx in np.ndindex(*blocks.shape[1:]):
+        parts = [dask.delayed(_bin_sums)(blocks[(t,) + idx], bins[edges[t]:edges[t + 1]], nbins)
+                 for t in range(blocks.shape[0])]
+        while len(parts) > 1:
+            parts = [dask.delayed(_add)(*parts[i:i + 2]) if i + 1 < len(parts) else parts[i]
+                     for i in range(0, len(parts), 2)]
+        shape = (nbins,) + tuple(c[i] for c, i in zip(data.chunks[1:], idx))
+        result = dask.delayed(_finalize_mean, nout=2)(parts[0])
+        means[idx] = dask.array.from_delayed(result[0], shape=shape, dtype=np.float32)
+        counts[idx] = dask.array.from_delayed(result[1], shape=shape, dtype=np.int32)
+
+    def nest(arr):
+        # Nested lists for dask.array.block, with the (single) bin block as the outer level
+        return [arr.tolist()] if arr.ndim else [arr.item()]
+    return dask.array.block(nest(means)), dask.array.block(nest(counts))
+
+
+def grid_window(x: np.ndarray, y: np.ndarray, shapes, crs: str, grids: dict = None, pad: int = 1) -> dict:
+    """Snaps the union bounding box of the shapes to grid indices.
+
+    Args:
+        x (np.ndarray): x coordinates of the grid (cell centers).
+        y (np.ndarray): y coordinates of the grid (cell centers), ascending or descending.
+        shapes (list or dict): Shape geometries (GeoDataFrames).
+        crs (str): Coordinate reference system of the grid.
+        grids (dict, optional): 'x' and 'y' dimension names. Defaults to {'x': 'x', 'y': 'y'}.
+        pad (int, optional): Extra cells kept on each side of the box. Defaults to 1.
+
+    Raises:
+        ValueError: If the shapes do not overlap the grid.
+
+    Returns:
+        dict: Dimension name -> index slice, usable with ``isel``.
+    """
+    grids = grids or {'x': 'x', 'y': 'y'}
+    if isinstance(shapes, dict):
+        shapes = list(shapes.values())
+    bounds = np.array([shp.to_crs(crs).total_bounds for shp in shapes])
+    minx, miny = bounds[:, 0].min(), bounds[:, 1].min()
+    maxx, maxy = bounds[:, 2].max(), bounds[:, 3].max()
+
+    window = {}
+    for dim, coord, lo, hi in ((grids['x'], np.asarray(x), minx, maxx), (grids['y'], np.asarray(y), miny, maxy)):
+        step = abs(coord[1] - coord[0])
+        idx = np.flatnonzero((coord >= lo - (pad + 0.5) * step) & (coord <= hi + (pad + 0.5) * step))
+        if idx.size == 0:
+            raise ValueError(f"Shapes do not overlap the grid along {dim}")
+        window[dim] = slice(int(idx.min()), int(idx.max()) + 1)
+    return window
+
+
+def stitch_sources(primary: xr.DataArray, fallback: xr.DataArray,
+                   names: Tuple[str, str] = ("primary", "fallback")) -> xr.DataArray:
+    """Combines two products on the same grid, choosing the source per time step.
+
+    Time steps available in ``primary`` (e.g., the CDR) are taken from it; the others
+    are filled from ``fallback`` (e.g., near-real-time data). A ``source`` coordinate
+    along time records which product each step came from.
+
+    Args:
+        primary (xr.DataArray): Preferred product.
+        fallback (xr.DataArray): Product used where ``primary`` has no data.
+        names (tuple, optional): Source names for the ``source`` coordinate (e.g., the dataset IDs).
+
+    Returns:
+        xr.DataArray: Time-sorted combined data.
+    """
+    extra = fallback.isel(time=~np.isin(fallback["time"].values, primary["time"].values))
+    primary = primary.assign_coords(source=("time", np.full(primary.sizes["time"], names[0], dtype=object)))
+    extra = extra.assign_coords(source=("time", np.full(extra.sizes["time"], names[1], dtype=object)))
+    combined = xr.concat([primary, extra], dim="time", coords="minimal", compat="override")
+    return combined.sortby("time")
+
+
+def annualized_extent(ext: xr.DataArray, years: range) -> pd.DataFrame:
+    """Averages regional extents over each water year, lazily, for all years and regions at once.
+
+    Args:
+        ext (xr.DataArray): Sea ice extent with dimensions (time, region), possibly dask-backed.
+        years (range): Water years to report.
+
+    Returns:
+        pd.DataFrame: Tidy table with columns region, year, extent.
+    """
+    wy = water_year(ext["time"].values)
+    keep = np.isin(wy, list(years))
+    ext = ext.isel(time=keep).assign_coords(year=("time", wy[keep]))
+
+    annual = ext.groupby("year").mean("time").compute()
+    df = (annual
+          .rename("extent")
+          .to_dataframe()
+          .reset_index()[["region", "year", "extent"]])
+    return df.sort_values(["region", "year"], kind="stable").reset_index(drop=True)
+
+
+def metrics_frame(metrics: xr.DataArray) -> pd.DataFrame:
+    """Turns (time, metric, region) metrics into a table with columns region, date and one column per metric.
+
+    Args:
+        metrics (xr.DataArray): Output of `RegionIndex.metrics` or `SIC25k.compute_region_metrics` (computed).
+
+    Returns:
+        pd.DataFrame: One row per (region, date), sorted by region and date.
+    """
+    df = (metrics.drop_vars("spatial_ref", errors="ignore")
+          .to_series()
+          .unstack("metric")
+          .reset_index()
+          .rename(columns={"time": "date"}))
+    df.columns.name = None
+    return df[["region", "date"] + list(metrics["metric"].values)].sort_values(["region", "date"], ignore_index=True)
@@ -0,0 +1,557 @@
+"""
+Title: Parallel and checkpointed extent computation for the PolarWatch sea ice scripts
+Description: Runs the fused extent kernel (`pw_kernels`) over a sea ice concentration cube for many
+regions and time windows: on a process pool or a Dask cluster with bounded memory, or in this process
+with the next blocks read in the background. The backfill runs it one time partition at a time into
+an `ExtentStore`, and records each finished partition so a rerun resumes where it stopped.
+
+Main Classes and Functions:
+- ExtentEngine: Parallel (region, time window) extent jobs on a process pool or Dask cluster, with bounded memory.
+- Prefetcher: Loads the next time windows of a dataset on a background thread (bounded queue) while the
+  current one is processed, so reads from ERDDAP overlap with the extent computation.
+- ExtentBackfill: Checkpointed backfill of daily regional extents into an `ExtentStore`, one time partition at a
+  time, resumable and able to redo only partitions whose source data changed.
+- step_digests: Per-time-step digests of a block, the basis of the backfill fingerprints.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+import dask
+import numpy as np
+import pandas as pd
+import rioxarray
+import xarray as xr
+
+from pw_kernels import fused_extent
+from pw_metrics import RunReport
+from pw_store import ExtentStore, ExtentPyramid
+
+logger = logging.getLogger(__name__)
+
+
+# Read-only state of an ExtentEngine worker process: (concentration, cells, weights, kernel arguments, digests)
+_ENGINE_STATE = None
+
+
+def _init_engine_worker(state: tuple):
+    global _ENGINE_STATE
+    _ENGINE_STATE = state
+
+
+def _engine_task(start: str, end: str, state: tuple = None) -> tuple:
+    """Reads one time block and reduces it for all regions of the index."""
+    ds = (state if state is not None else _ENGINE_STATE)[0]
+    # Workers are the unit of parallelism, so the read itself runs single-threaded
+    with dask.config.set(scheduler="synchronous"):
+        block = ds.sel(time=slice(start, end)).load()
+    return _reduce_block(block, state)
+
+
+def _reduce_block(block: xr.DataArray, state: tuple = None) -> tuple:
+    """Reduces one loaded time block for all regions of the index (and hashes its time steps)."""
+    _, cells, weights, kwargs, digests = state if state is not None else _ENGINE_STATE
+    values = block.values
+    return (block["time"].values, fused_extent(values, cells, weights, **kwargs),
+            step_digests(values) if digests else b"")
+
+
+def step_digests(values: np.ndarray) -> bytes:
+    """SHA-256 digests of the time steps (first axis) of a block, concatenated."""
+    return b"".join(hashlib.sha256(np.ascontiguousarray(step).tobytes()).digest() for step in values)
+
+
+class ExtentEngine:
+    """Runs (region, time window) extent jobs in parallel with bounded memory.
+
+    Jobs sharing a time window share its reads: each window is split into time blocks
+    small enough that one block per worker fits in ``memory_budget``, and every block
+    is read once and reduced for all regions with the fused kernel. Blocks run on a
+    process pool, or on a Dask cluster when ``client`` is given. The (lazily opened)
+    concentration and the region index are sent to each worker once and only read
+    there. Results are returned in job order, whatever order the blocks finish in.
+    With a single worker, the blocks run in this process and the next blocks are
+    read by a `Prefetcher` while the current one is reduced.
+    """
+
+    def __init__(self, ds: xr.DataArray, index: "RegionIndex", threshold=0.15, valid_max=None,
+                 workers: int = None, memory_budget="2GB", client=None, prefetch: int = 2,
+                 digests: bool = False):
+        """
+        Args:
+            ds (xr.DataArray): Sea ice concentration on the grid of the index, with a time dimension.
+            index (RegionIndex): Region index.
+            threshold (float): Threshold value for sea ice concentration, in the units of ``ds``.
+            valid_max (optional): Values above it are flags, not ice (byte-scaled data). Defaults to None.
+            workers (int, optional): Worker processes. Defaults to the number of CPUs; 1 runs in this process.
+            memory_budget (int or str, optional): Memory for the blocks in flight, in bytes or as a
+                string such as '2GB'. Defaults to '2GB'.
+            client (dask.distributed.Client, optional): Run the blocks on this Dask cluster instead of a
+                process pool. Defaults to None.
+            prefetch (int, optional): Blocks read ahead when running in this process. Defaults to 2.
+            digests (bool, optional): Also hash every time step where it is read (`step_digests`), and
+                return the digests of a job's window in the ``digests`` attribute of its extent.
+                Defaults to False.
+        """
+        x_dim, y_dim = ds.rio.x_dim, ds.rio.y_dim
+        if ds.sizes[x_dim] != len(index.x) or ds.sizes[y_dim] != len(index.y):
+            raise ValueError(f"Data grid ({ds.sizes[y_dim]}, {ds.sizes[x_dim]}) does not match "
+                             f"region index grid ({len(index.y)}, {len(index.x)})")
+        self.ds = ds.transpose(..., y_dim, x_dim)
+        self.index = index
+        self.kwargs = {"threshold": threshold, "valid_max": valid_max}
+        self.client = client
+        if client is not None and workers is None:
+            workers = len(client.scheduler_info()["workers"])
+        self.workers = max(1, workers or os.cpu_count() or 1)
+        self.memory_budget = dask.utils.parse_bytes(memory_budget) if isinstance(memory_budget, str) else int(memory_budget)
+        self.prefetch = prefetch
+        self.digests = digests
+
+    def __str__(self):
+        return (f"ExtentEngine:\nregions={self.index.names}\n, workers={self.workers}\n, "
+                f"memory_budget={self.memory_budget}\n, block_steps={self.block_steps()}\n, client={self.client}")
+
+    def block_steps(self) -> int:
+        """Time steps per block, so that one block per worker fits in the memory budget."""
+        # A loaded block plus the kernel temporaries and decoding copies
+        step_bytes = 2 * self.ds.dtype.itemsize * int(np.prod(self.ds.shape[-2:]))
+        # In this process, the prefetched blocks wait in memory next to the one being reduced
+        slots = self.workers if self.workers > 1 or self.client is not None else 1 + self.prefetch
+        return max(1, self.memory_budget // (slots * step_bytes))
+
+    def plan(self, jobs: list) -> dict:
+        """Splits the time windows of the jobs into blocks.
+
+        Args:
+            jobs (list): (region, (start, end)) tuples, dates in 'YYYY-MM-DD' format.
+
+        Raises:
+            ValueError: If a job names a region that is not in the index.
+
+        Returns:
+            dict: Time window -> list of (start, end) blocks, in first-use order.
+        """
+        unknown = {region for region, _ in jobs} - set(self.index.names)
+        if unknown:
+            raise ValueError(f"Regions {sorted(unknown)} are not in the region index {self.index.names}")
+
+        times = pd.DatetimeIndex(self.ds["time"].values)
+        steps = self.block_steps()
+        blocks = {}
+        for _, window in jobs:
+            window = tuple(window)
+            if window in blocks:
+                continue
+            t = times[(times >= pd.Timestamp(window[0])) & (times <= pd.Timestamp(window[1]))]
+            blocks[window] = [(t[i].isoformat(), t[min(i + steps, len(t)) - 1].isoformat())
+                              for i in range(0, len(t), steps)]
+        return blocks
+
+    def iter_results(self, jobs: list):
+        """Runs the jobs and yields (job, extent) in job order, as soon as each job is complete.
+
+        Args:
+            jobs (list): (region, (start, end)) tuples, dates in 'YYYY-MM-DD' format.
+
+        Yields:
+            tuple: The job and its sea ice extent (km^2), a DataArray over time.
+        """
+        blocks = self.plan(jobs)
+        state = (self.ds, self.index.cells, self.index.matrix, self.kwargs, self.digests)
+
+        if self.client is not None:
+            shared = self.client.scatter(state, broadcast=True)
+            submit = lambda start, end: self.client.submit(_engine_task, start, end, shared, pure=False)
+            pool = stream = None
+        elif self.workers > 1:
+            pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=get_context("spawn"),
+                                       initializer=_init_engine_worker, initargs=(state,))
+            submit = lambda start, end: pool.submit(_engine_task, start, end)
+            stream = None
+        else:
+            # Blocks are reduced in submission order, so each one takes the next prefetched block
+            pool = None
+            stream = iter(Prefetcher(self.ds, [b for window_blocks in blocks.values() for b in window_blocks],
+                                     depth=self.prefetch))
+            submit = lambda start, end: _LazyFuture(lambda: _reduce_block(next(stream)[1], state))
+
+        try:
+            futures = {window: [submit(start, end) for start, end in window_blocks]
+                       for window, window_blocks in blocks.items()}
+            done = {}
+            for region, window in jobs:
+                window = tuple(window)
+                if window not in done:
+                    parts = [f.result() for f in futures[window]]
+                    times = np.concatenate([p[0] for p in parts]) if parts else np.array([], dtype="datetime64[ns]")
+                    values = (np.concatenate([p[1] for p in parts]) if parts
+                              else np.empty((0, len(self.index.names))))
+                    done[window] = (times, values, b"".join(p[2] for p in parts))
+                times, values, digests = done[window]
+                ext = xr.DataArray(values[:, self.index.names.index(region)], dims=("time",),
+                                   coords={"time": times, "region": region}, name="seaice_extent")
+                if self.digests:
+                    ext.attrs["digests"] = digests
+                yield (region, window), ext
+        finally:
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+            if stream is not None:
+                stream.close()
+
+    def run(self, jobs: list) -> list:
+        """Runs the jobs and returns their extents (DataArrays over time), in job order."""
+        return [ext for _, ext in self.iter_results(jobs)]
+
+
+class ExtentBackfill:
+    """Checkpointed backfill of daily regional extents, by time partition.
+
+    The history is split into time partitions (e.g., years). Each finished partition's
+    daily extents of all regions are upserted into an `ExtentStore`, then recorded in a
+    manifest (``{store root}/_backfill.json``) with the days it covers and a fingerprint
+    of its source data. A rerun skips the recorded partitions, so an interrupted
+    backfill resumes from the first missing one. The fingerprint of a new partition is
+    computed by the workers from the blocks they read for its extents, so its data are
+    read once. With ``changed_only``, recorded partitions are fingerprinted again and
+    only those whose source data changed (e.g., reprocessed CDR days, or NRT days
+    replaced by the CDR) are recomputed.
+
+    With stitched CDR/NRT data, the source of each day is stored along with its extent,
+    and `supersede` rewrites only the month partitions whose NRT days a CDR release now covers.
+
+    With a ``pyramid``, the weekly, monthly and water-year means of the periods each write
+    touches are recomputed from the stored days, so downstream products read their
+    resolution from the pyramid instead of reducing the grids again. Readers of the history
+    check the days it holds with `covers`, whatever partition length wrote them.
+    """
+
+    def __init__(self, ds: xr.DataArray, index: "RegionIndex", store: ExtentStore, threshold=0.15,
+                 valid_max=None, freq: str = "Y", report: RunReport = None, pyramid: ExtentPyramid = None,
+                 **engine_kwargs):
+        """
+        Args:
+            ds (xr.DataArray): Sea ice concentration on the grid of the index (e.g., from `stitch_sources`).
+            index (RegionIndex): Region index.
+            store (ExtentStore): Store the daily extents are written to.
+            threshold (float): Threshold value for sea ice concentration, in the units of ``ds``.
+            valid_max (optional): Values above it are flags, not ice (byte-scaled data). Defaults to None.
+            freq (str, optional): Pandas period frequency of the partitions ('Y', 'Q' or 'M'). Defaults to 'Y'.
+            report (RunReport, optional): Run report. Defaults to a new report.
+            pyramid (ExtentPyramid, optional): Aggregates of ``store`` kept up to date with each write.
+                Defaults to None.
+            **engine_kwargs: `ExtentEngine` arguments (workers, memory_budget, client).
+        """
+        self.engine = ExtentEngine(ds, index, threshold=threshold, valid_max=valid_max, digests=True,
+                                   **engine_kwargs)
+        self.store = store
+        self.pyramid = pyramid
+        self.freq = freq
+        self.report = report if report is not None else RunReport("backfill")
+        self.manifest_path = os.path.join(store.root, "_backfill.json")
+        # Partitions computed with other regions, grid or threshold are not reused. The partition
+        # length is not part of the key, so readers of the history match it whatever ``freq`` wrote it
+        self.key = hashlib.sha256(f"{index.key}:{index.names}:{threshold}:{valid_max}".encode()).hexdigest()
+
+    def __str__(self):
+        return (f"ExtentBackfill:\nstore={self.store.root}\n, freq={self.freq}\n, "
+                f"partitions={sorted(self.read_manifest()['partitions'])}")
+
+    def read_manifest(self) -> dict:
+        """Returns the manifest: settings key and partition name -> {start, end, days, fingerprint}.
+        A manifest written with other settings is returned empty."""
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path) as f:
+                manifest = json.load(f)
+            if manifest.get("key") == self.key:
+                return manifest
+        return {"key": self.key, "partitions": {}}
+
+    def _write_manifest(self, manifest: dict):
+        os.makedirs(self.store.root, exist_ok=True)
+        tmp = self.manifest_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(manifest, f, indent=1, sort_keys=True)
+        os.replace(tmp, self.manifest_path)
+
+    def partitions(self, start: str, end: str) -> list:
+        """Splits [start, end] into (name, start, end) partitions of the data's time steps.
+
+        Partitions without data are left out; the last one may be partial.
+        """
+        times = pd.DatetimeIndex(self.engine.ds["time"].values)
+        times = times[(times >= pd.Timestamp(start)) & (times <= pd.Timestamp(end))]
+        if times.empty:
+            return []
+        labels = times.to_period(self.freq)
+        parts = []
+        for label in labels.unique():
+            t = times[labels == label]
+            parts.append((str(label), t[0].strftime("%Y-%m-%d"), t[-1].strftime("%Y-%m-%d")))
+        return parts
+
+    def covers(self, start: str, end: str) -> bool:
+        """Whether the recorded partitions, of any length, hold every time step of the data in [start, end]."""
+        times = pd.DatetimeIndex(self.engine.ds["time"].values)
+        times = times[(times >= pd.Timestamp(start)) & (times <= pd.Timestamp(end))]
+        done = np.zeros(len(times), dtype=bool)
+        for entry in self.read_manifest()["partitions"].values():
+            done |= (times >= pd.Timestamp(entry["start"])) & (times <= pd.Timestamp(entry["end"]))
+        return len(times) > 0 and bool(done.all())
+
+    def fingerprint(self, start: str, end: str, digests: bytes = None) -> str:
+        """Hashes the source data of a time range: time stamps, sources and the digest of each
+        time step's values (`step_digests`).
+
+        Args:
+            start (str): First date ('YYYY-MM-DD').
+            end (str): Last date ('YYYY-MM-DD').
+            digests (bytes, optional): Digests of the time steps, as returned by the engine with
+                the extents. Defaults to None (the values are read here).
+
+        Returns:
+            str: Hex digest.
+        """
+        ds = self.engine.ds.sel(time=slice(start, end))
+        h = hashlib.sha256(pd.DatetimeIndex(ds["time"].values).asi8.tobytes())
+        if "source" in ds.coords:
+            h.update("|".join(map(str, ds["source"].values)).encode())
+        if digests is None:
+            steps = self.engine.block_steps() * self.engine.workers
+            with dask.config.set(scheduler="synchronous"):
+                digests = b"".join(step_digests(ds.isel(time=slice(i, i + steps)).values)
+                                   for i in range(0, ds.sizes["time"], steps))
+        h.update(digests)
+        return h.hexdigest()
+
+    def pending(self, start: str, end: str, changed_only: bool = False) -> list:
+        """Returns the partitions of [start, end] that need computing, as (name, start, end, fingerprint).
+
+        Partitions missing from the manifest, or covering other days than recorded (e.g., a
+        partial last partition that has grown), are pending, with no fingerprint yet (the
+        workers compute it). With ``changed_only``, recorded partitions are fingerprinted and
+        those whose fingerprint changed are pending too.
+        """
+        done = self.read_manifest()["partitions"]
+        todo = []
+        for name, p_start, p_end in self.partitions(start, end):
+            entry = done.get(name)
+            if entry is None or (entry["start"], entry["end"]) != (p_start, p_end):
+                todo.append((name, p_start, p_end, None))
+            elif changed_only:
+                with self.report.stage("fingerprint"):
+                    fingerprint = self.fingerprint(p_start, p_end)
+                if entry["fingerprint"] != fingerprint:
+                    todo.append((name, p_start, p_end, fingerprint))
+        return todo
+
+    def run(self, start: str, end: str, changed_only: bool = False) -> list:
+        """Computes the pending partitions of [start, end] and stores them, one partition at a time.
+
+        All pending partitions are submitted to the engine at once, but each one is written and
+        checkpointed as soon as its regions are complete (in time order), so an interruption only
+        loses the partitions in flight.
+
+        Args:
+            start (str): First date ('YYYY-MM-DD').
+            end (str): Last date ('YYYY-MM-DD').
+            changed_only (bool, optional): Also recompute recorded partitions whose source data
+                changed. Defaults to False (only missing partitions).
+
+        Returns:
+            list: Names of the partitions that were computed.
+        """
+        todo = self.pending(start, end, changed_only)
+        names = self.engine.index.names
+        jobs = [(region, (p_start, p_end)) for _, p_start, p_end, _ in todo for region in names]
+
+        computed, done = [], []
+        with self.report.stage("reduce"):
+            for (region, _), ext in self.engine.iter_results(jobs):
+                done.append(ext)
+                if len(done) < len(names):
+                    continue
+                name, p_start, p_end, fingerprint = todo[len(computed)]
+                if fingerprint is None:
+                    fingerprint = self.fingerprint(p_start, p_end, digests=done[0].attrs["digests"])
+                with self.report.stage("write"):
+                    for ext in done:
+                        self.write(ext)
+                    # The partition is recorded only after all of its regions are stored
+                    manifest = self.read_manifest()
+                    manifest["partitions"][name] = {"start": p_start, "end": p_end, "days": done[0].sizes["time"],
+                                                    "fingerprint": fingerprint}
+                    self._write_manifest(manifest)
+                logger.info("Backfilled partition %s (%s to %s)", name, p_start, p_end)
+                computed.append(name)
+                done = []
+        return computed
+
+    def write(self, ext: xr.DataArray):
+        """Upserts one region's daily extents into the store, with the source of each day
+        when the data have a ``source`` coordinate (see `stitch_sources`), and updates the
+        pyramid periods they fall in."""
+        df = ext.to_dataframe().reset_index()[["time", "seaice_extent"]].rename(columns={"time": "date"})
+        if "source" in self.engine.ds.coords:
+            df["source"] = self.engine.ds["source"].sel(time=ext["time"].values).values.astype(str)
+        region = str(ext["region"].values)
+        self.store.upsert(region, df)
+        if self.pyramid is not None and not df.empty:
+            self.pyramid.update(region, df["date"].min(), df["date"].max())
+
+    def supersede(self, source: str) -> list:
+        """Recomputes the stored month partitions that hold days now available from ``source``
+        but were computed from another source (e.g., NRT days once a CDR release covers them).
+
+        Only the affected months are recomputed and rewritten; other partitions are untouched.
+
+        Args:
+            source (str): Preferred source, as in the ``source`` coordinate of the data (e.g., the CDR ID).
+
+        Returns:
+            list: Month partitions ('YYYY-MM') that were rewritten.
+        """
+        ds = self.engine.ds
+        if "source" not in ds.coords:
+            raise ValueError("Supersession needs data with a source coordinate (see stitch_sources)")
+        names = self.engine.index.names
+        available = ds["time"].values[ds["source"].values == source]
+        months = sorted(set().union(*(self.store.stale_months(region, available, source) for region in names)))
+
+        jobs = []
+        for month in months:
+            period = pd.Period(month, freq="M")
+            window = (period.start_time.strftime("%Y-%m-%d"), period.end_time.strftime("%Y-%m-%d"))
+            jobs += [(region, window) for region in names]
+        with self.report.stage("reduce"):
+            for _, ext in self.engine.iter_results(jobs):
+                with self.report.stage("write"):
+                    self.write(ext)
+        # Recorded partitions holding the rewritten months get the fingerprint of their new
+        # sources, so a later changed-only run does not recompute them again
+        if months:
+            manifest = self.read_manifest()
+            with self.report.stage("fingerprint"):
+                for entry in manifest["partitions"].values():
+                    if any(entry["start"][:7] <= month <= entry["end"][:7] for month in months):
+                        entry["fingerprint"] = self.fingerprint(entry["start"], entry["end"])
+            self._write_manifest(manifest)
+
+        # The next call only scans the days after the ones checked now
+        if len(available):
+            for region in names:
+                self.store.mark_checked(region, source, available.max())
+        if months:
+            logger.info("Superseded %d month partitions with %s: %s", len(months), source, months)
+        return months
+
+
+class _LazyFuture:
+    """Future interface for blocks run in this process: computed on the first ``result`` call."""
+
+    def __init__(self, fn):
+        self._fn = fn
+        self._result = None
+        self._done = False
+
+    def result(self):
+        if not self._done:
+            self._result = self._fn()
+            self._done = True
+        return self._result
+
+
+class Prefetcher:
+    """Reads time windows of a dataset on a background thread, ahead of their use.
+
+    Iterating yields (window, loaded DataArray) in window order. The reader thread
+    loads the next windows into a bounded queue while the caller processes the
+    current one, so the wall time of a read-then-compute loop approaches
+    max(I/O, compute) instead of their sum, and at most ``depth`` loaded windows
+    wait in memory. A read error is raised in the caller at the window that failed;
+    leaving the loop early (``break``, an error, or ``close()`` on the iterator)
+    stops the reader.
+
+    Example:
+        for window, block in Prefetcher(sic.ds, [("2020-01-01", "2020-12-31"), ...]):
+            ext = index.extent(block)
+    """
+
+    _DONE = object()
+
+    def __init__(self, ds: xr.DataArray, windows: list, depth: int = 2, report=None):
+        """
+        Args:
+            ds (xr.DataArray): Data with a time dimension, typically lazily opened from ERDDAP or a local copy.
+            windows (list): (start, end) time windows, read in this order.
+            depth (int, optional): Loaded windows waiting for the caller. Defaults to 2.
+            report (RunReport, optional): Records the reads ('open') and the time the caller waits
+                for them ('prefetch_wait'). Defaults to None.
+        """
+        if depth < 1:
+            raise ValueError(f"depth must be at least 1, got {depth}")
+        self.ds = ds
+        self.windows = [tuple(window) for window in windows]
+        self.depth = depth
+        self.report = report
+
+    def __str__(self):
+        return f"Prefetcher:\nwindows={len(self.windows)}\n, depth={self.depth}"
+
+    def __len__(self):
+        return len(self.windows)
+
+    def _read(self, window: tuple) -> xr.DataArray:
+        block = self.ds.sel(time=slice(*window))
+        if self.report is None:
+            return block.load()
+        with self.report.stage("open"):
+            return block.load()
+
+    def _produce(self, slots: queue.Queue, stop: threading.Event):
+        def put(item):
+            # Waits for a free slot, unless the caller has stopped
+            while not stop.is_set():
+                try:
+                    slots.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        try:
+            for window in self.windows:
+                if stop.is_set() or not put((window, self._read(window))):
+                    return
+        except BaseException as e:
+            put(e)
+        finally:
+            put(self._DONE)
+
+    def __iter__(self):
+        slots = queue.Queue(maxsize=self.depth)
+        stop = threading.Event()
+        reader = threading.Thread(target=self._produce, args=(slots, stop), name="prefetch", daemon=True)
+        reader.start()
+        try:
+            while True:
+                if self.report is None:
+                    item = slots.get()
+                else:
+                    with self.report.stage("prefetch_wait"):
+                        item = slots.get()
+                if item is self._DONE:
+                    return
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            stop.set()
+            reader.join()
@@ -0,0 +1,245 @@
+"""
+Title: Incremental freeze-up, break-up and ice-season length of the regional sea ice extent
+Description: Stateful detector of the seasonal sea ice events of each region, advanced one day at a
+time from the daily extent. Its small state is saved as JSON between runs; ``replay`` runs the same
+detector over a history to seed or rebuild it.
+
+Definitions, per region and September-August water year (Sep 2023 - Aug 2024 is 2024):
+    smoothed extent   running mean of the last ``window`` valid days
+    freeze-up         first day of the first run of ``persist`` days with the smoothed extent at or
+                      above the threshold, after it was below it
+    break-up          first day of the last run of ``persist`` days with the smoothed extent below
+                      the threshold, after a run above it (provisional until the season ends;
+                      cleared if the ice persistently freezes up again)
+    season length     days from freeze-up to break-up
+
+The threshold of a region sits at ``fraction`` of the range of its climatological mean annual cycle,
+above its minimum (``cycle_threshold``), so regions that never clear or never fill up in summer or
+winter get a threshold they actually cross.
+
+Main Classes and Functions:
+- SeasonEventDetector: Per-region detector state, with ``advance`` (new days), ``replay`` (history),
+  ``events`` (one row per water year) and atomic JSON ``save``/``load``.
+- cycle_threshold: Threshold from a mean annual cycle of the extent (e.g., ``bs_extent_{name}.csv``).
+- thresholds_from_baseline: Per-region thresholds from a ``BaselineDistribution``.
+"""
+
+import json
+import os
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from pw_baseline import water_year
+
+
+def cycle_threshold(mean, fraction: float = 0.15) -> float:
+    """Extent threshold at ``fraction`` of the range of a mean annual cycle.
+
+    Args:
+        mean (array-like): Climatological mean extent (km^2) per calendar day. NaNs are skipped.
+        fraction (float): Position of the threshold between the minimum (0) and maximum (1) of the cycle.
+
+    Returns:
+        float: Threshold (km^2).
+    """
+    low, high = np.nanmin(mean), np.nanmax(mean)
+    return float(low + fraction * (high - low))
+
+
+def thresholds_from_baseline(baseline, fraction: float = 0.15) -> dict:
+    """Threshold of each region from the mean annual cycle of its baseline (``cycle_threshold``).
+
+    Args:
+        baseline (BaselineDistribution): Sorted baseline extents per region and calendar day.
+        fraction (float): Position of the threshold between the minimum (0) and maximum (1) of the cycle.
+
+    Returns:
+        dict: Threshold (km^2) per region name.
+    """
+    with warnings.catch_warnings():
+        # Calendar days without baseline values (all NaN) are skipped
+        warnings.simplefilter("ignore", RuntimeWarning)
+        mean = np.nanmean(baseline.values, axis=2)
+    return {name: cycle_threshold(row, fraction) for name, row in zip(baseline.regions, mean)}
+
+
+class SeasonEventDetector:
+    """Freeze-up, break-up and season length per region, updated one day at a time."""
+
+    def __init__(self, thresholds: dict, window: int = 5, persist: int = 5):
+        """
+        Args:
+            thresholds (dict): Sea ice extent threshold (km^2) per region name.
+            window (int): Days in the running mean of the extent.
+            persist (int): Consecutive days the smoothed extent must stay on one side of the
+                threshold for a crossing to count.
+        """
+        self.settings = {"window": int(window), "persist": int(persist)}
+        self.state = {name: self._new_state(threshold) for name, threshold in thresholds.items()}
+
+    def __str__(self):
+        return f"SeasonEventDetector:\nregions={self.regions}\n, settings={self.settings}"
+
+    @property
+    def regions(self) -> list:
+        return list(self.state)
+
+    @staticmethod
+    def _new_state(threshold: float) -> dict:
+        return {"threshold": float(threshold),
+                "last_date": None,      # Last day stepped through (earlier days are ignored)
+                "buffer": [],           # Ring buffer of the last ``window`` valid extents
+                "pos": 0,               # Next slot of the ring buffer to overwrite
+                "total": 0.0,           # Running sum of the ring buffer
+                "above": None,          # Side of the threshold of the current run
+                "run_start": None,      # First day of the current run
+                "run_length": 0,        # Days in the current run
+                "confirmed": None,      # Side of the last run that lasted ``persist`` days
+                "water_year": None,     # Current season
+                "freeze_up": None,
+                "break_up": None,
+                "seasons": {}}          # Events of the finished seasons, by water year
+
+    def last_date(self, region: str):
+        """Last day stepped through for a region, or None."""
+        last = self.state[region]["last_date"]
+        return None if last is None else pd.Timestamp(last)
+
+    def advance(self, region: str, dates, values) -> int:
+        """Steps a region's detector through new days.
+
+        Days up to the last day already stepped through are ignored, so overlapping calls are
+        harmless. Days without a value (NaN) only advance the season.
+
+        Args:
+            region (str): Region name.
+            dates (array-like): Days, ascending.
+            values (array-like): Sea ice extent (km^2) of each day.
+
+        Returns:
+            int: Number of days stepped through.
+        """
+        s = self.state[region]
+        window, persist = self.settings["window"], self.settings["persist"]
+        dates = pd.DatetimeIndex(dates)
+        values = np.asarray(values, dtype=np.float64)
+        if s["last_date"] is not None:
+            keep = dates > pd.Timestamp(s["last_date"])
+            dates, values = dates[keep], values[keep]
+
+        for day, wy, value in zip(dates, water_year(dates).tolist(), values):
+            if wy != s["water_year"]:
+                # New season: the finished one is recorded, the run carries over
+                if s["water_year"] is not None:
+                    s["seasons"][str(s["water_year"])] = {"freeze_up": s["freeze_up"], "break_up": s["break_up"]}
+                s["water_year"], s["freeze_up"], s["break_up"] = wy, None, None
+            s["last_date"] = day.strftime("%Y-%m-%d")
+            if np.isnan(value):
+                continue
+
+            # Running mean over the ring buffer
+            if len(s["buffer"]) < window:
+                s["buffer"].append(float(value))
+            else:
+                s["total"] -= s["buffer"][s["pos"]]
+                s["buffer"][s["pos"]] = float(value)
+            s["pos"] = (s["pos"] + 1) % window
+            s["total"] += float(value)
+
+            above = bool(s["total"] / len(s["buffer"]) >= s["threshold"])
+            if above == s["above"]:
+                s["run_length"] += 1
+            else:
+                s["above"], s["run_start"], s["run_length"] = above, s["last_date"], 1
+
+            # A crossing counts once the run has lasted ``persist`` days and the side changed
+            if s["run_length"] != persist or s["confirmed"] == above:
+                continue
+            if above and s["confirmed"] is False:
+                if s["freeze_up"] is None:
+                    # A melt earlier in the season ended the previous ice season
+                    s["freeze_up"], s["break_up"] = s["run_start"], None
+                else:
+                    # Persistent refreeze: the break-up was not the last one
+                    s["break_up"] = None
+            elif not above and s["confirmed"] is True:
+                s["break_up"] = s["run_start"]
+            s["confirmed"] = above
+        return len(dates)
+
+    def replay(self, region: str, dates, values) -> int:
+        """Rebuilds a region's state from a history of daily extents (batch mode).
+
+        The detector is reset and stepped through every day, so the result is the same as advancing
+        it day by day. Finished seasons before the first replayed day are kept, and so is the
+        record of a season the history starts in after its first day (September 1).
+
+        Args:
+            region (str): Region name.
+            dates (array-like): Days, ascending.
+            values (array-like): Sea ice extent (km^2) of each day.
+
+        Returns:
+            int: Number of days stepped through.
+        """
+        dates = pd.DatetimeIndex(dates)
+        old = self.state[region]["seasons"]
+        self.state[region] = self._new_state(self.state[region]["threshold"])
+        if len(dates) == 0:
+            self.state[region]["seasons"] = old
+            return 0
+        n = self.advance(region, dates, values)
+
+        first = dates[0]
+        first_wy = int(water_year([first])[0])
+        seasons = {wy: season for wy, season in old.items() if int(wy) < first_wy}
+        if (first.month, first.day) != (9, 1) and str(first_wy) in old:
+            seasons[str(first_wy)] = old[str(first_wy)]
+        s = self.state[region]
+        s["seasons"] = {**s["seasons"], **seasons}
+        s["seasons"] = dict(sorted(s["seasons"].items()))
+        return n
+
+    def events(self, region: str) -> pd.DataFrame:
+        """Seasonal events of a region, one row per water year.
+
+        Returns:
+            pd.DataFrame: Columns water_year, freeze_up, break_up (NaT if not detected),
+                season_length (days from freeze-up to break-up, NaN if either is missing) and
+                status ('final' for finished seasons, 'provisional' for the current one).
+        """
+        s = self.state[region]
+        rows = [(int(wy), season["freeze_up"], season["break_up"], "final")
+                for wy, season in s["seasons"].items()]
+        if s["water_year"] is not None:
+            rows.append((s["water_year"], s["freeze_up"], s["break_up"], "provisional"))
+        df = pd.DataFrame(rows, columns=["water_year", "freeze_up", "break_up", "status"])
+        df["freeze_up"] = pd.to_datetime(df["freeze_up"])
+        df["break_up"] = pd.to_datetime(df["break_up"])
+        df.insert(3, "season_length", (df["break_up"] - df["freeze_up"]).dt.days.astype("Int64"))
+        return df.sort_values("water_year", ignore_index=True)
+
+    def to_csv(self, region: str, path: str):
+        """Writes a region's events to a CSV file (atomically), dates as yyyy-mm-dd."""
+        df = self.events(region)
+        tmp = path + ".tmp"
+        df.to_csv(tmp, index=False, date_format="%Y-%m-%d")
+        os.replace(tmp, path)
+
+    def save(self, path: str):
+        """Writes the settings and the state of every region to a JSON file (atomically)."""
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"settings": self.settings, "regions": self.state}, f, indent=1)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> "SeasonEventDetector":
+        """Reads a detector written by ``save``."""
+        with open(path) as f:
+            saved = json.load(f)
+        detector = cls({}, **saved["settings"])
+        detector.state = saved["regions"]
+        return detector
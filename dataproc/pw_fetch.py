@@ -0,0 +1,195 @@
+"""
+Title: Concurrent ERDDAP griddap downloader
+Description: Downloads a date range of an ERDDAP griddap dataset as time-chunk requests to the ``.nc``
+endpoint, fetched concurrently over pooled HTTP connections, and assembles them into one xarray Dataset.
+
+Each chunk is written to a part file named after its request and moved into place once complete. A failed
+or interrupted run keeps the finished parts, and rerunning it only requests the missing chunks. A request
+that fails or stalls (no bytes within the read timeout) is retried with exponential backoff.
+
+Main Classes and Functions:
+- GriddapDownloader: Bounded-concurrency, retrying, resumable time-chunked downloader.
+- griddap_query: ERDDAP griddap request URL for a time range and a block of grid coordinates.
+"""
+
+import hashlib
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import requests
+import xarray as xr
+
+from pw_metrics import RunReport
+
+
+class GriddapDownloader:
+    """Fetches griddap hyperslabs as concurrent time-chunk ``.nc`` requests."""
+
+    def __init__(self, server: str, time_chunk: int = 31, max_workers: int = 4, retries: int = 4,
+                 backoff: float = 2.0, timeout: tuple = (10, 120), part_dir: str = None,
+                 session: requests.Session = None, report: RunReport = None):
+        """
+        Args:
+            server (str): The base URL of the ERDDAP server (e.g., https://polarwatch.noaa.gov/erddap/griddap).
+            time_chunk (int, optional): Time steps per request. Defaults to 31.
+            max_workers (int, optional): Maximum number of concurrent requests (and pooled connections). Defaults to 4.
+            retries (int, optional): Retries of a failed request. Defaults to 4.
+            backoff (float, optional): Seconds before the first retry, doubled after each retry. Defaults to 2.
+            timeout (tuple, optional): Connect and read timeouts in seconds; a request that sends no
+                bytes for the read timeout is retried. Defaults to (10, 120).
+            part_dir (str, optional): Directory of the part files. Defaults to a directory under the system
+                temporary directory.
+            session (requests.Session, optional): Session to use. Defaults to a new pooled session.
+            report (RunReport, optional): Run report the downloaded bytes are recorded in. Defaults to None.
+        """
+        self.server = server
+        self.time_chunk = time_chunk
+        self.max_workers = max_workers
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.part_dir = part_dir or os.path.join(tempfile.gettempdir(), "pw_fetch")
+        if session is None:
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+        self.session = session
+        self.report = report
+
+    def __str__(self):
+        return (f"GriddapDownloader:\nserver={self.server}\n, time_chunk={self.time_chunk}\n, "
+                f"max_workers={self.max_workers}\n, retries={self.retries}\n, part_dir={self.part_dir}")
+
+    def requests_for(self, id: str, varname: str, x: np.ndarray, y: np.ndarray, times=None) -> list:
+        """Splits a download into griddap requests of at most ``time_chunk`` time steps.
+
+        Args:
+            id (str): PolarWatch ERDDAP dataset ID.
+            varname (str): Variable name.
+            x (np.ndarray): x coordinates to request (e.g., of the grid window).
+            y (np.ndarray): y coordinates to request.
+            times (array-like, optional): Time steps to request. Defaults to None (datasets without time).
+
+        Returns:
+            list: Request URLs, in time order.
+        """
+        if times is None:
+            return [griddap_query(self.server, id, varname, x, y)]
+        times = pd.DatetimeIndex(times).sort_values()
+
+        # A request covers its whole time range, so runs of time steps are split at gaps
+        # (more than 1.5 times the smallest step) as well as every ``time_chunk`` steps
+        steps = np.diff(times.asi8)
+        breaks = np.flatnonzero(steps > 1.5 * steps.min()) + 1 if len(steps) else []
+        chunks = []
+        for run in np.split(np.arange(len(times)), breaks):
+            chunks += [run[i:i + self.time_chunk] for i in range(0, len(run), self.time_chunk)]
+        return [griddap_query(self.server, id, varname, x, y, times[c]) for c in chunks]
+
+    def part_path(self, url: str) -> str:
+        return os.path.join(self.part_dir, hashlib.sha256(url.encode()).hexdigest()[:24] + ".nc")
+
+    def download(self, url: str, id: str = None) -> str:
+        """Downloads one request to its part file, unless it is already there.
+        The bytes downloaded are recorded under ``id`` in the run report.
+
+        Raises:
+            requests.RequestException: If the request still fails after all retries.
+
+        Returns:
+            str: Path of the part file.
+        """
+        path = self.part_path(url)
+        if os.path.exists(path):
+            return path
+
+        tmp = path + ".tmp"
+        for attempt in range(self.retries + 1):
+            try:
+                with self.session.get(url, stream=True, timeout=self.timeout) as resp:
+                    resp.raise_for_status()
+                    with open(tmp, "wb") as f:
+                        for block in resp.iter_content(chunk_size=2**20):
+                            f.write(block)
+                os.replace(tmp, path)
+                if self.report is not None:
+                    self.report.add_bytes(id or url, os.path.getsize(path))
+                return path
+            except requests.RequestException as e:
+                # Client errors other than rate limiting will not succeed on a retry
+                status = e.response.status_code if e.response is not None else None
+                if attempt == self.retries or (status is not None and 400 <= status < 500 and status != 429):
+                    raise
+                time.sleep(self.backoff * 2 ** attempt)
+
+    def fetch(self, id: str, varname: str, x: np.ndarray, y: np.ndarray, times=None,
+              mask_and_scale: bool = True, keep_parts: bool = False) -> xr.Dataset:
+        """Downloads a hyperslab concurrently and assembles it into one Dataset.
+
+        Args:
+            id (str): PolarWatch ERDDAP dataset ID.
+            varname (str): Variable name.
+            x (np.ndarray): x coordinates to request (e.g., of the grid window).
+            y (np.ndarray): y coordinates to request.
+            times (array-like, optional): Time steps to request. Defaults to None (datasets without time).
+            mask_and_scale (bool, optional): Decode packed values to floats. Defaults to True.
+            keep_parts (bool, optional): Keep the part files after assembling them. Defaults to False.
+
+        Raises:
+            requests.RequestException: If a request still fails after all retries. Finished parts are
+                kept, so a rerun only requests the rest.
+
+        Returns:
+            xarray.Dataset: The data, loaded in memory and sorted by time.
+        """
+        urls = self.requests_for(id, varname, x, y, times)
+        os.makedirs(self.part_dir, exist_ok=True)
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            futures = [pool.submit(self.download, url, id) for url in urls]
+        # Every request has finished (or failed) here; raise the first failure
+        paths = [f.result() for f in futures]
+
+        parts = []
+        for path in paths:
+            with xr.open_dataset(path, mask_and_scale=mask_and_scale) as part:
+                parts.append(part[[varname]].load())
+        ds = parts[0] if len(parts) == 1 else xr.concat(parts, dim="time")
+        if times is not None:
+            # A request covers the whole time range of its chunk; keep only the requested steps
+            ds = ds.sortby("time").sel(time=pd.DatetimeIndex(times).sort_values())
+
+        if not keep_parts:
+            for path in paths:
+                os.remove(path)
+        return ds
+
+
+def griddap_query(server: str, id: str, varname: str, x: np.ndarray, y: np.ndarray, times=None) -> str:
+    """Builds an ERDDAP griddap ``.nc`` request for a block of grid coordinates, e.g.
+    ``{server}/{id}.nc?{varname}[(t0):(t1)][(y0):(y1)][(x0):(x1)]``.
+
+    Args:
+        server (str): The base URL of the ERDDAP server.
+        id (str): PolarWatch ERDDAP dataset ID.
+        varname (str): Variable name.
+        x (np.ndarray): x coordinates of the block.
+        y (np.ndarray): y coordinates of the block.
+        times (array-like, optional): Time steps of the block. Defaults to None (datasets without time).
+
+    Returns:
+        str: The request URL.
+    """
+    x, y = np.asarray(x), np.asarray(y)
+    # Values are given in axis order so descending axes (y) stay valid
+    constraint = f"[({y[0]}):({y[-1]})][({x[0]}):({x[-1]})]"
+    if times is not None:
+        times = pd.DatetimeIndex(times)
+        constraint = (f"[({times[0].strftime('%Y-%m-%dT%H:%M:%SZ')}):"
+                      f"({times[-1].strftime('%Y-%m-%dT%H:%M:%SZ')})]") + constraint
+    return f"{server}/{id}.nc?{varname}{constraint}"
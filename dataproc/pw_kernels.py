@@ -0,0 +1,133 @@
+"""
+Title: Region index and extent kernels of the PolarWatch sea ice scripts
+Description: The fused threshold-and-area kernels that reduce sea ice concentration to the extent
+(and area and open-water fraction) of every region in one pass, and the loader of the precompiled
+region index (`RegionIndex` in `pw_data.py`, written by `build_region_index.py`) in the form the
+kernels consume. Shared by `pw_data.py` and the nightly `scripts/update_daily_extent.py`.
+
+Main Classes and Functions:
+- fused_extent: Concentration (..., y, x) -> extent (..., region), block by block.
+- fused_metrics / metric_names: Extents at several thresholds, ice area and open-water fraction.
+- region_matrix: (distinct cells x regions) weight matrix of the CSR region index.
+- load_region_index: Reads a region index file as a dict of its arrays and weight matrix.
+"""
+
+import numpy as np
+
+
+def fused_extent(values: np.ndarray, cells: np.ndarray, weights: np.ndarray, threshold,
+                 valid_max=None, block_bytes: int = 2**23) -> np.ndarray:
+    """Fused threshold-and-area kernel: concentration (..., y, x) -> extent (..., region).
+
+    Processes the time steps in blocks: gathers the cells in use, thresholds them into a
+    boolean block and multiplies it by the (cells x regions) weight matrix. Only one small
+    block is alive at a time, and inputs are never upcast as a whole, so float32 and uint8
+    concentrations are read as they are.
+
+    Args:
+        values (np.ndarray): Sea ice concentration with the grid as the last two dimensions.
+        cells (np.ndarray): Flat indices of the grid cells with a non-zero weight.
+        weights (np.ndarray): Weight matrix (km^2) of shape (len(cells), regions).
+        threshold (float or int): Concentration threshold, in the units of ``values``.
+        valid_max (float or int, optional): Values above it (e.g., flag values of byte-scaled data)
+            are not ice. Defaults to None.
+        block_bytes (int, optional): Approximate size of a thresholded block. Defaults to 8 MiB.
+
+    Returns:
+        np.ndarray: Extent with shape ``values.shape[:-2] + (regions,)``.
+    """
+    lead = values.shape[:-2]
+    flat = values.reshape((-1, values.shape[-2] * values.shape[-1]))
+    out = np.empty((flat.shape[0], weights.shape[1]))
+    step = max(1, block_bytes // (8 * max(1, len(cells))))
+    for start in range(0, flat.shape[0], step):
+        # NaN compares False, so missing cells drop out like in the skipna sum
+        block = flat[start:start + step, cells]
+        ice = block >= threshold
+        if valid_max is not None:
+            ice &= block <= valid_max
+        out[start:start + step] = ice @ weights
+    return out.reshape(lead + (weights.shape[1],))
+
+
+def metric_names(thresholds) -> list:
+    """Names of the `fused_metrics` outputs: extent_{percent} per threshold, area and open_water_fraction."""
+    return [f"extent_{round(t * 100)}" for t in thresholds] + ["area", "open_water_fraction"]
+
+
+def fused_metrics(values: np.ndarray, cells: np.ndarray, weights: np.ndarray, thresholds,
+                  valid_max=None, scale: float = 1.0, block_bytes: int = 2**23) -> np.ndarray:
+    """Fused multi-metric kernel: concentration (..., y, x) -> metrics (..., metric, region).
+
+    Like `fused_extent`, but each gathered block is reduced to all metrics before the next
+    block is read: the extent (km^2) at every threshold, the sea ice area (concentration x
+    cell area, km^2) and the open-water fraction (1 - area / area of the cells with data).
+
+    Args:
+        values (np.ndarray): Sea ice concentration with the grid as the last two dimensions.
+        cells (np.ndarray): Flat indices of the grid cells with a non-zero weight.
+        weights (np.ndarray): Weight matrix (km^2) of shape (len(cells), regions).
+        thresholds (list): Concentration thresholds, in the units of ``values``.
+        valid_max (float or int, optional): Values above it (e.g., flag values of byte-scaled data)
+            are not ice and carry no data. Defaults to None.
+        scale (float, optional): Concentration (0-1) per unit of ``values`` (e.g., 0.01 for
+            byte-scaled data). Defaults to 1.
+        block_bytes (int, optional): Approximate size of a gathered block. Defaults to 8 MiB.
+
+    Returns:
+        np.ndarray: Metrics with shape ``values.shape[:-2] + (len(thresholds) + 2, regions)``,
+        in the order of `metric_names`.
+    """
+    lead = values.shape[:-2]
+    flat = values.reshape((-1, values.shape[-2] * values.shape[-1]))
+    n = len(thresholds)
+    out = np.empty((flat.shape[0], n + 2, weights.shape[1]))
+    step = max(1, block_bytes // (8 * max(1, len(cells))))
+    for start in range(0, flat.shape[0], step):
+        block = flat[start:start + step, cells]
+        # NaN compares False, so missing cells carry no data and no ice
+        valid = block >= 0
+        if valid_max is not None:
+            valid &= block <= valid_max
+        for i, threshold in enumerate(thresholds):
+            out[start:start + step, i] = ((block >= threshold) & valid) @ weights
+        area = (np.where(valid, block, 0).astype(np.float32) @ weights) * scale
+        with np.errstate(invalid="ignore", divide="ignore"):
+            out[start:start + step, n + 1] = 1 - area / (valid @ weights)
+        out[start:start + step, n] = area
+    return out.reshape(lead + (n + 2, weights.shape[1]))
+
+
+def region_matrix(ptr: np.ndarray, cell_idx: np.ndarray, weights: np.ndarray) -> tuple:
+    """Converts the CSR rows of a region index to the (distinct cells x regions) matrix the kernels consume.
+
+    Args:
+        ptr (np.ndarray): Row pointers, of length regions + 1.
+        cell_idx (np.ndarray): Flat grid cell index of each non-zero entry.
+        weights (np.ndarray): Area weight (km^2) of each non-zero entry.
+
+    Returns:
+        tuple: Flat indices of the distinct cells, and the weight matrix of shape (len(cells), regions).
+    """
+    cells, inverse = np.unique(cell_idx, return_inverse=True)
+    matrix = np.zeros((len(cells), len(ptr) - 1))
+    np.add.at(matrix, (inverse, np.repeat(np.arange(len(ptr) - 1), np.diff(ptr))), weights)
+    return cells, matrix
+
+
+def load_region_index(path: str) -> dict:
+    """Reads a region index written by `RegionIndex.save` (e.g., data/region_index.npz).
+
+    Args:
+        path (str): Region index file.
+
+    Returns:
+        dict: names (regions), ptr, cell_idx and weights (CSR rows), x and y (grid), key (or None),
+            and cells and matrix (see `region_matrix`).
+    """
+    with np.load(path) as f:
+        index = {"names": f["names"].tolist(), "ptr": f["ptr"].astype(np.int64),
+                 "cell_idx": f["cell_idx"].astype(np.int64), "weights": f["weights"].astype(np.float64),
+                 "x": f["x"], "y": f["y"], "key": str(f["key"]) or None}
+    index["cells"], index["matrix"] = region_matrix(index["ptr"], index["cell_idx"], index["weights"])
+    return index
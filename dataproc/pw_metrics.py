@@ -0,0 +1,140 @@
+"""
+Title: Run reports for the PolarWatch sea ice scripts
+Description: Collects per-stage wall time, bytes fetched per dataset ID, Dask task and chunk counts,
+peak memory and errors of a run, and writes them as a JSON run report and, optionally, as a
+Prometheus text file (e.g., for the node_exporter textfile collector), so runs of the daily job can
+be tracked for latency and data-volume trends.
+
+Stage times are wall times of the instrumented blocks. Dask work runs where a result is computed,
+so lazy stages (e.g., threshold) only include building the graph; the compute is timed by the stage
+that triggers it (e.g., reduce). Peak memory is the peak resident set size of this process; memory
+of distributed Dask workers is not included.
+
+Main Classes and Functions:
+- RunReport: Stage timer and counters of one run, with JSON and Prometheus output.
+"""
+
+import datetime
+import json
+import os
+import resource
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+
+class RunReport:
+    """Per-stage timings and counters of one run."""
+
+    def __init__(self, name: str):
+        """
+        Args:
+            name (str): Name of the run (e.g., the script name); used as the `run` label.
+        """
+        self.name = name
+        self.started = datetime.datetime.now(datetime.timezone.utc)
+        self._t0 = time.perf_counter()
+        self.stages = {}
+        self.bytes_fetched = {}
+        self.dask = {}
+        self.errors = []
+        self._lock = threading.Lock()
+
+    def __str__(self):
+        return (f"RunReport:\nname={self.name}\n, stages={self.stages}\n, bytes_fetched={self.bytes_fetched}\n, "
+                f"dask={self.dask}\n, errors={self.errors}")
+
+    @staticmethod
+    def peak_rss_mb() -> float:
+        """Peak resident set size of this process, in MB."""
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in bytes on macOS and in KB elsewhere
+        return rss / 2**20 if sys.platform == "darwin" else rss / 2**10
+
+    @contextmanager
+    def stage(self, name: str):
+        """Times a block as stage ``name``; repeated stages add up (thread-safe, e.g. for prefetch reads)."""
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self._lock:
+                stage = self.stages.setdefault(name, {"seconds": 0.0, "calls": 0})
+                stage["seconds"] += time.perf_counter() - t0
+                stage["calls"] += 1
+                stage["peak_rss_mb"] = round(self.peak_rss_mb(), 1)
+
+    def add_bytes(self, id: str, nbytes: int):
+        """Adds bytes fetched for a dataset ID (thread-safe, e.g. for concurrent downloads)."""
+        with self._lock:
+            self.bytes_fetched[id] = self.bytes_fetched.get(id, 0) + int(nbytes)
+
+    def track_dask(self, label: str, obj):
+        """Records the number of tasks and chunks of a (lazy) xarray or Dask object.
+
+        Objects that are not backed by Dask are recorded with zero tasks and chunks.
+        """
+        tasks, chunks = 0, 0
+        variables = obj.variables.values() if hasattr(obj, "data_vars") else [getattr(obj, "variable", obj)]
+        for var in variables:
+            data = getattr(var, "data", var)
+            if hasattr(data, "__dask_graph__") and data.__dask_graph__() is not None:
+                chunks += data.npartitions
+        if hasattr(obj, "__dask_graph__") and obj.__dask_graph__() is not None:
+            tasks = len(obj.__dask_graph__())
+        self.dask[label] = {"tasks": tasks, "chunks": chunks}
+
+    def error(self, message: str):
+        """Records an error message."""
+        self.errors.append(message)
+
+    def to_dict(self) -> dict:
+        """Returns the report as a JSON-serializable dict."""
+        return {
+            "run": self.name,
+            "started": self.started.isoformat(timespec="seconds"),
+            "seconds": round(time.perf_counter() - self._t0, 3),
+            "peak_rss_mb": round(self.peak_rss_mb(), 1),
+            "stages": {k: dict(v, seconds=round(v["seconds"], 3)) for k, v in self.stages.items()},
+            "bytes_fetched": dict(self.bytes_fetched),
+            "dask": dict(self.dask),
+            "errors": list(self.errors),
+        }
+
+    def to_prometheus(self) -> str:
+        """Returns the report in the Prometheus text exposition format."""
+        report = self.to_dict()
+        run = f'run="{self.name}"'
+        metrics = [
+            ("pw_run_seconds", "Wall time of the run.", [(run, report["seconds"])]),
+            ("pw_run_start_timestamp_seconds", "Start time of the run.", [(run, self.started.timestamp())]),
+            ("pw_run_peak_rss_bytes", "Peak resident set size of the run.",
+             [(run, int(report["peak_rss_mb"] * 2**20))]),
+            ("pw_run_errors", "Errors recorded during the run.", [(run, len(self.errors))]),
+            ("pw_stage_seconds", "Wall time per stage.",
+             [(f'{run},stage="{k}"', v["seconds"]) for k, v in report["stages"].items()]),
+            ("pw_fetched_bytes", "Bytes fetched per dataset ID.",
+             [(f'{run},dataset="{k}"', v) for k, v in report["bytes_fetched"].items()]),
+            ("pw_dask_tasks", "Dask tasks per tracked object.",
+             [(f'{run},object="{k}"', v["tasks"]) for k, v in report["dask"].items()]),
+            ("pw_dask_chunks", "Dask chunks per tracked object.",
+             [(f'{run},object="{k}"', v["chunks"]) for k, v in report["dask"].items()]),
+        ]
+        lines = []
+        for name, help, samples in metrics:
+            lines += [f"# HELP {name} {help}", f"# TYPE {name} gauge"]
+            lines += [f"{name}{{{labels}}} {value}" for labels, value in samples]
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: str, prometheus_path: str = None):
+        """Writes the JSON run report and, optionally, the Prometheus text file (atomically)."""
+        for out, text in ((path, json.dumps(self.to_dict(), indent=1)),
+                          (prometheus_path, self.to_prometheus() if prometheus_path else None)):
+            if out is None:
+                continue
+            os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+            tmp = out + ".tmp"
+            with open(tmp, "w") as f:
+                f.write(text)
+            os.replace(tmp, out)
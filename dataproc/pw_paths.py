@@ -0,0 +1,16 @@
+"""
+Title: Shared file locations of the PolarWatch sea ice scripts
+Description: Paths of the data files that one script writes and another reads, anchored to the
+repository root. The dataproc/ scripts run from dataproc/ (for their resources) and the nightly
+scripts/update_daily_extent.py from the repository root, so relative paths would point to different
+files.
+"""
+
+import os
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+DATA_DIR = os.path.join(ROOT, 'data')  # Published CSV/JSON files and the nightly inputs
+
+BASELINE_DIST = os.path.join(DATA_DIR, 'bs_extent_dist.npz')  # Sorted 1991-2020 baseline per region and day
+EXTENT_HISTORY = os.path.join(DATA_DIR, 'extent_history')  # Daily extent history written by backfill_extent.py
+EVENTS_STATE = os.path.join(DATA_DIR, 'ice_events_state.json')  # Freeze-up/break-up detector state (pw_events.py)
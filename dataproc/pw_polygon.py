@@ -0,0 +1,161 @@
+"""
+Title: Sea ice extent of arbitrary polygons
+Description: Answers the daily sea ice extent of any (GeoJSON) polygon, such as a management subarea
+or a lease block, from the local sea ice concentration cube. Each polygon is rasterized once onto
+the grid window covering it, and the masks are kept in an LRU cache. Served over HTTP by
+`serve_extent.py`.
+
+Main Classes and Functions:
+- PolygonExtentService: Daily sea ice extent of polygons from the local SIC cube, with an LRU cache of
+  rasterized polygon masks.
+"""
+
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+import geopandas as gpd
+from shapely.geometry import shape as to_shape
+import xarray as xr
+
+from pw_data import RegionIndex, grid_window
+
+
+class PolygonExtentService:
+    """Daily sea ice extent of arbitrary polygons, answered from the local SIC cube.
+
+    A polygon (GeoJSON geometry, Feature or FeatureCollection) is rasterized once onto
+    the grid window covering it, as a single-region `RegionIndex`; the most recently
+    used masks are kept in an LRU cache keyed by the GeoJSON text, so a repeated polygon
+    is not even parsed again. A query then
+    reads only that window of the cube for the requested days and reduces it with the
+    fused kernel. With ``preload``, the cube is held in memory (use ``raw=True`` data,
+    one byte per cell and day), so repeated polygons need no disk access at all.
+
+    Safe to query from several threads (e.g., `serve_extent.py`).
+    """
+
+    def __init__(self, sic: "SIC25k", threshold=0.15, mask_cache_size: int = 128, preload: bool = False):
+        """
+        Args:
+            sic (SIC25k): Sea ice concentration, typically read from a local `GridCache`, with the
+                grid cell area loaded (`load_area`).
+            threshold (float, optional): Default threshold for sea ice concentration (0-1). Defaults to 0.15.
+            mask_cache_size (int, optional): Polygon masks kept in memory. Defaults to 128.
+            preload (bool, optional): Load the cube into memory once. Defaults to False.
+
+        Raises:
+            ValueError: If the grid cell area is not loaded.
+        """
+        if sic.area is None:
+            raise ValueError("Grid cell area is not loaded")
+        self.sic = sic
+        self.threshold = threshold
+        self.mask_cache_size = mask_cache_size
+        self.area = sic.area.squeeze(drop=True).load()
+        self.preload = preload
+        self.ds = sic.ds
+        if preload:
+            with sic.report.stage("open"):
+                self.ds = sic.ds.compute()
+        self._masks = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __str__(self):
+        return (f"PolygonExtentService:\nid={self.sic.id}\n, threshold={self.threshold}\n, "
+                f"cache={self.cache_info()}\n, preload={self.preload}")
+
+    def cache_info(self) -> dict:
+        """Number of cached polygon masks and the cache size."""
+        return {"masks": len(self._masks), "maxsize": self.mask_cache_size}
+
+    @staticmethod
+    def read_geojson(geojson, crs: str = "EPSG:4326") -> gpd.GeoDataFrame:
+        """Reads a GeoJSON geometry, Feature or FeatureCollection (dict or JSON text).
+
+        Args:
+            geojson (dict or str): The polygon(s).
+            crs (str, optional): CRS of the coordinates. Defaults to EPSG:4326 (lon/lat, as in RFC 7946).
+
+        Raises:
+            ValueError: If the GeoJSON holds no geometry.
+
+        Returns:
+            gpd.GeoDataFrame: The geometries.
+        """
+        if isinstance(geojson, str):
+            geojson = json.loads(geojson)
+        kind = geojson.get("type")
+        if kind == "FeatureCollection":
+            geoms = [f["geometry"] for f in geojson.get("features", [])]
+        elif kind == "Feature":
+            geoms = [geojson["geometry"]]
+        else:
+            geoms = [geojson]
+        geoms = [to_shape(g) for g in geoms if g]
+        if not geoms:
+            raise ValueError("GeoJSON holds no geometry")
+        return gpd.GeoDataFrame(geometry=geoms, crs=crs)
+
+    def mask(self, geojson, crs: str = "EPSG:4326") -> tuple:
+        """Returns the grid window and single-region `RegionIndex` of a polygon, from the LRU cache.
+
+        Args:
+            geojson (dict or str): GeoJSON geometry, Feature or FeatureCollection.
+            crs (str, optional): CRS of the coordinates. Defaults to EPSG:4326.
+
+        Raises:
+            ValueError: If the polygon does not cover any grid cell.
+
+        Returns:
+            tuple: (window, index), the window as ``isel`` index slices.
+        """
+        text = geojson if isinstance(geojson, str) else json.dumps(geojson, sort_keys=True)
+        key = hashlib.sha256(f"{crs}|{text}".encode()).hexdigest()
+        with self._lock:
+            if key in self._masks:
+                self._masks.move_to_end(key)
+                return self._masks[key]
+
+        shp = self.read_geojson(geojson, crs).to_crs(self.sic.crs)
+        with self.sic.report.stage("clip"):
+            window = grid_window(self.area[self.sic.grids['x']].values, self.area[self.sic.grids['y']].values,
+                                 [shp], self.sic.crs, self.sic.grids)
+            index = RegionIndex.build({"polygon": shp}, self.area.isel(window))
+        if len(index.cell_idx) == 0:
+            raise ValueError("Polygon does not cover the center of any grid cell")
+
+        with self._lock:
+            self._masks[key] = (window, index)
+            self._masks.move_to_end(key)
+            while len(self._masks) > self.mask_cache_size:
+                self._masks.popitem(last=False)
+        return window, index
+
+    def extent(self, geojson, dates: list, threshold=None, crs: str = "EPSG:4326") -> xr.DataArray:
+        """Computes the daily sea ice extent (km^2) of a polygon.
+
+        Args:
+            geojson (dict or str): GeoJSON geometry, Feature or FeatureCollection; several
+                geometries are treated as one region.
+            dates (list): List of two dates (start and end) in 'YYYY-MM-DD' format.
+            threshold (float, optional): Threshold for sea ice concentration (0-1). Defaults to the
+                service threshold.
+            crs (str, optional): CRS of the coordinates. Defaults to EPSG:4326.
+
+        Raises:
+            ValueError: If the polygon does not cover any grid cell.
+
+        Returns:
+            xr.DataArray: Sea ice extent over time, with the polygon's ``area_km2`` and ``cells``
+                as attributes.
+        """
+        window, index = self.mask(geojson, crs)
+        block = self.ds.isel(window).sel(time=slice(dates[0], dates[1]))
+        kwargs = self.sic.kernel_threshold(self.threshold if threshold is None else threshold)
+        with self.sic.report.stage("reduce"):
+            ext = index.extent(block, **kwargs).isel(region=0, drop=True).load()
+        ext.name = "seaice_extent"
+        ext.attrs = {"area_km2": float(index.weights.sum()), "cells": int(len(index.cell_idx))}
+        return ext
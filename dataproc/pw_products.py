@@ -0,0 +1,236 @@
+"""
+Title: Per-cell sea ice products of the daily concentration cube
+Description: Streams the daily sea ice concentration one month at a time and keeps, for every
+September-August season, the monthly ice frequency, the ice days per month and season, and the
+first and last ice dates of each grid cell, in one compressed NetCDF file per season. New days
+extend the current season in place.
+
+Main Classes and Functions:
+- IceProducts: Per-cell monthly ice frequency, ice days and first/last ice dates, one NetCDF file per season.
+"""
+
+import hashlib
+import json
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from pw_baseline import water_year
+from pw_engine import Prefetcher
+
+logger = logging.getLogger(__name__)
+
+
+class IceProducts:
+    """Per-cell sea ice products of the daily cube, streamed one month at a time.
+
+    For every September-August season (labeled by its water year, see `water_year`), one
+    compressed NetCDF file ``{root}/ice_products_{season}.nc`` holds, on the grid (window)
+    of the data:
+
+        ice_frequency   (time, y, x)  share of the valid days of each month with ice
+        ice_days_month  (time, y, x)  days with ice (concentration >= threshold) per month
+        valid_days_month(time, y, x)  days with a valid concentration per month
+        ice_days        (y, x)        days with ice in the season
+        valid_days      (y, x)        days with a valid concentration in the season
+        first_ice       (y, x)        first day with ice in the season (NaT without ice)
+        last_ice        (y, x)        last day with ice in the season (NaT without ice)
+
+    Days are thresholded with `SIC25k.format_sic` and read one month at a time through a
+    `Prefetcher`, so memory stays constant whatever the length of the record. A manifest
+    (``_manifest.json``) records the last day processed in each season; ``update`` only
+    reads days after it, and the counts and dates of a season are extended in place, so
+    earlier seasons are never reprocessed.
+    """
+
+    VARIABLES = ("ice_frequency", "ice_days_month", "valid_days_month", "ice_days", "valid_days",
+                 "first_ice", "last_ice")
+
+    def __init__(self, sic: "SIC25k", root: str, threshold=0.15, prefetch: int = 2, ds: xr.DataArray = None):
+        """
+        Args:
+            sic (SIC25k): Daily sea ice concentration (e.g., opened with ``window_shapes`` for the Alaska window).
+            root (str): Output directory.
+            threshold (float, optional): Sea ice concentration threshold (0-1) for an ice day. Defaults to 0.15.
+            prefetch (int, optional): Months read ahead. Defaults to 2.
+            ds (xr.DataArray, optional): Data to process instead of ``sic.ds``, in the same representation
+                and on the same grid (e.g., CDR days completed with NRT days by `stitch_sources`).
+                Defaults to None.
+        """
+        self.sic = sic
+        self.ds = sic.ds if ds is None else ds
+        self.root = root
+        self.threshold = threshold
+        self.prefetch = prefetch
+        self.manifest_path = os.path.join(root, "_manifest.json")
+        # Seasons computed from another dataset, grid or threshold are not extended
+        self.key = hashlib.sha256(f"{sic.id}:{sic.window}:{threshold}".encode()).hexdigest()
+
+    def __str__(self):
+        return (f"IceProducts:\nroot={self.root}\n, threshold={self.threshold}\n, "
+                f"seasons={sorted(self.read_manifest()['seasons'])}")
+
+    def season_path(self, season) -> str:
+        return os.path.join(self.root, f"ice_products_{season}.nc")
+
+    def read_manifest(self) -> dict:
+        """Returns the manifest: settings key and season -> {start, end, days}.
+        A manifest written with other settings is returned empty."""
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path) as f:
+                manifest = json.load(f)
+            if manifest.get("key") == self.key:
+                return manifest
+        return {"key": self.key, "seasons": {}}
+
+    def _write_manifest(self, manifest: dict):
+        tmp = self.manifest_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(manifest, f, indent=1, sort_keys=True)
+        os.replace(tmp, self.manifest_path)
+
+    def read(self, season) -> xr.Dataset:
+        """Opens the products of a season (water year, e.g. 2024 for Sep 2023 - Aug 2024)."""
+        return xr.open_dataset(self.season_path(season))
+
+    def _empty(self, season: int, block: xr.DataArray) -> dict:
+        x_dim, y_dim = block.rio.x_dim, block.rio.y_dim
+        shape = (block.sizes[y_dim], block.sizes[x_dim])
+        return {"months": pd.date_range(f"{season - 1}-09-01", periods=12, freq="MS"),
+                "x": block[x_dim].values, "y": block[y_dim].values, "dims": (y_dim, x_dim),
+                "ice_days_month": np.zeros((12,) + shape, dtype=np.int16),
+                "valid_days_month": np.zeros((12,) + shape, dtype=np.int16),
+                "first_ice": np.full(shape, np.datetime64("NaT"), dtype="datetime64[D]"),
+                "last_ice": np.full(shape, np.datetime64("NaT"), dtype="datetime64[D]")}
+
+    def _load(self, season: int) -> dict:
+        with self.read(season) as ds:
+            ds = ds.load()
+        y_dim, x_dim = ds["ice_days"].dims
+        return {"months": pd.DatetimeIndex(ds["time"].values), "x": ds[x_dim].values, "y": ds[y_dim].values,
+                "dims": (y_dim, x_dim),
+                "ice_days_month": ds["ice_days_month"].values.astype(np.int16),
+                "valid_days_month": ds["valid_days_month"].values.astype(np.int16),
+                "first_ice": ds["first_ice"].values.astype("datetime64[D]"),
+                "last_ice": ds["last_ice"].values.astype("datetime64[D]")}
+
+    def _accumulate(self, state: dict, block: xr.DataArray):
+        """Adds one month of daily concentrations to the season state."""
+        y_dim, x_dim = state["dims"]
+        block = block.transpose("time", y_dim, x_dim)
+        if self.sic.raw:
+            valid = (block <= self.ds.attrs["valid_max"]).values
+            ice = self.sic.format_sic(block, self.threshold).values.astype(bool)
+        else:
+            valid = block.notnull().values
+            ice = self.sic.format_sic(block, self.threshold).values == 1
+
+        month = state["months"].get_loc(pd.Timestamp(block["time"].values[0]).to_period("M").start_time)
+        state["ice_days_month"][month] += ice.sum(axis=0, dtype=np.int16)
+        state["valid_days_month"][month] += valid.sum(axis=0, dtype=np.int16)
+
+        days = block["time"].values.astype("datetime64[D]")
+        has = ice.any(axis=0)
+        first = np.where(has, days[ice.argmax(axis=0)], np.datetime64("NaT"))
+        last = np.where(has, days[len(days) - 1 - ice[::-1].argmax(axis=0)], np.datetime64("NaT"))
+        state["first_ice"] = np.fmin(state["first_ice"], first)
+        state["last_ice"] = np.fmax(state["last_ice"], last)
+
+    def _write(self, season: int, state: dict):
+        y_dim, x_dim = state["dims"]
+        ice_m, valid_m = state["ice_days_month"], state["valid_days_month"]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            frequency = np.where(valid_m > 0, ice_m / valid_m, np.nan).astype(np.float32)
+        dims3 = ("time", y_dim, x_dim)
+        ds = xr.Dataset(
+            {"ice_frequency": (dims3, frequency),
+             "ice_days_month": (dims3, ice_m),
+             "valid_days_month": (dims3, valid_m),
+             "ice_days": ((y_dim, x_dim), ice_m.sum(axis=0, dtype=np.int16)),
+             "valid_days": ((y_dim, x_dim), valid_m.sum(axis=0, dtype=np.int16)),
+             "first_ice": ((y_dim, x_dim), state["first_ice"].astype("datetime64[ns]")),
+             "last_ice": ((y_dim, x_dim), state["last_ice"].astype("datetime64[ns]"))},
+            coords={"time": state["months"], y_dim: state["y"], x_dim: state["x"]},
+            attrs={"season": f"{season - 1}-09-01/{season}-08-31", "source": self.sic.id,
+                   "threshold": self.threshold})
+        ds = ds.rio.write_crs(self.sic.crs)
+        ny, nx = len(state["y"]), len(state["x"])
+        encoding = {v: {"zlib": True, "complevel": 4,
+                        "chunksizes": (1, ny, nx) if ds[v].ndim == 3 else (ny, nx)}
+                    for v in self.VARIABLES}
+        for v in ("first_ice", "last_ice"):
+            # Whole days; cells without ice (NaT) are stored as the fill value
+            encoding[v].update(units="days since 1970-01-01", dtype="int32", _FillValue=np.iinfo(np.int32).min)
+        path = self.season_path(season)
+        tmp = path + ".tmp"
+        ds.to_netcdf(tmp, encoding=encoding)
+        os.replace(tmp, path)
+
+    def update(self, start: str = None, end: str = None, rebuild: bool = False) -> list:
+        """Processes the days of [start, end] that are not in the products yet.
+
+        Days after the last processed day of their season extend that season; seasons with
+        no processed days are started. With ``rebuild``, the seasons overlapping [start, end]
+        are recomputed from their first day (e.g., after the source data were reprocessed).
+
+        Args:
+            start (str, optional): First date ('YYYY-MM-DD'). Defaults to the first day of the data.
+            end (str, optional): Last date ('YYYY-MM-DD'). Defaults to the last day of the data.
+            rebuild (bool, optional): Recompute the overlapping seasons. Defaults to False.
+
+        Returns:
+            list: Seasons that were written.
+        """
+        os.makedirs(self.root, exist_ok=True)
+        manifest = self.read_manifest()
+        times = pd.DatetimeIndex(self.ds["time"].values)
+        lo = times[0] if start is None else pd.Timestamp(start)
+        hi = times[-1] if end is None else pd.Timestamp(end)
+        seasons = water_year(times)
+        if rebuild:
+            # Whole seasons, so none is left half recomputed
+            touched = set(seasons[(times >= lo) & (times <= hi)])
+            for season in touched:
+                manifest["seasons"].pop(str(season), None)
+            keep = np.isin(seasons, list(touched))
+        else:
+            keep = (times >= lo) & (times <= hi)
+        done = np.array([str(s) in manifest["seasons"] and t <= pd.Timestamp(manifest["seasons"][str(s)]["end"])
+                         for s, t in zip(seasons, times)], dtype=bool)
+        todo = times[keep & ~done]
+        if todo.empty:
+            return []
+
+        # One window per month of new days; a month never spans two seasons
+        months = todo.to_period("M")
+        windows = [(todo[months == m][0].strftime("%Y-%m-%d"), todo[months == m][-1].strftime("%Y-%m-%d"))
+                   for m in months.unique()]
+
+        written, season, state = [], None, None
+        for window, block in Prefetcher(self.ds, windows, depth=self.prefetch, report=self.sic.report):
+            label = int(water_year([window[0]])[0])
+            if label != season:
+                if state is not None:
+                    self._checkpoint(manifest, season, state, written)
+                season = label
+                state = self._load(season) if str(season) in manifest["seasons"] else self._empty(season, block)
+                state["days"] = manifest["seasons"].get(str(season), {}).get("days", 0)
+                state["start"] = manifest["seasons"].get(str(season), {}).get("start", window[0])
+            with self.sic.report.stage("reduce"):
+                self._accumulate(state, block)
+            state["days"] += block.sizes["time"]
+            state["end"] = window[1]
+        self._checkpoint(manifest, season, state, written)
+        return written
+
+    def _checkpoint(self, manifest: dict, season: int, state: dict, written: list):
+        """Writes a season's file, then records it in the manifest."""
+        with self.sic.report.stage("write"):
+            self._write(season, state)
+            manifest["seasons"][str(season)] = {"start": state["start"], "end": state["end"], "days": state["days"]}
+            self._write_manifest(manifest)
+        logger.info("Wrote ice products of season %s (%s to %s)", season, state["start"], state["end"])
+        written.append(season)
@@ -0,0 +1,95 @@
+"""
+Title: Pre-shaped data of the region pages of the site
+Description: Builds one small JSON document per region with everything the Quarto region pages plot,
+already aligned on the September-August month_day axis: the baseline mean and +/- 1 std band, the
+daily extent and anomaly of the current and previous seasons, the latest day and the annualized extent.
+
+Layout of the document (arrays are aligned on ``month_day``, null where there is no value):
+    region, updated (last day with data), water_year (season of the last day with data, named by its end year),
+    total_area_km2, month_day (Sep 01 - Aug 31, with Feb 29),
+    baseline {mean, std, lower, upper}, last {extent, anomaly}, this {extent, anomaly},
+    latest {date, month_day, extent}, annual {year, extent}
+
+Main Classes and Functions:
+- site_data: Builds the document of a region from its daily extent, baseline and annualized tables.
+- write_site_data: Writes a document as compact JSON (atomically).
+"""
+
+import json
+import os
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from pw_baseline import water_year
+
+# Categories of the x axis of the daily plots, from September 1 to August 31 with Feb 29
+MONTH_DAYS = pd.date_range("2023-09-01", "2024-08-31", freq="D").strftime("%m-%d")
+
+
+def _values(series: pd.Series, digits: int = 1) -> list:
+    """Rounded values as a list, NaN as None (JSON null)."""
+    values = np.round(np.asarray(series, dtype=np.float64), digits)
+    return [None if np.isnan(v) else v for v in values.tolist()]
+
+
+def _season(daily: pd.DataFrame, season: int, baseline: pd.DataFrame) -> dict:
+    """Extent and anomaly of one season, aligned on ``MONTH_DAYS``."""
+    days = daily[(daily["date"] >= f"{season - 1}-09-01") & (daily["date"] <= f"{season}-08-31")]
+    days = days.set_index(days["date"].dt.strftime("%m-%d")).reindex(MONTH_DAYS)
+    if "anomaly" in days:
+        anomaly = days["anomaly"]
+    else:
+        anomaly = days["seaice_extent"] - baseline["seaice_extent_mean"]
+    return {"extent": _values(days["seaice_extent"]), "anomaly": _values(anomaly)}
+
+
+def site_data(region: str, daily: pd.DataFrame, baseline: pd.DataFrame, annual: pd.DataFrame,
+              total_area: float = None, today=None) -> dict:
+    """Builds the page data of a region.
+
+    Args:
+        region (str): Region name.
+        daily (pd.DataFrame): Daily rows with date and seaice_extent columns, and anomaly if the
+            daily update precomputed it. Only the current and previous seasons are used.
+        baseline (pd.DataFrame): Baseline statistics (bs_extent_{name}.csv) with month_day,
+            seaice_extent_mean and seaice_extent_std columns.
+        annual (pd.DataFrame): Annualized extent (annualized_extent_{name}.csv) with year and extent columns.
+        total_area (float, optional): Area of the region (km^2). Defaults to None.
+        today (optional): Day that sets the current season when there are no data. Defaults to today.
+
+    Returns:
+        dict: Page data, see the module docstring.
+    """
+    daily = daily.assign(date=pd.to_datetime(daily["date"])).dropna(subset=["seaice_extent"])
+    # The current season is the one of the last day with data, so the pages still show the two
+    # latest seasons when the data lag behind the calendar (e.g., after a failed update)
+    last_day = daily["date"].max() if len(daily) else (date.today() if today is None else today)
+    season = int(water_year([last_day])[0])
+    baseline = baseline.set_index("month_day").reindex(MONTH_DAYS)
+    mean, std = baseline["seaice_extent_mean"], baseline["seaice_extent_std"]
+
+    this = daily[daily["date"] >= f"{season - 1}-09-01"]
+    latest = this.loc[this["date"].idxmax()] if len(this) else None
+    return {"region": region,
+            "updated": None if daily.empty else daily["date"].max().strftime("%Y-%m-%d"),
+            "water_year": season,
+            "total_area_km2": None if total_area is None else round(float(total_area), 2),
+            "month_day": MONTH_DAYS.tolist(),
+            "baseline": {"mean": _values(mean), "std": _values(std),
+                         "lower": _values((mean - std).clip(lower=0)), "upper": _values(mean + std)},
+            "last": _season(daily, season - 1, baseline),
+            "this": _season(daily, season, baseline),
+            "latest": None if latest is None else {"date": latest["date"].strftime("%Y-%m-%d"),
+                                                   "month_day": latest["date"].strftime("%m-%d"),
+                                                   "extent": round(float(latest["seaice_extent"]), 1)},
+            "annual": {"year": annual["year"].astype(int).tolist(), "extent": _values(annual["extent"])}}
+
+
+def write_site_data(path: str, data: dict):
+    """Writes page data as compact JSON (atomically)."""
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f, separators=(",", ":"))
+    os.replace(tmp, path)
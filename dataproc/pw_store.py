@@ -0,0 +1,396 @@
+"""
+Title: Regional Sea Ice Extent Store
+Description: Storage for the daily regional sea ice extent series produced by the PolarWatch scripts.
+
+Layout:
+    {root}/{region}/{YYYY-MM}.nc   one NetCDF partition per region and month, indexed by date
+    {root}/{region}/_manifest.json last stored date, per-partition row counts and, per preferred
+                                   source, the date through which stored days were checked against it
+
+Rows are keyed by (region, date). An optional ``source`` column records the product each day was
+computed from (e.g., the CDR or NRT dataset ID), so days can be superseded month by month when a
+preferred product catches up (`stale_months`). Writes are upserts: new values replace stored values for the
+same date, so rerunning an update is idempotent. Each partition and the manifest are written to a
+temporary file and moved into place, so an interrupted run never leaves a partial file behind.
+
+Main Classes and Functions:
+- ExtentStore: Partitioned, idempotent (region, date) store with O(1) last-date lookup, per-day source
+  supersession and CSV export.
+- ExtentPyramid: Weekly, monthly and water-year means of the daily values of an `ExtentStore`
+  ({root}/_pyramid/{region}/{level}.nc), updated incrementally for the periods a date range touches.
+"""
+
+import json
+import os
+
+import pandas as pd
+import xarray as xr
+
+from pw_baseline import water_year
+
+
+class ExtentStore:
+    """Month-partitioned NetCDF store of daily regional values keyed by (region, date)."""
+
+    def __init__(self, root: str):
+        """
+        Args:
+            root (str): Root directory of the store.
+        """
+        self.root = root
+
+    def __str__(self):
+        return f"ExtentStore:\nroot={self.root}\n, regions={self.regions()}"
+
+    def regions(self) -> list:
+        """Returns the regions that have data in the store."""
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(r for r in os.listdir(self.root)
+                      if os.path.exists(self._manifest_path(r)))
+
+    def _manifest_path(self, region: str) -> str:
+        return os.path.join(self.root, region, "_manifest.json")
+
+    def partition_path(self, region: str, month: str) -> str:
+        return os.path.join(self.root, region, f"{month}.nc")
+
+    def read_manifest(self, region: str) -> dict:
+        """Returns the manifest of a region: last_date and partition -> row count."""
+        path = self._manifest_path(region)
+        if not os.path.exists(path):
+            return {"last_date": None, "partitions": {}}
+        with open(path) as f:
+            return json.load(f)
+
+    def _write_manifest(self, region: str, manifest: dict):
+        path = self._manifest_path(region)
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(manifest, f, indent=1, sort_keys=True)
+        os.replace(tmp, path)
+
+    def last_date(self, region: str):
+        """Returns the last stored date of a region (pd.Timestamp), or None if the region is empty."""
+        last = self.read_manifest(region)["last_date"]
+        return None if last is None else pd.Timestamp(last)
+
+    def read_partition(self, region: str, month: str) -> pd.DataFrame:
+        """Reads one month partition as a DataFrame indexed by date (empty if it does not exist)."""
+        path = self.partition_path(region, month)
+        if not os.path.exists(path):
+            return pd.DataFrame(index=pd.DatetimeIndex([], name="date"))
+        with xr.open_dataset(path) as ds:
+            df = ds.load().to_dataframe()
+        # Missing strings come back from NetCDF as empty strings
+        for col in df.columns:
+            if df[col].dtype.kind not in "biufcmM":
+                df[col] = df[col].where(df[col] != "")
+        return df
+
+    def _write_partition(self, region: str, month: str, df: pd.DataFrame):
+        path = self.partition_path(region, month)
+        tmp = path + ".tmp"
+        ds = xr.Dataset.from_dataframe(df)
+        encoding = {v: {"zlib": True} for v in ds.data_vars if ds[v].dtype.kind == "f"}
+        ds.to_netcdf(tmp, encoding=encoding)
+        os.replace(tmp, path)
+
+    def upsert(self, region: str, df: pd.DataFrame) -> list:
+        """Inserts or replaces rows of a region.
+
+        Args:
+            region (str): Region name.
+            df (pd.DataFrame): A 'date' column plus one column per stored variable
+                (e.g., seaice_extent). Columns missing from ``df`` keep their stored values.
+
+        Returns:
+            list: Month partitions that were written.
+        """
+        df = df.copy()
+        df["date"] = pd.to_datetime(df["date"]).dt.normalize()
+        df = df.drop_duplicates("date", keep="last").set_index("date").sort_index()
+        if df.empty:
+            return []
+
+        os.makedirs(os.path.join(self.root, region), exist_ok=True)
+        manifest = self.read_manifest(region)
+
+        written = []
+        for month, part in df.groupby(df.index.strftime("%Y-%m")):
+            merged = part.combine_first(self.read_partition(region, month)).sort_index()
+            merged.index.name = "date"
+            self._write_partition(region, month, merged)
+            manifest["partitions"][month] = len(merged)
+            written.append(month)
+
+        # The manifest is committed last: after a crash it may lag the partitions, which only
+        # makes the next run upsert the same dates again
+        last = df.index.max()
+        if manifest["last_date"] is None or last > pd.Timestamp(manifest["last_date"]):
+            manifest["last_date"] = last.strftime("%Y-%m-%d")
+        self._write_manifest(region, manifest)
+        return written
+
+    def stale_months(self, region: str, dates, source: str) -> list:
+        """Returns the month partitions holding stored days of ``dates`` that came from a source
+        other than ``source`` (days without a recorded source included), e.g. NRT days once the
+        CDR covers them. Dates that are not stored, and dates up to the mark set by `mark_checked`,
+        are ignored, so only the months after the last check are read.
+
+        Args:
+            region (str): Region name.
+            dates (array-like): Days available from ``source``.
+            source (str): Preferred source (e.g., the CDR dataset ID).
+
+        Returns:
+            list: Sorted month partitions ('YYYY-MM') to recompute from ``source``.
+        """
+        dates = pd.DatetimeIndex(dates).normalize()
+        manifest = self.read_manifest(region)
+        stored = manifest["partitions"]
+        checked = manifest.get("checked", {}).get(source)
+        if checked is not None:
+            dates = dates[dates > pd.Timestamp(checked)]
+        stale = []
+        for month in sorted(set(dates.strftime("%Y-%m")) & set(stored)):
+            df = self.read_partition(region, month)
+            rows = df.index.isin(dates)
+            if not rows.any():
+                continue
+            if "source" not in df.columns or (df.loc[rows, "source"] != source).any():
+                stale.append(month)
+        return stale
+
+    def mark_checked(self, region: str, source: str, date):
+        """Records that the stored days of a region up to ``date`` need no recomputing from
+        ``source`` (e.g., after the stale months were rewritten from it), so `stale_months`
+        skips them from then on.
+
+        Args:
+            region (str): Region name.
+            source (str): Preferred source (e.g., the CDR dataset ID).
+            date: Last checked day.
+        """
+        manifest = self.read_manifest(region)
+        checked = manifest.setdefault("checked", {})
+        date = pd.Timestamp(date).normalize()
+        if checked.get(source) is None or date > pd.Timestamp(checked[source]):
+            checked[source] = date.strftime("%Y-%m-%d")
+            os.makedirs(os.path.join(self.root, region), exist_ok=True)
+            self._write_manifest(region, manifest)
+
+    def read(self, region: str, start: str = None, end: str = None, columns: list = None) -> pd.DataFrame:
+        """Reads the stored rows of a region.
+
+        Args:
+            region (str): Region name.
+            start (str, optional): First date ('YYYY-MM-DD'). Defaults to None.
+            end (str, optional): Last date ('YYYY-MM-DD'). Defaults to None.
+            columns (list, optional): Columns to return. Defaults to all.
+
+        Returns:
+            pd.DataFrame: Rows with a 'date' column, sorted by date.
+        """
+        months = sorted(self.read_manifest(region)["partitions"])
+        if start is not None:
+            months = [m for m in months if m >= pd.Timestamp(start).strftime("%Y-%m")]
+        if end is not None:
+            months = [m for m in months if m <= pd.Timestamp(end).strftime("%Y-%m")]
+
+        parts = [self.read_partition(region, m) for m in months]
+        df = pd.concat(parts).sort_index() if parts else pd.DataFrame(index=pd.DatetimeIndex([], name="date"))
+        df = df.loc[start:end]
+        if columns is not None:
+            df = df.reindex(columns=columns)
+        return df.reset_index()
+
+    def import_csv(self, region: str, path: str, source: str = None) -> int:
+        """Seeds a region from a legacy ``date,seaice_extent`` CSV, skipping malformed rows.
+
+        Args:
+            region (str): Region name.
+            path (str): CSV file.
+            source (str, optional): Source recorded for the imported days (e.g., the NRT dataset ID
+                the published series was computed from). Defaults to None (no source column).
+
+        Returns:
+            int: Number of rows imported.
+        """
+        df = pd.read_csv(path, on_bad_lines="skip", engine="python")
+        df["date"] = pd.to_datetime(df["date"], errors="coerce", format="%Y-%m-%d")
+        df = df.apply(lambda col: col if col.name == "date" else pd.to_numeric(col, errors="coerce"))
+        df = df.dropna()
+        if source is not None:
+            df["source"] = source
+        self.upsert(region, df)
+        return len(df)
+
+    def export_csv(self, region: str, path: str, columns: list = None, start: str = None,
+                   float_format: str = "%.2f"):
+        """Writes the compact CSV consumed by the site pages (``date`` plus ``columns``).
+
+        Args:
+            region (str): Region name.
+            path (str): Output CSV file.
+            columns (list, optional): Value columns. Defaults to ['seaice_extent'].
+            start (str, optional): First date to export. Defaults to None (all).
+            float_format (str, optional): Format of the values. Defaults to 2 decimals.
+        """
+        columns = columns or ["seaice_extent"]
+        df = self.read(region, start=start, columns=columns).dropna(subset=columns, how="all")
+        df["date"] = df["date"].dt.strftime("%Y-%m-%d")
+        tmp = path + ".tmp"
+        df.to_csv(tmp, index=False, float_format=float_format)
+        os.replace(tmp, path)
+
+
+class ExtentPyramid:
+    """Weekly, monthly and water-year means of the daily values of an `ExtentStore`.
+
+    Layout:
+        {root}/{region}/{level}.nc   one NetCDF file per region and level, indexed by the first day
+                                     of each period (weeks start on Monday, water years on September 1)
+
+    Each row holds the period means and the number of days they are computed from (``days``),
+    so partial periods (e.g., the current month) can be told apart from complete ones. Weekly
+    and monthly means are means of the days; the water-year mean is the mean of its monthly
+    means, as in the annualized series. ``update`` recomputes only the periods a date range
+    touches, so the pyramid follows the daily store as days arrive or are superseded.
+    """
+
+    LEVELS = ("weekly", "monthly", "water_year")
+
+    def __init__(self, store: ExtentStore, root: str = None, columns: list = None):
+        """
+        Args:
+            store (ExtentStore): Store of the daily values.
+            root (str, optional): Root directory of the pyramid. Defaults to ``{store root}/_pyramid``.
+            columns (list, optional): Daily columns to aggregate. Defaults to ['seaice_extent'].
+        """
+        self.store = store
+        self.root = root or os.path.join(store.root, "_pyramid")
+        self.columns = list(columns or ["seaice_extent"])
+
+    def __str__(self):
+        return f"ExtentPyramid:\nroot={self.root}\n, levels={self.LEVELS}\n, columns={self.columns}"
+
+    def regions(self) -> list:
+        """Returns the regions that have a pyramid."""
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(r for r in os.listdir(self.root) if os.path.isdir(os.path.join(self.root, r)))
+
+    def level_path(self, region: str, level: str) -> str:
+        if level not in self.LEVELS:
+            raise ValueError(f"Unknown level {level}; expected one of {self.LEVELS}")
+        return os.path.join(self.root, region, f"{level}.nc")
+
+    @staticmethod
+    def period_start(level: str, dates) -> pd.DatetimeIndex:
+        """Returns the first day of the ``level`` period holding each date."""
+        dates = pd.DatetimeIndex(dates).normalize()
+        if level == "weekly":
+            return dates.to_period("W-SUN").start_time
+        if level == "monthly":
+            return dates.to_period("M").start_time
+        if level == "water_year":
+            return pd.DatetimeIndex([pd.Timestamp(y - 1, 9, 1) for y in water_year(dates)])
+        raise ValueError(f"Unknown level {level}")
+
+    @staticmethod
+    def period_end(level: str, dates) -> pd.DatetimeIndex:
+        """Returns the last day of the ``level`` period holding each date."""
+        start = ExtentPyramid.period_start(level, dates)
+        step = {"weekly": pd.DateOffset(days=7), "monthly": pd.DateOffset(months=1),
+                "water_year": pd.DateOffset(years=1)}[level]
+        return start + step - pd.Timedelta(days=1)
+
+    def aggregate(self, level: str, daily: pd.DataFrame) -> pd.DataFrame:
+        """Aggregates daily rows (indexed by date) into ``level`` periods.
+
+        Returns:
+            pd.DataFrame: Means of ``columns`` and the number of days with a value, indexed by
+                the first day of each period.
+        """
+        if level == "water_year":
+            monthly = self.aggregate("monthly", daily)
+            groups = monthly.groupby(self.period_start(level, monthly.index))
+            agg = groups[self.columns].mean()
+            agg["days"] = groups["days"].sum()
+        else:
+            daily = daily[self.columns].dropna(how="all")
+            groups = daily.groupby(self.period_start(level, daily.index))
+            agg = groups[self.columns].mean()
+            agg["days"] = groups.size()
+        agg.index.name = "date"
+        return agg.astype({"days": "int64"})
+
+    def read_level(self, region: str, level: str) -> pd.DataFrame:
+        """Reads a level of a region as a DataFrame indexed by period start (empty if not built)."""
+        path = self.level_path(region, level)
+        if not os.path.exists(path):
+            return pd.DataFrame(columns=self.columns + ["days"], index=pd.DatetimeIndex([], name="date"))
+        with xr.open_dataset(path) as ds:
+            return ds.load().to_dataframe()
+
+    def _write_level(self, region: str, level: str, df: pd.DataFrame):
+        path = self.level_path(region, level)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = path + ".tmp"
+        ds = xr.Dataset.from_dataframe(df)
+        encoding = {v: {"zlib": True} for v in ds.data_vars if ds[v].dtype.kind == "f"}
+        ds.to_netcdf(tmp, encoding=encoding)
+        os.replace(tmp, path)
+
+    def update(self, region: str, start: str = None, end: str = None) -> dict:
+        """Recomputes the periods of every level that overlap [start, end] from the daily store.
+
+        Without dates, all levels of the region are rebuilt.
+
+        Args:
+            region (str): Region name.
+            start (str, optional): First changed date ('YYYY-MM-DD'). Defaults to None.
+            end (str, optional): Last changed date ('YYYY-MM-DD'). Defaults to ``start``.
+
+        Returns:
+            dict: Level -> number of periods written.
+        """
+        end = end if end is not None else start
+        written = {}
+        for level in self.LEVELS:
+            if start is None:
+                lo = hi = None
+            else:
+                lo = self.period_start(level, [start])[0].strftime("%Y-%m-%d")
+                hi = self.period_end(level, [end])[0].strftime("%Y-%m-%d")
+            daily = self.store.read(region, lo, hi, columns=self.columns).set_index("date")
+            agg = self.aggregate(level, daily)
+            written[level] = len(agg)
+
+            # Stored periods of the range are replaced; those that no longer have days are dropped
+            if lo is not None:
+                stored = self.read_level(region, level)
+                stored = stored[(stored.index < pd.Timestamp(lo)) | (stored.index > pd.Timestamp(hi))]
+                agg = pd.concat([stored, agg]).sort_index()
+                agg.index.name = "date"
+            self._write_level(region, level, agg)
+        return written
+
+    def read(self, region: str, level: str, start: str = None, end: str = None) -> pd.DataFrame:
+        """Reads a level of a region.
+
+        Args:
+            region (str): Region name.
+            level (str): 'weekly', 'monthly' or 'water_year'.
+            start (str, optional): First period start ('YYYY-MM-DD'). Defaults to None.
+            end (str, optional): Last period start ('YYYY-MM-DD'). Defaults to None.
+
+        Returns:
+            pd.DataFrame: A 'date' column (first day of each period), the means and 'days', plus
+                'year' (the water year, e.g. 2024 for Sep 2023 - Aug 2024) for the water-year level.
+        """
+        df = self.read_level(region, level).sort_index().loc[start:end].reset_index()
+        if level == "water_year":
+            df.insert(1, "year", df["date"].dt.year + 1)
+        return df
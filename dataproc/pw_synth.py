@@ -0,0 +1,261 @@
+"""
+Title: Synthetic NSIDC 25 km grid and local ERDDAP stand-in
+Description: Generates synthetic sea ice concentration and grid cell area datasets on the NSIDC
+Northern Hemisphere 25 km polar stereographic grid (EPSG:3413), laid out like the PolarWatch ERDDAP
+datasets (same x/y coordinates, byte-scaled concentrations with flag values, cell_area in m^2).
+The files are written to a directory under their dataset IDs, so the directory can be passed as
+`server` to `cwData`/`SIC25k` and `GridCache` in place of the ERDDAP server. `GriddapStandIn` also
+answers griddap ``.nc`` requests from that directory over HTTP, for `pw_fetch.GriddapDownloader`.
+
+Only numpy, pandas, xarray and netCDF4 are required.
+
+Main Classes and Functions:
+- nh25k_grid: x/y coordinates of the 448 x 304 grid.
+- synthetic_flags: Land, coast, lake and pole hole flags.
+- synthetic_conc: Daily concentrations (0-100) with a seasonal ice edge, flags for non-ocean cells.
+- cell_area: Grid cell area (m^2) from the polar stereographic scale factor.
+- write_standin: Writes a concentration and a cell area dataset into a stand-in directory.
+- GriddapStandIn: Local HTTP server answering griddap ``.nc`` requests from a stand-in directory.
+"""
+
+import os
+import re
+import tempfile
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import netCDF4
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+# NSIDC 25 km Northern Hemisphere polar stereographic grid (cell centers, m)
+STEP = 25000
+NX, NY = 304, 448
+X0, Y0 = -3837500, 5837500
+
+# Byte-scaled concentration: 0-100 percent, then flag values
+SCALE = 0.01
+FLAGS = {251: "pole_hole", 252: "lake", 253: "coast", 254: "land", 255: "missing"}
+
+
+def nh25k_grid() -> tuple:
+    """Returns the x (ascending) and y (descending) cell center coordinates in meters."""
+    x = X0 + STEP * np.arange(NX, dtype=np.float64)
+    y = Y0 - STEP * np.arange(NY, dtype=np.float64)
+    return x, y
+
+
+def _distance_from_pole() -> np.ndarray:
+    x, y = nh25k_grid()
+    return np.hypot(*np.meshgrid(x, y))
+
+
+def synthetic_flags(seed: int = 0, land_fraction: float = 0.25) -> np.ndarray:
+    """Flag layout (y, x): 0 for ocean, else a key of `FLAGS`.
+
+    Land is a smooth random field thresholded to ``land_fraction``; land cells next to
+    ocean are coast, a few inland cells are lakes, and cells near the pole are the pole hole.
+    """
+    rng = np.random.default_rng(seed)
+    coarse = rng.random((NY // 16 + 2, NX // 16 + 2))
+    field = np.kron(coarse, np.ones((16, 16)))[:NY, :NX]
+    for axis in (0, 1):
+        for _ in range(4):
+            field = (field + np.roll(field, 8, axis) + np.roll(field, -8, axis)) / 3
+    land = field > np.quantile(field, 1 - land_fraction)
+
+    flags = np.where(land, 254, 0).astype(np.uint8)
+    ocean = ~land
+    shore = np.zeros_like(land)
+    for axis in (0, 1):
+        for shift in (1, -1):
+            shore |= np.roll(ocean, shift, axis)
+    flags[land & shore] = 253
+    flags[land & ~shore & (rng.random(land.shape) < 0.01)] = 252
+    flags[_distance_from_pole() < 100e3] = 251
+    return flags
+
+
+def synthetic_conc(times, flags: np.ndarray, seed: int = 0) -> np.ndarray:
+    """Daily byte-scaled concentrations (time, y, x): percent of ice, or the cell's flag.
+
+    Ice covers the cells within a seasonal edge radius around the pole (largest in
+    March, smallest in September) and fades over the marginal ice zone, with noise.
+    """
+    times = pd.DatetimeIndex(times)
+    rng = np.random.default_rng(seed)
+    r = _distance_from_pole().astype(np.float32)
+    edge = 2.6e6 + 0.9e6 * np.cos(2 * np.pi * (times.dayofyear.values - 70) / 365.25)
+
+    conc = np.empty((len(times),) + r.shape, dtype=np.uint8)
+    for i, e in enumerate(edge):
+        c = np.clip((e - r) / 4e5 + rng.normal(0, 0.05, r.shape).astype(np.float32), 0, 1)
+        conc[i] = np.round(c * 100)
+    conc[:, flags > 0] = flags[flags > 0]
+    return conc
+
+
+def cell_area(lat_ts: float = 70.0, radius: float = 6378137.0) -> np.ndarray:
+    """Grid cell area (y, x) in m^2: the nominal 25 km cell divided by the squared scale factor
+    of the (spherical) polar stereographic projection with true scale at ``lat_ts``."""
+    k0 = (1 + np.sin(np.radians(lat_ts))) / 2
+    lat = np.pi / 2 - 2 * np.arctan(_distance_from_pole() / (2 * radius * k0))
+    k = 2 * k0 / (1 + np.sin(lat))
+    return (STEP / k) ** 2
+
+
+def write_standin(root: str, id: str, times, varname: str = "cdr_seaice_conc",
+                  area_id: str = "pstere_gridcell_N25k", seed: int = 0, block: int = 366) -> str:
+    """Writes a synthetic concentration dataset ``{root}/{id}`` and cell area dataset ``{root}/{area_id}``.
+
+    Concentrations are stored like the NSIDC files (uint8, ``scale_factor`` 0.01, flag values as
+    missing values), so decoding yields 0-1 floats with NaN for flagged cells, and opening with
+    ``mask_and_scale=False`` yields the raw bytes. Data are written in blocks of ``block`` days.
+
+    Args:
+        root (str): Stand-in directory (pass it as `server`).
+        id (str): Dataset ID of the concentrations.
+        times (array-like): Daily time steps.
+        varname (str, optional): Concentration variable. Defaults to 'cdr_seaice_conc'.
+        area_id (str, optional): Dataset ID of the cell area. Defaults to 'pstere_gridcell_N25k'.
+        seed (int, optional): Random seed. Defaults to 0.
+        block (int, optional): Days generated and written at a time. Defaults to 366.
+
+    Returns:
+        str: Path of the concentration dataset.
+    """
+    os.makedirs(root, exist_ok=True)
+    x, y = nh25k_grid()
+    flags = synthetic_flags(seed)
+    times = pd.DatetimeIndex(times)
+
+    path = os.path.join(root, id)
+    with netCDF4.Dataset(path + ".tmp", "w") as nc:
+        nc.createDimension("time", None)
+        nc.createDimension("y", NY)
+        nc.createDimension("x", NX)
+        t = nc.createVariable("time", "f8", ("time",))
+        t.units = "seconds since 1970-01-01T00:00:00Z"
+        t.standard_name = "time"
+        for name, values in (("y", y), ("x", x)):
+            v = nc.createVariable(name, "f8", (name,))
+            v.units = "meters"
+            v[:] = values
+        v = nc.createVariable(varname, "u1", ("time", "y", "x"), zlib=True, complevel=4,
+                              chunksizes=(min(31, len(times)), NY, NX), fill_value=np.uint8(255))
+        v.set_auto_maskandscale(False)
+        v.scale_factor = SCALE
+        v.valid_range = np.array([0, 100], dtype=np.uint8)
+        v.missing_value = np.array(sorted(FLAGS)[:-1], dtype=np.uint8)
+        v.flag_values = np.array(sorted(FLAGS), dtype=np.uint8)
+        v.flag_meanings = " ".join(FLAGS[k] for k in sorted(FLAGS))
+        v.long_name = "Synthetic sea ice concentration"
+
+        for start in range(0, len(times), block):
+            chunk = times[start:start + block]
+            t[start:start + len(chunk)] = (chunk - pd.Timestamp("1970-01-01")).total_seconds().values
+            v[start:start + len(chunk)] = synthetic_conc(chunk, flags, seed + start)
+    os.replace(path + ".tmp", path)
+
+    area = xr.Dataset({"cell_area": (("y", "x"), cell_area(), {"units": "m2", "long_name": "Grid cell area"})},
+                      coords={"y": y, "x": x})
+    area.to_netcdf(os.path.join(root, area_id) + ".tmp")
+    os.replace(os.path.join(root, area_id) + ".tmp", os.path.join(root, area_id))
+    return path
+
+
+class GriddapStandIn:
+    """Local HTTP server answering griddap ``.nc`` requests from a stand-in directory, e.g.
+    ``http://127.0.0.1:{port}/{id}.nc?{varname}[(t0):(t1)][(y0):(y1)][(x0):(x1)]``.
+
+    Usable as a context manager; ``url`` is the base URL to give to `GriddapDownloader`.
+    Status codes appended to ``errors`` are answered, in order, to the next requests instead
+    of the data (e.g., 503 or 429 to exercise retries); ``requests`` counts all requests.
+    """
+
+    def __init__(self, root: str, port: int = 0, latency: float = 0.0):
+        """
+        Args:
+            root (str): Stand-in directory written by `write_standin`.
+            port (int, optional): Port to listen on. Defaults to 0 (any free port).
+            latency (float, optional): Seconds added to every response. Defaults to 0.
+        """
+        self.root = root
+        self.latency = latency
+        self.requests = 0
+        self.errors = []
+        standin = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                standin.requests += 1
+                if standin.errors:
+                    self.send_error(standin.errors.pop(0))
+                    return
+                try:
+                    body = standin.respond(self.path)
+                except (OSError, KeyError, ValueError) as e:
+                    self.send_error(404, str(e))
+                    return
+                time.sleep(standin.latency)
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-netcdf")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.thread = None
+
+    def respond(self, path: str) -> bytes:
+        """Returns the NetCDF bytes answering a griddap request path."""
+        target, _, query = path.partition("?")
+        id = target.strip("/")
+        if not id.endswith(".nc"):
+            raise ValueError(f"Unsupported request {path}")
+        query = urllib.parse.unquote(query)
+        varname = query.split("[")[0]
+        bounds = re.findall(r"\[\((.*?)\):\((.*?)\)\]", query)
+
+        with xr.open_dataset(os.path.join(self.root, id[:-3]), mask_and_scale=False) as src:
+            da = src[varname]
+            for dim, (lo, hi) in zip(da.dims, bounds):
+                if dim == "time":
+                    lo, hi = pd.Timestamp(lo.rstrip("Z")), pd.Timestamp(hi.rstrip("Z"))
+                else:
+                    lo, hi = float(lo), float(hi)
+                da = da.sel({dim: slice(lo, hi)})
+            ds = da.to_dataset().load()
+
+        fd, tmp = tempfile.mkstemp(suffix=".nc")
+        os.close(fd)
+        try:
+            ds.to_netcdf(tmp)
+            with open(tmp, "rb") as f:
+                return f.read()
+        finally:
+            os.remove(tmp)
+
+    def start(self) -> "GriddapStandIn":
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
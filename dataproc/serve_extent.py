@@ -0,0 +1,127 @@
+"""
+Title: Local HTTP endpoint for the sea ice extent of arbitrary polygons
+Description:
+    Serves the daily sea ice extent of any polygon (e.g., a fishery management subarea or a lease
+    block) from the locally cached sea ice concentration, through `PolygonExtentService` in
+    `pw_polygon.py`. No region has to be added to the scripts and no data are fetched per query:
+    polygons are rasterized once onto the grid (LRU cache of masks) and the extent is reduced from
+    the local copy of the dataset (synced into --cache-dir on startup).
+
+    POST /extent with a JSON body:
+        {"geometry": <GeoJSON geometry, Feature or FeatureCollection>,
+         "start": "2024-01-01", "end": "2024-12-31",
+         "threshold": 0.15,        (optional)
+         "crs": "EPSG:4326"}       (optional, CRS of the coordinates)
+    returns
+        {"dates": [...], "seaice_extent": [...], "area_km2": ..., "cells": ..., "threshold": ...}
+
+    GET /health returns the service state. Invalid requests get a 400 response with {"error": ...}.
+
+    With --preload, the cube is held in memory (one byte per cell and day), so repeated polygons
+    are answered in milliseconds; a new polygon takes one rasterization.
+
+Usage:
+    python serve_extent.py --port 8000 --preload
+    curl -X POST localhost:8000/extent -d '{"geometry": {...}, "start": "2024-01-01", "end": "2024-12-31"}'
+"""
+
+import argparse
+import json
+import logging
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from pw_data import SIC25k
+from pw_polygon import PolygonExtentService
+
+CDR_DAILY_ID = 'nsidcG02202v5nh1day'  # CDR daily sea ice conc
+AREA_ID = 'pstere_gridcell_N25k'  # Grid cell area
+CRS = 'epsg:3413'  # EPSG code for the polar stereographic (north) projection
+VAR_NAME = 'cdr_seaice_conc'
+SERVER = 'https://polarwatch.noaa.gov/erddap/griddap'
+CACHE_DIR = 'cache'  # Local copy of the ERDDAP data, synced incrementally
+
+logger = logging.getLogger(__name__)
+
+
+def make_handler(service: PolygonExtentService):
+    """Returns a request handler class answering from ``service``."""
+
+    class ExtentHandler(BaseHTTPRequestHandler):
+
+        def send_json(self, status: int, body: dict):
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path.rstrip('/') == '/health':
+                self.send_json(200, {'status': 'ok', 'id': service.sic.id, **service.cache_info()})
+            else:
+                self.send_json(404, {'error': f'Unknown path {self.path}'})
+
+        def do_POST(self):
+            if self.path.rstrip('/') != '/extent':
+                self.send_json(404, {'error': f'Unknown path {self.path}'})
+                return
+            try:
+                query = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+                threshold = float(query.get('threshold', service.threshold))
+                ext = service.extent(query['geometry'], [query['start'], query['end']],
+                                     threshold=threshold, crs=query.get('crs', 'EPSG:4326'))
+            except KeyError as e:
+                self.send_json(400, {'error': f'Missing field {e}'})
+                return
+            except (ValueError, TypeError) as e:
+                self.send_json(400, {'error': str(e)})
+                return
+            except Exception as e:
+                logger.exception('Extent query failed')
+                self.send_json(500, {'error': f'{type(e).__name__}: {e}'})
+                return
+            values = np.round(ext.values.astype(float), 3)
+            self.send_json(200, {'dates': [str(d)[:10] for d in ext['time'].values],
+                                 'seaice_extent': [None if np.isnan(v) else v for v in values.tolist()],
+                                 'area_km2': round(ext.attrs['area_km2'], 3),
+                                 'cells': ext.attrs['cells'],
+                                 'threshold': threshold})
+
+        def log_message(self, format, *args):
+            logger.info('%s - %s', self.address_string(), format % args)
+
+    return ExtentHandler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1', help='Address to listen on (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=8000, help='Port (default: 8000)')
+    parser.add_argument('--id', default=CDR_DAILY_ID, help=f'ERDDAP dataset ID (default: {CDR_DAILY_ID})')
+    parser.add_argument('--server', default=SERVER, help='ERDDAP griddap URL (default: PolarWatch)')
+    parser.add_argument('--cache-dir', default=CACHE_DIR, help='Local copy of the dataset (default: cache)')
+    parser.add_argument('--preload', action='store_true', help='Hold the cube in memory for millisecond queries')
+    parser.add_argument('--mask-cache-size', type=int, default=128, help='Polygon masks kept in memory (default: 128)')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    # Byte-scaled values, so the preloaded cube takes one byte per cell and day
+    sic = SIC25k(args.id, VAR_NAME, CRS, server=args.server, cache_dir=args.cache_dir, raw=True)
+    sic.load_area(AREA_ID)
+    service = PolygonExtentService(sic, mask_cache_size=args.mask_cache_size, preload=args.preload)
+
+    httpd = ThreadingHTTPServer((args.host, args.port), make_handler(service))
+    logger.info('Serving sea ice extent of %s on http://%s:%d/extent', args.id, args.host, args.port)
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,74 +1,212 @@
-# import os, sys
+import os, sys
 import pandas as pd
-import numpy as np
 from datetime import date
-import geopandas as gpd
 from utils import *
 import xarray as xr
 
+# Import the extent store from the dataproc directory
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'dataproc'))
+from pw_store import ExtentStore
+from pw_fetch import GriddapDownloader
+from pw_metrics import RunReport
+from pw_baseline import BaselineDistribution, water_year
+from pw_events import SeasonEventDetector, cycle_threshold, thresholds_from_baseline
+from pw_site import site_data, write_site_data
+from pw_paths import BASELINE_DIST, EVENTS_STATE
+
 SERVER="https://polarwatch.noaa.gov/erddap/griddap"
+STORE_DIR = 'data/extent_store'
+SCORES = ['anomaly', 'zscore', 'percentile', 'rank']  # Written alongside the extent when the baseline is available
+REGION_INDEX = 'data/region_index.npz'  # Grid cell indices and area weights per region (dataproc/build_region_index.py)
+PART_DIR = 'cache/parts'  # Finished download chunks, reused if the job is rerun after a failure
+REPORT_DIR = 'reports'  # JSON run report and Prometheus text file of the job
 
 def main():
+    # The run report is written even if the job fails, with the error recorded
+    report = RunReport('update_daily_extent')
+    try:
+        update(report)
+    except Exception as e:
+        report.error(f'{type(e).__name__}: {e}')
+        raise
+    finally:
+        report.write(os.path.join(REPORT_DIR, 'update_daily_extent.json'),
+                     os.path.join(REPORT_DIR, 'update_daily_extent.prom'))
+
+def update(report):
         
     # PolarWatch dataset ID of the NSIDC near real time 
     # sea ice conc in the northern hemisphere (nh)
     nrt_id = 'nsidcG10016v3nh1day'
 
-    # EPSG code used for polar stereographic projection (nh)
-    crs = 'epsg:3413'
+    # PolarWatch dataset ID of the NSIDC CDR sea ice conc (nh), which
+    # supersedes NRT days once released
+    cdr_id = 'nsidcG02202v5nh1day'
+
     var_name = 'cdr_seaice_conc'
 
-    # Define regions and corresponding shapefiles for spatial subsetting
-    regions = dict([
-       ('AlaskanArctic', 'arctic_sf.shp'),  # Alaskan Arctic region
-       ('NorthernBering', 'nbering_sf.shp'),  # Northern Bering Sea region
-       ('EasternBering', 'ebering_sf.shp'),  # Eastern Bering Sea region
-        ('SoutheasternBering', 'se_bering_sf.shp') # Southeastern Bering Sea region
-    ])
-
-    # Get the latest date from recently updated file
-    recent_dat = pd.read_csv("data/nrt_extent_NorthernBering.csv", parse_dates=['date'])
-    start_date = (recent_dat['date'].max() + pd.Timedelta(days=1)).strftime('%Y-%m-%d')
+    # Precompiled regions (Alaskan Arctic, Northern, Eastern and Southeastern Bering Sea):
+    # grid window, cell indices and area weights, so no shapefile or geometry work is needed
+    index = load_region_index(REGION_INDEX)
+    regions = index['names']
+
+    # Baseline distribution to score each day against (anomaly, z-score, percentile, rank)
+    baseline = BaselineDistribution.load(BASELINE_DIST) if os.path.exists(BASELINE_DIST) else None
+
+    # Days the CDR provides so far
+    with report.stage('open'):
+        cdr_times = xr.open_dataset('/'.join([SERVER, cdr_id]))['time'].values
+
+    # Seed the store from the published CSV files on first use, with the scores of the seeded days.
+    # The published days are recorded as NRT days; those the CDR already covers are kept as
+    # published, and later days are superseded as the CDR catches up
+    store = ExtentStore(STORE_DIR)
+    for name in regions:
+        if store.last_date(name) is None:
+            n = store.import_csv(name, f'data/nrt_extent_{name}.csv', source=nrt_id)
+            store.upsert(name, with_scores(baseline, name, store.read(name, columns=['seaice_extent'])))
+            if len(cdr_times):
+                store.mark_checked(name, cdr_id, cdr_times.max())
+            print(f'Seeded {name} with {n} rows')
+
+    # Start after the earliest last date among regions
+    last_date = min(store.last_date(name) for name in regions)
+    start_date = (last_date + pd.Timedelta(days=1)).strftime('%Y-%m-%d')
     end_date = date.today().strftime('%Y-%m-%d')
 
-    # Get most recent sea ice data
-    sic = get_var_data(SERVER, nrt_id, crs, var_name, [start_date, end_date])
+    # Get most recent sea ice data (concurrent time-chunk requests with retries)
+    downloader = GriddapDownloader(SERVER, time_chunk=31, max_workers=4, part_dir=PART_DIR, report=report)
+    with report.stage('open'):
+        sic = get_var_data(SERVER, nrt_id, var_name, [start_date, end_date], index['x'], index['y'],
+                           downloader=downloader)
 
     # If new data are available, continue
     if sic.size > 0:
-
-        # Loop through regions
-        for name, shp in regions.items():
-            print(f'Processing:  {name}')
-            
-            # load regional shapefile
-            alaska_shp = gpd.read_file(f'resources/alaska_shapefiles/{shp}')
-
-            # transform the shape to the data projection
-            alaska_shp_proj = alaska_shp.to_crs(crs)
-
-            # Load regional grid cell area data
-            ds_area = get_area(name)
-            
-            # Clip sic data using shape
-            clipped_sic = clip_data(sic, alaska_shp_proj)
-
-            # Compute extent with sic and grid cell area
-            ext = compute_extent_km(clipped_sic, ds_area)
-
-            # Format the dataset and append to csv file
-            ext_df = (ext
-                    .to_dataframe()
-                    .reset_index()
-                    .drop(['spatial_ref'], axis='columns')
-                    .rename(columns={'time': 'date'}))
-            try:
-                ext_df.to_csv(f'data/nrt_extent_{name}.csv', mode='a', index=False, header=False)
-                print('Successfully updated ext_recent files')
-            except : 
-                print(f'Failed to update the ext_recent files for {name}')
+        for name, ext_df in region_extents(sic, index, report):
+            # Only days after the region's last stored day, so no CDR day is replaced by NRT
+            last = store.last_date(name)
+            write_region(store, name, ext_df[ext_df['date'] > last].assign(source=nrt_id), report, baseline)
     else:
         print("Processing Stopped: No new data available. ")
 
+    # When the CDR catches up, recompute the month partitions that hold NRT days it now covers.
+    # Only days after each region's last check are scanned, so the cost does not grow with the store
+    months = sorted(set().union(*(store.stale_months(name, cdr_times, cdr_id) for name in regions)))
+    failed = set()
+    for month in months:
+        print(f'Superseding {month} with {cdr_id}')
+        period = pd.Period(month, freq='M')
+        with report.stage('open'):
+            cdr = get_var_data(SERVER, cdr_id, var_name,
+                               [period.start_time.strftime('%Y-%m-%d'), period.end_time.strftime('%Y-%m-%d')],
+                               index['x'], index['y'], downloader=downloader)
+        for name, ext_df in region_extents(cdr, index, report):
+            if not write_region(store, name, ext_df.assign(source=cdr_id), report, baseline):
+                failed.add(name)
+    # Regions whose rewrite failed are checked again on the next run
+    if len(cdr_times):
+        for name in set(regions) - failed:
+            store.mark_checked(name, cdr_id, cdr_times.max())
+
+    # Step the freeze-up/break-up detector through the new days; the store is replayed on first
+    # use or when the CDR replaced stored days
+    update_events(store, regions, baseline, replay=len(months) > 0, report=report)
+
+    # Pre-shaped data of the region pages (two seasons, baseline band, annualized extent)
+    write_site(store, index, baseline, report)
+
+def region_extents(sic, index, report):
+    """Yields (region name, daily extent DataFrame with date and seaice_extent columns) for each region."""
+    # Threshold and area-weight all regions in one pass over the grid window
+    with report.stage('reduce'):
+        ext = compute_region_extents(sic, index)
+    for name in index['names']:
+        print(f'Processing:  {name}')
+        yield name, (ext
+                     .sel(region=name, drop=True)
+                     .to_dataframe()
+                     .reset_index()
+                     .rename(columns={'time': 'date'}))
+
+def with_scores(baseline, name, ext_df):
+    """Adds each day's anomaly, z-score, percentile and rank against the baseline (if any) to a region's rows."""
+    if baseline is None or ext_df.empty:
+        return ext_df
+    scores = baseline.score(name, ext_df['date'], ext_df['seaice_extent'])
+    return pd.concat([ext_df.reset_index(drop=True), scores.reset_index(drop=True)], axis=1)
+
+def load_events(regions, baseline):
+    """Returns the saved seasonal event detector, or a new one (and True if it needs a replay)."""
+    if os.path.exists(EVENTS_STATE):
+        events = SeasonEventDetector.load(EVENTS_STATE)
+        if events.regions == list(regions):
+            return events, False
+    # Thresholds from the mean annual cycle of the baseline (distribution, or the mean csv files)
+    if baseline is not None:
+        thresholds = thresholds_from_baseline(baseline)
+    else:
+        thresholds = {name: cycle_threshold(pd.read_csv(f'data/bs_extent_{name}.csv')['seaice_extent_mean'])
+                      for name in regions}
+    return SeasonEventDetector(thresholds), True
+
+def update_events(store, regions, baseline, replay, report):
+    """Advances (or replays) the seasonal event detector from the store and exports ice_events_{name}.csv."""
+    try:
+        with report.stage('events'):
+            events, new = load_events(regions, baseline)
+            for name in regions:
+                last = events.last_date(name)
+                if replay or new or last is None:
+                    ext_df = store.read(name, columns=['seaice_extent'])
+                    n = events.replay(name, ext_df['date'], ext_df['seaice_extent'])
+                else:
+                    ext_df = store.read(name, start=(last + pd.Timedelta(days=1)).strftime('%Y-%m-%d'),
+                                        columns=['seaice_extent'])
+                    n = events.advance(name, ext_df['date'], ext_df['seaice_extent'])
+                events.to_csv(name, f'data/ice_events_{name}.csv')
+                print(f'Ice events of {name}: {n} days')
+            events.save(EVENTS_STATE)
+    except Exception as e:
+        print(f'Failed to update the ice events: {e}')
+        report.error(f'Failed to update the ice events: {e}')
+
+def write_site(store, index, baseline, report):
+    """Writes data/site_{name}.json, read by the region pages, from the last two seasons of the store."""
+    # Region areas from the page area table, or else the area weights of the region index
+    areas = dict(zip(index['names'], index['matrix'].sum(axis=0)))
+    if os.path.exists('data/region_area.csv'):
+        region_area = pd.read_csv('data/region_area.csv')
+        areas.update(zip(region_area['region'], region_area['total_area_km2']))
+    columns = ['seaice_extent'] + (['anomaly'] if baseline is not None else [])
+    try:
+        with report.stage('write'):
+            for name in index['names']:
+                # The previous and current seasons, the current one being that of the last stored day
+                last = store.last_date(name)
+                start = f'{water_year([last if last is not None else date.today()])[0] - 2}-09-01'
+                data = site_data(name, store.read(name, start=start, columns=columns),
+                                 pd.read_csv(f'data/bs_extent_{name}.csv'),
+                                 pd.read_csv(f'data/annualized_extent_{name}.csv'),
+                                 total_area=areas[name])
+                write_site_data(f'data/site_{name}.json', data)
+    except Exception as e:
+        print(f'Failed to update the site data: {e}')
+        report.error(f'Failed to update the site data: {e}')
+
+def write_region(store, name, ext_df, report, baseline=None):
+    """Upserts a region's rows (with their source and scores) into the store and exports the csv file.
+    Returns whether the update succeeded."""
+    try:
+        with report.stage('write'):
+            store.upsert(name, with_scores(baseline, name, ext_df))
+            columns = ['seaice_extent'] + (SCORES if baseline is not None else [])
+            store.export_csv(name, f'data/nrt_extent_{name}.csv', columns=columns)
+        print('Successfully updated ext_recent files')
+        return True
+    except Exception as e: 
+        print(f'Failed to update the ext_recent files for {name}: {e}')
+        report.error(f'Failed to update the ext_recent files for {name}: {e}')
+        return False
+
 if __name__ == "__main__":
     main()
@@ -1,25 +1,30 @@
 # utils.py
 
 
+import os
+import sys
 import xarray as xr
-import geopandas as gpd
-import rasterio
-import pandas as pd
-import rioxarray
-from shapely.geometry import mapping
 import numpy as np
 
+# The extent kernel and region index loader are shared with dataproc/pw_data.py
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'dataproc'))
+from pw_kernels import fused_extent, load_region_index
 
-def get_var_data(server, id, crs, varname, dates):
+
+def get_var_data(server, id, varname, dates, x=None, y=None, downloader=None):
     """
-    Loads ERDDAP sea ice data from PolarWatch and returns data for the specified date range with geographic specifications.
+    Loads ERDDAP sea ice data from PolarWatch and returns data for the specified date range,
+    optionally only for a window of the grid.
 
     Args:
         server (str): The server URL.
         id (str): The ERDDAP dataset ID.
-        crs (str): The coordinate reference system (CRS) to be used.
         varname (str): The variable name within the dataset to extract.
         dates (list): A list containing the start and end dates in 'YYYY-MM-DD' format.
+        x (numpy.ndarray, optional): x coordinates of the grid window (e.g., of the region index).
+        y (numpy.ndarray, optional): y coordinates of the grid window.
+        downloader (GriddapDownloader, optional): Downloads the date range with concurrent, retried
+            time-chunk requests instead of OPeNDAP reads.
 
     Returns:
         xarray.DataArray: The sea ice data for the specified variable and date range.
@@ -28,26 +33,35 @@ def get_var_data(server, id, crs, varname, dates):
     full_URL = '/'.join([server,id])
     start_date, end_date = dates[0], dates[1]
 
-    da = xr.open_dataset(full_URL, chunks={"time":"auto"})
-    da = da[varname]
-    da.rio.set_spatial_dims(x_dim="x", y_dim="y", inplace=True)
-    da.rio.write_crs(crs, inplace=True)
+    da = xr.open_dataset(full_URL)
+    x = da['x'].values if x is None else x
+    y = da['y'].values if y is None else y
+    if downloader is not None:
+        # The remote dataset only provides the time steps and grid; the data come from the downloader
+        times = da['time'].sel(time=slice(start_date, end_date)).values
+        if len(times) == 0:
+            return da[varname].isel(time=slice(0, 0))
+        da = downloader.fetch(id, varname, x, y, times)
+    da = da[varname].sel(x=x, y=y)
     da = da.clip(min=0, max=1).sel(time=slice(start_date, end_date))
     return da
 
-def clip_data(dat, shape:gpd.GeoDataFrame):
+def compute_region_extents(ds, index, threshold=0.15):
     """
-    Clips the given data using the shape geometry and returns the clipped data.
+    Computes sea ice extent (square km) of every region of the index in one pass.
 
     Args:
-        dat (xarray.DataArray or xarray.Dataset): The data to be clipped.
-        shape (gpd.GeoDataFrame): The GeoDataFrame containing the shape geometry with CRS.
+        ds (xarray.DataArray): The sea ice concentration data, covering the grid window of the index.
+        index (dict): The region index (see pw_kernels.load_region_index).
+        threshold (float): Sea ice concentration threshold.
 
     Returns:
-        xarray.DataArray or xarray.Dataset: The clipped data.
+        xarray.DataArray: The sea ice extent with dimensions (time, region).
     """
-    clipped_da = dat.rio.clip(shape.geometry.apply(mapping), shape.crs)
-    return clipped_da
+    ds = ds.sel(x=index['x'], y=index['y']).transpose('time', 'y', 'x')
+    ext = fused_extent(ds.values, index['cells'], index['matrix'], threshold)
+    return xr.DataArray(ext, dims=('time', 'region'), name='seaice_extent',
+                        coords={'time': ds['time'].values, 'region': index['names']})
 
 def get_area(name):
     """
@@ -69,16 +83,17 @@ def get_area(name):
         raise("Cannot open regional area dataset")
  
 
-def compute_extent_km(ds, area_ds):
+def compute_extent_km(ds, area_ds, threshold=0.15):
     """
     Computes sea ice extent and using daily data from the given date range.
 
     Args:
-        ds (xarray.DataArray): The sea ice concentration data.
-        area_ds (xarray.DataArray): The area of each grid cell.
+        ds (xarray.DataArray): The sea ice concentration data, clipped to the region.
+        area_ds (xarray.DataArray): The area of each grid cell, clipped to the same region.
+        threshold (float): Sea ice concentration threshold.
 
     Raises:
-        TypeError: If the computed extent variable is not an xarray.DataArray.
+        ValueError: If the grid cell area does not cover the same grid as the data.
         Exception: If the extent computation fails for any reason.
 
     Returns:
@@ -88,31 +103,29 @@ def compute_extent_km(ds, area_ds):
 
     try:
 
-        # Create Sea Ice Extent Values 0 and 1 based on threshold, retaining Nan values
-        ice_conc_ext_yearly = xr.where(ds >= 0.15, 1, 0)
-        ice_conc_ext_yearly = xr.where(ds.isnull(), np.nan, ice_conc_ext_yearly)
-        
-        # Calculate sea ice extent of each cell by multiplying binary value to grid cell area
-        ice_ext_yearly = ice_conc_ext_yearly * area_ds
-        print(ice_ext_yearly[0])
-        # Add name
-        if isinstance(ice_ext_yearly, xr.DataArray):
-            ice_ext_yearly.name = 'seaice_extent'
-        else:
-            raise TypeError(f"extent values should be an xarray.DataArray {type(ice_ext_yearly)}")
-
-
-        ice_ext_yearly_ts = (ice_ext_yearly
-                            .groupby("time")
-                            .sum(dim=["x", "y"])) 
-        
-        # Add year-month 
-        # ice_ext_yearly['time_ymd'] = ice_ext_yearly['time'].dt.strftime('%Y-%m-%d')
-        return ice_ext_yearly_ts/1000000
+        # Align the area grid (xgrid/ygrid in the regional area files) with the data grid
+        area = area_ds.squeeze(drop=True)
+        area = area.rename({d: d[0] for d in area.dims if d in ('xgrid', 'ygrid')}).transpose('y', 'x')
+        if area.shape != (ds.sizes['y'], ds.sizes['x']):
+            raise ValueError(f"Grid cell area {area.shape} does not match the data grid "
+                             f"{(ds.sizes['y'], ds.sizes['x'])}")
+
+        # Area (square km) of the cells within the region
+        weights = np.nan_to_num(area.values / 1e6).ravel()
+        cells = np.flatnonzero(weights)
+
+        # Threshold and sum the cell areas in one pass for each time step
+        ice_ext_ts = xr.apply_ufunc(
+            fused_extent, ds,
+            input_core_dims=[['y', 'x']], output_core_dims=[['region']],
+            kwargs={'cells': cells, 'weights': weights[cells, None], 'threshold': threshold},
+            dask='parallelized', output_dtypes=[np.float64],
+            dask_gufunc_kwargs={'output_sizes': {'region': 1}})
+        ice_ext_ts = ice_ext_ts.isel(region=0, drop=True)
+        ice_ext_ts.name = 'seaice_extent'
+        return ice_ext_ts
             
     
     except Exception as e:
         print(f"Unable to compute extent : {e}")
         raise
-                
-
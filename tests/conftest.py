@@ -0,0 +1,39 @@
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'dataproc'))
+
+from pw_data import read_regions  # noqa: E402
+from pw_synth import write_standin  # noqa: E402
+
+CRS = 'epsg:3413'
+VAR_NAME = 'cdr_seaice_conc'
+AREA_ID = 'pstere_gridcell_N25k'
+REGIONS = dict([('AlaskanArctic', 'arctic_sf.shp'),
+                ('NorthernBering', 'nbering_sf.shp'),
+                ('EasternBering', 'ebering_sf.shp'),
+                ('SoutheasternBering', 'se_bering_sf.shp')])
+RESOURCE_DIR = os.path.join(ROOT, 'resources', 'alaska_shapefiles')
+
+
+@pytest.fixture(scope='session')
+def shapes():
+    """Alaska region shapes, projected to the grid CRS."""
+    return read_regions(REGIONS, RESOURCE_DIR, CRS)
+
+
+@pytest.fixture
+def server(tmp_path):
+    """Stand-in directory for the ERDDAP server; ``server.write(id, start, end, seed)`` adds a dataset."""
+    root = str(tmp_path / 'server')
+
+    class Server(str):
+        def write(self, id, start, end, seed=0):
+            return write_standin(root, id, pd.date_range(start, end), varname=VAR_NAME,
+                                 area_id=AREA_ID, seed=seed)
+
+    return Server(root)
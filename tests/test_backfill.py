@@ -0,0 +1,101 @@
+import numpy as np
+import pytest
+
+from conftest import AREA_ID, CRS, VAR_NAME
+from pw_data import SIC25k, stitch_sources
+from pw_engine import ExtentBackfill
+from pw_store import ExtentStore
+
+
+@pytest.fixture
+def make_backfill(server, shapes, tmp_path):
+    """Builds a monthly backfill of the stitched CDR + NRT stand-in data into one store."""
+    def make(freq='M'):
+        cdr = SIC25k('cdr', VAR_NAME, CRS, server=server, cache_dir=str(tmp_path / 'cache'),
+                     window_shapes=shapes)
+        nrt = SIC25k('nrt', VAR_NAME, CRS, server=server, cache_dir=str(tmp_path / 'cache'),
+                     window_shapes=shapes)
+        cdr.load_area(AREA_ID)
+        index = cdr.build_region_index(shapes)
+        ds = stitch_sources(cdr.ds, nrt.ds, ('cdr', 'nrt'))
+        store = ExtentStore(str(tmp_path / 'store'))
+        return ExtentBackfill(ds, index, store, freq=freq, workers=1, **cdr.kernel_threshold(0.15))
+    return make
+
+
+def stored(backfill, region):
+    return backfill.store.read(region).set_index('date')
+
+
+def test_backfill_resumes_and_matches_extents(server, make_backfill):
+    server.write('cdr', '2023-11-01', '2024-01-31', seed=1)
+    server.write('nrt', '2023-11-01', '2024-03-31', seed=2)
+    backfill = make_backfill()
+
+    assert backfill.run('2023-11-01', '2023-12-31') == ['2023-11', '2023-12']
+    assert backfill.run('2023-11-01', '2024-03-31') == ['2024-01', '2024-02', '2024-03']
+    assert backfill.run('2023-11-01', '2024-03-31') == []
+
+    # A partition missing from the manifest (e.g., interrupted before it was recorded) is redone
+    manifest = backfill.read_manifest()
+    del manifest['partitions']['2024-01']
+    backfill._write_manifest(manifest)
+    assert backfill.run('2023-11-01', '2024-03-31') == ['2024-01']
+
+    ext = backfill.engine.index.extent(backfill.engine.ds, **backfill.engine.kwargs).load()
+    for region in backfill.engine.index.names:
+        df = stored(backfill, region)
+        np.testing.assert_allclose(df['seaice_extent'].values, ext.sel(region=region).values, rtol=1e-6)
+        assert (df.loc[:'2024-01-31', 'source'] == 'cdr').all()
+        assert (df.loc['2024-02-01':, 'source'] == 'nrt').all()
+
+
+def test_fingerprints_from_workers_match_a_fresh_read(server, make_backfill):
+    server.write('cdr', '2023-12-01', '2024-01-31', seed=1)
+    server.write('nrt', '2023-12-01', '2024-01-31', seed=2)
+    backfill = make_backfill()
+    backfill.run('2023-12-01', '2024-01-31')
+
+    for entry in backfill.read_manifest()['partitions'].values():
+        assert entry['fingerprint'] == backfill.fingerprint(entry['start'], entry['end'])
+    assert backfill.pending('2023-12-01', '2024-01-31', changed_only=True) == []
+
+
+
+def test_partitions_of_any_length_cover_the_history(server, make_backfill):
+    server.write('cdr', '2023-12-01', '2024-02-29', seed=1)
+    server.write('nrt', '2023-12-01', '2024-02-29', seed=2)
+    make_backfill().run('2023-12-01', '2024-01-31')
+
+    # A reader with yearly partitions (e.g., compute_baseline_extent.py) finds the monthly ones
+    yearly = make_backfill('Y')
+    assert yearly.covers('2023-12-01', '2024-01-31')
+    assert not yearly.covers('2024-01-01', '2024-02-29')
+    assert not yearly.covers('2025-01-01', '2025-12-31')
+
+def test_supersede_rewrites_only_months_the_cdr_now_covers(server, make_backfill):
+    server.write('cdr', '2023-11-01', '2024-01-31', seed=1)
+    server.write('nrt', '2023-11-01', '2024-03-31', seed=2)
+    backfill = make_backfill()
+    backfill.run('2023-11-01', '2024-03-31')
+    assert backfill.supersede('cdr') == []
+
+    # A CDR release covering February
+    server.write('cdr', '2023-11-01', '2024-02-29', seed=1)
+    backfill = make_backfill()
+    region = backfill.engine.index.names[0]
+    before = stored(backfill, region)
+    assert backfill.supersede('cdr') == ['2024-02']
+    assert backfill.supersede('cdr') == []
+
+    after = stored(backfill, region)
+    assert (after.loc[:'2024-02-29', 'source'] == 'cdr').all()
+    assert (after.loc['2024-03-01':, 'source'] == 'nrt').all()
+    np.testing.assert_array_equal(after.loc[:'2024-01-31', 'seaice_extent'],
+                                  before.loc[:'2024-01-31', 'seaice_extent'])
+    ext = backfill.engine.index.extent(backfill.engine.ds.sel(time=slice('2024-02-01', '2024-02-29')),
+                                       **backfill.engine.kwargs).sel(region=region).load()
+    np.testing.assert_allclose(after.loc['2024-02-01':'2024-02-29', 'seaice_extent'].values, ext.values, rtol=1e-6)
+
+    # The recorded fingerprint follows the new sources, so nothing is pending as changed
+    assert backfill.pending('2023-11-01', '2024-03-31', changed_only=True) == []
@@ -0,0 +1,112 @@
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+
+from pw_baseline import BaselineDistribution
+from pw_data import BaselineAccumulator
+
+REGIONS = ['A', 'B']
+
+
+def extents(start, end, seed=0):
+    rng = np.random.default_rng(seed)
+    time = pd.date_range(start, end)
+    values = rng.normal(10, 2, (len(time), len(REGIONS)))
+    values[rng.random(values.shape) < 0.05] = np.nan
+    return xr.DataArray(values, dims=('time', 'region'), coords={'time': time, 'region': REGIONS})
+
+
+@pytest.fixture
+def years():
+    return {year: extents(f'{year}-01-01', f'{year}-12-31', seed=year) for year in range(2012, 2021)}
+
+
+def test_merged_partial_states_match_one_pass(years):
+    one_pass = BaselineAccumulator(REGIONS)
+    one_pass.update(xr.concat(list(years.values()), dim='time'))
+
+    # Partial states over uneven groups of years, merged in a different order
+    parts = []
+    for group in ([2012, 2013, 2014, 2015], [2016], [2017, 2018, 2019, 2020]):
+        acc = BaselineAccumulator(REGIONS)
+        for year in group:
+            acc.update(years[year], label=year)
+        parts.append(acc)
+    merged = parts[2].merge(parts[0]).merge(parts[1])
+
+    np.testing.assert_array_equal(merged.count, one_pass.count)
+    np.testing.assert_allclose(merged.mean, one_pass.mean, rtol=1e-12)
+    np.testing.assert_allclose(merged.m2, one_pass.m2, rtol=1e-9)
+    assert sorted(merged.labels) == [str(year) for year in years]
+
+
+def test_baseline_statistics_match_pandas(years):
+    acc = BaselineAccumulator(REGIONS)
+    for year, ext in years.items():
+        acc.update(ext, label=year)
+
+    df = xr.concat(list(years.values()), dim='time').sel(region='B').to_series().to_frame('seaice_extent')
+    df['month_day'] = df.index.strftime('%m-%d')
+    expected = df.groupby('month_day')['seaice_extent'].agg(['mean', 'std']).round(2)
+    stats = acc.to_frame('B').set_index('month_day')
+    np.testing.assert_allclose(stats['seaice_extent_mean'], expected['mean'], atol=0.01)
+    np.testing.assert_allclose(stats['seaice_extent_std'], expected['std'], atol=0.01)
+
+
+def test_merge_rejects_consumed_chunks(years, tmp_path):
+    acc = BaselineAccumulator(REGIONS)
+    acc.update(years[2012], label=2012)
+    path = str(tmp_path / 'acc.npz')
+    acc.save(path)
+
+    loaded = BaselineAccumulator.load(path)
+    np.testing.assert_array_equal(loaded.m2, acc.m2)
+    with pytest.raises(ValueError):
+        acc.merge(loaded)
+    with pytest.raises(ValueError):
+        acc.merge(BaselineAccumulator(['A']))
+
+
+@pytest.fixture
+def dist():
+    # Jan 1 holds 1, 2, 2, 3 in region A; only the leap year 2004 has a Feb 29
+    dist = BaselineDistribution(REGIONS)
+    for year, value in zip(range(2001, 2005), [2, 1, 3, 2]):
+        time = pd.date_range(f'{year}-01-01', f'{year}-12-31')
+        dist.update(xr.DataArray(np.tile([value, 10.0 * value], (len(time), 1)), dims=('time', 'region'),
+                                 coords={'time': time, 'region': REGIONS}), label=year)
+    return dist
+
+
+def test_score_percentile_and_rank_at_ties_and_edges(dist):
+    dates = pd.DatetimeIndex(['2024-01-01'] * 5 + ['2024-02-29', '2024-01-02'])
+    scores = dist.score('A', dates, [0.5, 1, 2, 3, 4, 2, np.nan])
+
+    np.testing.assert_array_equal(scores['percentile'], [0, 12.5, 50, 87.5, 100, 50, np.nan])
+    np.testing.assert_array_equal(scores['rank'], [1, 1, 2, 4, 5, 1, np.nan])
+    np.testing.assert_allclose(scores['anomaly'], [-1.5, -1, 0, 1, 2, 0, np.nan])
+    np.testing.assert_allclose(scores['zscore'][:5], np.array([-1.5, -1, 0, 1, 2]) / np.std([1, 2, 2, 3], ddof=1))
+    # A single baseline value has no standard deviation
+    assert np.isnan(scores['zscore'].iloc[5])
+    np.testing.assert_array_equal(dist.score('B', dates[:1], [20])['percentile'], [50])
+
+
+def test_score_follows_updates_and_saved_distributions(dist, tmp_path):
+    before = dist.score('A', ['2024-01-01'], [2.5])
+    time = pd.date_range('2005-01-01', '2005-12-31')
+    dist.update(xr.DataArray(np.full((len(time), 2), 5.0), dims=('time', 'region'),
+                             coords={'time': time, 'region': REGIONS}), label=2005)
+    after = dist.score('A', ['2024-01-01'], [2.5])
+    assert (before['rank'].item(), after['rank'].item()) == (4, 4)
+    assert (before['percentile'].item(), after['percentile'].item()) == (75, 60)
+    assert after['anomaly'].item() == pytest.approx(-0.1)
+
+    path = str(tmp_path / 'dist.npz')
+    dist.save(path)
+    loaded = BaselineDistribution.load(path)
+    assert loaded.labels == dist.labels
+    pd.testing.assert_frame_equal(loaded.score('A', ['2024-01-01'], [2.5]), after)
+    with pytest.raises(ValueError):
+        dist.update(xr.DataArray(np.ones((len(time), 2)), dims=('time', 'region'),
+                                 coords={'time': time, 'region': REGIONS}), label=2005)
@@ -0,0 +1,55 @@
+import xarray as xr
+
+from conftest import CRS, VAR_NAME
+from pw_data import GridCache, grid_window
+from pw_metrics import RunReport
+
+
+def test_grid_window_covers_regions(server, shapes):
+    server.write('cdr', '2024-01-01', '2024-01-02')
+    ds = xr.open_dataset(f'{server}/cdr')
+    window = grid_window(ds['x'].values, ds['y'].values, shapes, CRS)
+
+    x, y = ds['x'].values[window['x']], ds['y'].values[window['y']]
+    for shp in shapes.values():
+        xmin, ymin, xmax, ymax = shp.to_crs(CRS).total_bounds
+        assert x.min() <= xmin and x.max() >= xmax
+        assert y.min() <= ymin and y.max() >= ymax
+    # Much smaller than the hemispheric grid
+    assert len(x) * len(y) < 0.2 * ds.sizes['x'] * ds.sizes['y']
+
+
+def test_grid_cache_syncs_only_new_days(server, shapes, tmp_path):
+    server.write('cdr', '2023-12-20', '2024-01-10')
+    remote = xr.open_dataset(f'{server}/cdr')
+    window = grid_window(remote['x'].values, remote['y'].values, shapes, CRS)
+    report = RunReport('test')
+    cache = GridCache(str(tmp_path / 'cache'), server, 'cdr', VAR_NAME, window=window, report=report)
+
+    assert cache.sync() == ['2023', '2024']
+    assert cache.sync() == []
+    first = report.bytes_fetched['cdr']
+
+    # Five more days on the server: only the 2024 partition is extended, with the new days only
+    server.write('cdr', '2023-12-20', '2024-01-15')
+    assert cache.sync() == ['2024']
+    assert len(cache.read_manifest()['2024']) == 15
+    source = xr.open_dataset(f'{server}/cdr').isel(window)[[VAR_NAME]]
+    new = source.sel(time=slice('2024-01-11', None))
+    assert report.bytes_fetched['cdr'] - first == new.nbytes
+
+    xr.testing.assert_equal(cache.open()[VAR_NAME].load(), source[VAR_NAME].load())
+
+
+def test_grid_cache_refresh_since(server, tmp_path):
+    server.write('cdr', '2023-12-30', '2024-01-05')
+    cache = GridCache(str(tmp_path / 'cache'), server, 'cdr', VAR_NAME)
+    cache.sync()
+
+    # Reprocessed values for the same days are only picked up when asked for
+    server.write('cdr', '2023-12-30', '2024-01-05', seed=5)
+    assert cache.sync() == []
+    assert cache.sync(refresh_since='2024-01-01') == ['2024']
+    local = cache.open(start='2024-01-01')[VAR_NAME].load()
+    source = xr.open_dataset(f'{server}/cdr')[VAR_NAME].sel(time=slice('2024-01-01', None)).load()
+    xr.testing.assert_equal(local, source)
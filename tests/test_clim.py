@@ -0,0 +1,53 @@
+import dask.array
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+
+from conftest import CRS, VAR_NAME
+from pw_data import SIC25k, clim_bins, grouped_mean
+
+
+@pytest.mark.parametrize('frequency', ['15D', 'W', 'D', 'M', 'Q'])
+def test_grouped_mean_matches_groupby_mean(frequency):
+    rng = np.random.default_rng(0)
+    time = pd.date_range('2023-01-01', '2024-12-31')
+    values = rng.random((len(time), 5, 6))
+    values[rng.random(values.shape) < 0.1] = np.nan
+    values[:, 0, 0] = np.nan
+
+    bins, labels, dim = clim_bins(time, frequency)
+    # Small partials split the spatial block, and uneven time chunks leave an odd partial in the tree
+    data = dask.array.from_array(values, chunks=(100, 5, 6))
+    mean, count = grouped_mean(data, bins, len(labels), partial_bytes=2 * 8 * len(labels) * 6 * 2)
+    assert mean.chunks[1] == (2, 2, 1)
+
+    grouped = xr.DataArray(values, dims=('time', 'y', 'x')).groupby(xr.DataArray(bins, dims='time', name='bin'))
+    expected = grouped.mean().reindex(bin=np.arange(len(labels)))
+    np.testing.assert_allclose(mean.compute(), expected.values, rtol=1e-6)
+    np.testing.assert_array_equal(count.compute(), grouped.count().reindex(bin=np.arange(len(labels)),
+                                                                            fill_value=0).values)
+
+
+def test_clim_bins_labels():
+    time = pd.DatetimeIndex(['2024-01-15', '2024-01-16', '2024-02-29', '2024-12-31'])
+    assert clim_bins(time, '15D')[0].tolist() == [0, 1, 3, 24]
+    assert clim_bins(time, 'W')[0].tolist() == [2, 2, 8, 52]
+    bins, labels, dim = clim_bins(time, 'D')
+    assert dim == 'month_day' and labels[bins].tolist() == ['01-15', '01-16', '02-29', '12-31']
+    assert clim_bins(time, 'Q')[1][clim_bins(time, 'Q')[0]].tolist() == [1, 1, 1, 4]
+    with pytest.raises(ValueError):
+        clim_bins(time, 'Y')
+
+
+def test_climatology_matches_monthly_groupby(server, shapes, tmp_path):
+    server.write('cdr', '2022-12-01', '2023-12-31')
+    sic = SIC25k('cdr', VAR_NAME, CRS, server=server, window_shapes=shapes)
+    out = str(tmp_path / 'clim.nc')
+    clim = sic.compute_clim([2023, 2023], 'M', out=out)
+
+    expected = sic.ds.sel(time=slice('2023-01-01', '2023-12-31')).groupby('time.month').mean()
+    np.testing.assert_allclose(clim[VAR_NAME].values, expected.values, rtol=1e-6)
+    assert clim.attrs['frequency'] == 'M'
+    with pytest.raises(ValueError):
+        sic.compute_clim([2021, 2023], 'M')
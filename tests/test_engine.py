@@ -0,0 +1,65 @@
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+
+from pw_engine import Prefetcher
+from pw_metrics import RunReport
+
+WINDOWS = [(f'2024-{m:02d}-01', f'2024-{m:02d}-10') for m in range(1, 7)]
+
+
+class Source:
+    """Stand-in dataset that records the windows read and fails on ``fail``."""
+
+    def __init__(self, fail=None):
+        dates = pd.date_range('2024-01-01', '2024-06-30')
+        self.ds = xr.DataArray(np.arange(len(dates), dtype=float), dims='time', coords={'time': dates})
+        self.fail = fail
+        self.reads = []
+        self.lock = threading.Lock()
+
+    def sel(self, time):
+        window = (time.start, time.stop)
+        with self.lock:
+            self.reads.append(window)
+        if window == self.fail:
+            raise OSError(f'cannot read {window}')
+        return self.ds.sel(time=time)
+
+
+def test_windows_arrive_in_order_with_bounded_read_ahead():
+    source = Source()
+    seen = []
+    for window, block in Prefetcher(source, WINDOWS, depth=1):
+        # A slow consumer: the reader fills the queue and waits
+        time.sleep(0.05)
+        seen.append(window)
+        xr.testing.assert_identical(block, source.ds.sel(time=slice(*window)))
+        assert len(source.reads) <= len(seen) + 2
+    assert seen == WINDOWS and source.reads == WINDOWS
+
+
+def test_read_errors_are_raised_at_the_failed_window():
+    source = Source(fail=WINDOWS[3])
+    seen = []
+    with pytest.raises(OSError, match='cannot read'):
+        for window, _ in Prefetcher(source, WINDOWS):
+            seen.append(window)
+    assert seen == WINDOWS[:3] and source.reads == WINDOWS[:4]
+
+
+def test_leaving_early_stops_the_reader():
+    source = Source()
+    report = RunReport('test')
+    for window, _ in Prefetcher(source, WINDOWS, depth=1, report=report):
+        break
+    # The first window, the queued one and at most one blocked read
+    assert len(source.reads) <= 3
+    assert report.stages['open']['calls'] == len(source.reads)
+    assert report.stages['prefetch_wait']['calls'] == 1
+    with pytest.raises(ValueError):
+        Prefetcher(source, WINDOWS, depth=0)
@@ -0,0 +1,73 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from pw_events import SeasonEventDetector
+
+DATES = pd.date_range('2019-09-01', '2022-10-15')
+
+
+def steps(dates):
+    # Ice from November 1 to May 31
+    return np.where((dates.month >= 11) | (dates.month <= 5), 9e5, 1e5)
+
+
+def noisy(dates, seed=0):
+    rng = np.random.default_rng(seed)
+    cycle = 5e5 + 4e5 * np.cos(2 * np.pi * (dates.dayofyear.values - 60) / 365)
+    values = cycle + rng.normal(0, 1e5, len(dates))
+    values[rng.random(len(dates)) < 0.05] = np.nan
+    return values
+
+
+def test_events_of_a_step_cycle():
+    # Midway, the smoothed extent crosses on the third day of the new side
+    detector = SeasonEventDetector({'A': 5e5})
+    assert detector.advance('A', DATES, steps(DATES)) == len(DATES)
+
+    events = detector.events('A')
+    assert events['water_year'].tolist() == [2020, 2021, 2022, 2023]
+    assert events['freeze_up'].dt.strftime('%Y-%m-%d').tolist()[:3] == ['2019-11-03', '2020-11-03', '2021-11-03']
+    assert events['break_up'].dt.strftime('%Y-%m-%d').tolist()[:3] == ['2020-06-03', '2021-06-03', '2022-06-03']
+    assert events['season_length'].tolist()[:3] == [213, 212, 212]
+    assert events['status'].tolist() == ['final'] * 3 + ['provisional']
+    assert events.iloc[3].isna()[['freeze_up', 'break_up', 'season_length']].all()
+
+
+@pytest.mark.parametrize('seed', [0, 1])
+def test_advancing_in_runs_matches_replay(seed, tmp_path):
+    values = noisy(DATES, seed)
+    threshold = 5e5
+    replayed = SeasonEventDetector({'A': threshold})
+    replayed.replay('A', DATES, values)
+
+    # Overlapping runs of uneven length, saved and loaded between runs
+    path = str(tmp_path / 'state.json')
+    SeasonEventDetector({'A': threshold}).save(path)
+    rng = np.random.default_rng(seed)
+    end = 0
+    while end < len(DATES):
+        start, end = max(0, end - rng.integers(0, 10)), min(len(DATES), end + rng.integers(1, 60))
+        detector = SeasonEventDetector.load(path)
+        detector.advance('A', DATES[start:end], values[start:end])
+        detector.save(path)
+
+    loaded = SeasonEventDetector.load(path)
+    assert loaded.state == replayed.state
+    assert loaded.last_date('A') == DATES[-1]
+    pd.testing.assert_frame_equal(loaded.events('A'), replayed.events('A'))
+    assert loaded.events('A')['season_length'].notna().sum() >= 2
+    assert loaded.advance('A', DATES[-5:], values[-5:]) == 0
+
+
+def test_replay_keeps_earlier_seasons():
+    values = steps(DATES)
+    detector = SeasonEventDetector({'A': 5e5})
+    detector.advance('A', DATES, values)
+    full = detector.events('A')
+
+    # Replaying from mid-season keeps the record of the seasons it starts in and before
+    later = DATES >= '2021-01-15'
+    detector.replay('A', DATES[later], values[later])
+    pd.testing.assert_frame_equal(detector.events('A').iloc[:2], full.iloc[:2])
+    assert detector.events('A')['break_up'].iloc[2] == full['break_up'].iloc[2]
@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+
+from conftest import AREA_ID, CRS, VAR_NAME
+from pw_data import SIC25k
+from pw_kernels import fused_extent, fused_metrics, load_region_index
+
+DATES = ['2024-01-01', '2024-01-10']
+
+
+@pytest.fixture
+def sic(server, shapes):
+    def make(raw=False):
+        server.write('cdr', *DATES)
+        sic = SIC25k('cdr', VAR_NAME, CRS, server=server, raw=raw, window_shapes=shapes)
+        sic.load_area(AREA_ID)
+        return sic
+    return make
+
+
+@pytest.mark.parametrize('raw', [False, True])
+def test_region_extents_match_clip_based_extent(sic, shapes, raw):
+    sic = sic(raw)
+    index = sic.build_region_index(shapes)
+    fused = sic.compute_region_extents(DATES, index).load()
+
+    for name, shp in shapes.items():
+        # Legacy path: clip, threshold to 0/1, multiply by the cell area and sum
+        ds, area = sic.subset_dim(DATES, shp)
+        legacy = sic.compute_extent_km(sic.format_sic(ds), area).load()
+        np.testing.assert_allclose(fused.sel(region=name).values, legacy.values, rtol=1e-6)
+
+
+def test_fused_extent_matches_dense_sum():
+    rng = np.random.default_rng(0)
+    values = rng.random((5, 6, 7)).astype(np.float32)
+    values[:, 0, 0] = np.nan
+    weights = rng.random((6 * 7, 3))
+    cells = np.flatnonzero(weights[:, 0] > 0.3)
+
+    ice = np.nan_to_num(values.reshape(5, -1) >= 0.15)
+    expected = ice[:, cells] @ weights[cells]
+    # One time step per block exercises the blocking
+    for block_bytes in (2**23, 1):
+        np.testing.assert_allclose(fused_extent(values, cells, weights[cells], 0.15, block_bytes=block_bytes),
+                                   expected)
+
+
+def test_region_index_loader_matches_region_index(sic, shapes, tmp_path):
+    index = sic().build_region_index(shapes)
+    path = str(tmp_path / 'region_index.npz')
+    index.save(path)
+
+    loaded = load_region_index(path)
+    assert loaded['names'] == index.names and loaded['key'] == index.key
+    np.testing.assert_array_equal(loaded['cells'], index.cells)
+    np.testing.assert_array_equal(loaded['matrix'], index.matrix)
+
+
+@pytest.mark.parametrize('raw', [False, True])
+def test_fused_metrics_match_dense_metrics(raw):
+    rng = np.random.default_rng(1)
+    conc = rng.random((4, 6, 7))
+    conc[:, 0, 0] = np.nan
+    weights = rng.random((6 * 7, 3))
+    cells = np.flatnonzero(weights[:, 0] > 0.3)
+    if raw:
+        # Byte-scaled percent with flag values above 250 (the NaN cell is flagged too)
+        values = np.where(np.isnan(conc), 254, np.round(conc * 100)).astype(np.uint8)
+        values[:, 1, 1] = 253
+        options, thresholds = dict(valid_max=250, scale=0.01), [15, 50]
+    else:
+        values = conc.astype(np.float32)
+        options, thresholds = {}, [0.15, 0.5]
+
+    flat = values.reshape(4, -1)[:, cells].astype(np.float64)
+    valid = (flat >= 0) & (flat <= options.get('valid_max', np.inf))
+    scaled = np.where(valid, flat, 0) * options.get('scale', 1)
+    w = weights[cells]
+    area = scaled @ w
+    expected = np.stack([((flat >= t) & valid) @ w for t in thresholds] + [area, 1 - area / (valid @ w)], axis=1)
+    for block_bytes in (2**23, 1):
+        np.testing.assert_allclose(fused_metrics(values, cells, w, thresholds, block_bytes=block_bytes, **options),
+                                   expected, rtol=1e-5)
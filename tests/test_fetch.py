@@ -0,0 +1,64 @@
+import pytest
+import requests
+import xarray as xr
+
+from conftest import CRS, VAR_NAME
+from pw_data import grid_window
+from pw_fetch import GriddapDownloader
+from pw_synth import GriddapStandIn
+
+DATES = ('2024-01-01', '2024-01-10')
+
+
+@pytest.fixture
+def source(server, shapes):
+    """The stand-in data over the region window, as fetched below."""
+    server.write('cdr', *DATES)
+    ds = xr.open_dataset(f'{server}/cdr')
+    return ds.isel(grid_window(ds['x'].values, ds['y'].values, shapes, CRS))[[VAR_NAME]].load()
+
+
+@pytest.fixture
+def standin(server):
+    with GriddapStandIn(server) as standin:
+        yield standin
+
+
+def fetch(standin, source, tmp_path, **kwargs):
+    downloader = GriddapDownloader(standin.url, time_chunk=4, max_workers=1, backoff=0,
+                                   part_dir=str(tmp_path / 'parts'))
+    return downloader.fetch('cdr', VAR_NAME, source['x'].values, source['y'].values, source['time'].values,
+                            **kwargs)
+
+
+def test_fetch_assembles_the_chunks(standin, source, tmp_path):
+    xr.testing.assert_equal(fetch(standin, source, tmp_path), source)
+    # 10 days in chunks of 4
+    assert standin.requests == 3
+
+
+@pytest.mark.parametrize('status', [500, 503, 429])
+def test_fetch_retries_server_errors_and_rate_limits(standin, source, tmp_path, status):
+    standin.errors += [status, status]
+    xr.testing.assert_equal(fetch(standin, source, tmp_path), source)
+    assert standin.requests == 3 + 2
+
+
+def test_fetch_does_not_retry_client_errors(standin, source, tmp_path):
+    standin.errors.append(404)
+    with pytest.raises(requests.HTTPError):
+        fetch(standin, source, tmp_path)
+    # The failed chunk once, and the other chunks
+    assert standin.requests == 3
+
+
+def test_rerun_requests_only_the_missing_parts(standin, source, tmp_path):
+    standin.errors.append(404)
+    with pytest.raises(requests.HTTPError):
+        fetch(standin, source, tmp_path)
+
+    standin.requests = 0
+    xr.testing.assert_equal(fetch(standin, source, tmp_path), source)
+    assert standin.requests == 1
+    # Parts are removed once assembled, unless asked to keep them
+    assert not list((tmp_path / 'parts').glob('*.nc'))
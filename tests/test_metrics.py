@@ -0,0 +1,74 @@
+import json
+import threading
+
+import dask.array
+import numpy as np
+import pytest
+import xarray as xr
+
+from conftest import CRS, VAR_NAME
+from pw_data import SIC25k
+from pw_metrics import RunReport
+
+
+def samples(text):
+    """Prometheus samples as {'name{labels}': value}, checking every metric has HELP and TYPE lines."""
+    lines = text.splitlines()
+    names = {line.split()[2] for line in lines if line.startswith('# HELP')}
+    assert names == {line.split()[2] for line in lines if line.startswith('# TYPE')}
+    values = dict(line.rsplit(' ', 1) for line in lines if not line.startswith('#'))
+    assert {key.split('{')[0] for key in values} <= names
+    return {key: float(value) for key, value in values.items()}
+
+
+def test_report_json_and_prometheus_output(tmp_path):
+    report = RunReport('job')
+    for _ in range(3):
+        with report.stage('reduce'):
+            pass
+    threads = [threading.Thread(target=lambda: [report.add_bytes('cdr', 10) for _ in range(100)])
+               for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    report.track_dask('lazy', xr.DataArray(dask.array.zeros((10, 4), chunks=(5, 2)), dims=('time', 'x')))
+    report.track_dask('loaded', xr.Dataset({'v': ('time', np.zeros(3))}))
+
+    json_path, prom_path = str(tmp_path / 'reports' / 'job.json'), str(tmp_path / 'reports' / 'job.prom')
+    report.write(json_path, prom_path)
+    with open(json_path) as f:
+        saved = json.load(f)
+    assert saved['run'] == 'job' and saved['errors'] == []
+    assert saved['stages']['reduce']['calls'] == 3
+    assert saved['bytes_fetched'] == {'cdr': 4000}
+    assert saved['dask']['lazy'] == {'tasks': 4, 'chunks': 4} and saved['dask']['loaded'] == {'tasks': 0, 'chunks': 0}
+
+    with open(prom_path) as f:
+        metrics = samples(f.read())
+    assert metrics['pw_fetched_bytes{run="job",dataset="cdr"}'] == 4000
+    assert metrics['pw_run_errors{run="job"}'] == 0
+    assert metrics['pw_dask_chunks{run="job",object="lazy"}'] == 4
+    assert 'pw_stage_seconds{run="job",stage="reduce"}' in metrics
+    assert metrics['pw_run_peak_rss_bytes{run="job"}'] > 0
+
+
+def test_failed_runs_still_write_the_report(server, tmp_path):
+    # As in the scripts: the error is recorded and the report written before the error is raised
+    report = RunReport('job')
+    path = str(tmp_path / 'job.json')
+    with pytest.raises(FileNotFoundError):
+        try:
+            with report.stage('run'):
+                SIC25k('missing', VAR_NAME, CRS, server=server, report=report)
+        except Exception as e:
+            report.error(f'{type(e).__name__}: {e}')
+            raise
+        finally:
+            report.write(path)
+
+    with open(path) as f:
+        saved = json.load(f)
+    assert [error.split(':')[0] for error in saved['errors']] == ['Unable to load missing', 'FileNotFoundError']
+    assert saved['stages']['open']['calls'] == 1 and saved['stages']['run']['calls'] == 1
+    assert samples(report.to_prometheus())['pw_run_errors{run="job"}'] == 2
@@ -0,0 +1,71 @@
+import json
+
+import numpy as np
+import pytest
+
+from conftest import AREA_ID, CRS, VAR_NAME
+from pw_data import SIC25k
+from pw_polygon import PolygonExtentService
+
+DATES = ['2024-01-01', '2024-01-10']
+# A lon/lat box outside every region window
+FAR_BOX = {'type': 'Polygon', 'coordinates': [[[10, 60], [12, 60], [12, 62], [10, 62], [10, 60]]]}
+
+
+@pytest.fixture
+def sic(server, shapes):
+    def make(raw=False):
+        server.write('cdr', *DATES)
+        sic = SIC25k('cdr', VAR_NAME, CRS, server=server, raw=raw, window_shapes=shapes)
+        sic.load_area(AREA_ID)
+        return sic
+    return make
+
+
+@pytest.mark.parametrize('raw', [False, True])
+def test_polygon_extent_matches_region_extent(sic, shapes, raw):
+    sic = sic(raw)
+    expected = sic.compute_region_extents(DATES, sic.build_region_index(shapes)).load()
+    service = PolygonExtentService(sic, preload=raw)
+
+    for name, shp in shapes.items():
+        # The same polygon as projected GeoJSON text and as a lon/lat FeatureCollection
+        for geojson, crs in ((shp.to_json(), CRS), (json.loads(shp.to_crs('EPSG:4326').to_json()), 'EPSG:4326')):
+            ext = service.extent(geojson, DATES, crs=crs)
+            np.testing.assert_allclose(ext.values, expected.sel(region=name).values, rtol=1e-6)
+        assert ext.attrs['cells'] > 0
+    assert service.cache_info() == {'masks': 2 * len(shapes), 'maxsize': 128}
+
+
+def test_masks_are_cached_least_recently_used_first(sic, shapes):
+    service = PolygonExtentService(sic(), mask_cache_size=2)
+    arctic, nbering, ebering = (shapes[name].to_json() for name in
+                                ('AlaskanArctic', 'NorthernBering', 'EasternBering'))
+
+    window, index = service.mask(arctic, CRS)
+    assert service.mask(arctic, CRS)[1] is index
+    service.mask(nbering, CRS)
+    service.mask(arctic, CRS)
+    # Northern Bering is the least recently used mask
+    service.mask(ebering, CRS)
+    assert service.cache_info()['masks'] == 2
+    assert service.mask(arctic, CRS)[1] is index
+    assert service.mask(nbering, CRS)[1] is not index
+
+
+def test_thresholds_and_invalid_polygons(sic, shapes):
+    service = PolygonExtentService(sic())
+    geojson = shapes['EasternBering'].to_json()
+    low, high = service.extent(geojson, DATES, crs=CRS), service.extent(geojson, DATES, threshold=0.8, crs=CRS)
+    assert (high.values <= low.values).all() and (high.values < low.values).any()
+
+    with pytest.raises(ValueError, match='overlap the grid'):
+        service.extent(FAR_BOX, DATES)
+    # A 1 km box on a cell corner, away from the cell centers
+    minx, miny, maxx, maxy = shapes['EasternBering'].total_bounds
+    x, y = np.round((minx + maxx) / 50000) * 25000, np.round((miny + maxy) / 50000) * 25000
+    corner = {'type': 'Polygon', 'coordinates': [[[x, y], [x + 1000, y], [x + 1000, y + 1000], [x, y + 1000], [x, y]]]}
+    with pytest.raises(ValueError, match='any grid cell'):
+        service.extent(corner, DATES, crs=CRS)
+    with pytest.raises(ValueError, match='no geometry'):
+        service.extent({'type': 'FeatureCollection', 'features': []}, DATES)
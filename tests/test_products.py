@@ -0,0 +1,76 @@
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+
+from conftest import CRS, VAR_NAME
+from pw_data import SIC25k
+from pw_products import IceProducts
+
+DATES = ['2023-08-20', '2023-10-15']
+
+
+@pytest.fixture
+def sic(server, shapes):
+    server.write('cdr', *DATES)
+
+    def make(raw=False):
+        return SIC25k('cdr', VAR_NAME, CRS, server=server, raw=raw, window_shapes=shapes)
+    return make
+
+
+def test_products_match_daily_ice(sic, tmp_path):
+    sic = sic()
+    products = IceProducts(sic, str(tmp_path / 'products'))
+    assert products.update() == [2023, 2024]
+
+    ds = sic.ds.sel(time=slice('2023-09-01', None)).load()
+    ice = sic.format_sic(ds) == 1
+    with products.read(2024) as out:
+        months = out['ice_days_month'].sel(time=['2023-09-01', '2023-10-01'])
+        np.testing.assert_array_equal(months, ice.resample(time='MS').sum())
+        np.testing.assert_array_equal(out['valid_days'], ds.notnull().sum('time'))
+        np.testing.assert_array_equal(out['ice_days'], ice.sum('time'))
+        np.testing.assert_allclose(out['ice_frequency'].isel(time=0),
+                                   ice.sel(time='2023-09').sum('time') / ds.sel(time='2023-09').notnull().sum('time'),
+                                   rtol=1e-6)
+        # Later months of the season have no days yet
+        assert (out['valid_days_month'].isel(time=slice(2, None)) == 0).all()
+
+        has = ice.any('time')
+        first = ice.idxmax('time').where(has)
+        last = ice.isel(time=slice(None, None, -1)).idxmax('time').where(has)
+        xr.testing.assert_equal(out['first_ice'].reset_coords(drop=True), first.reset_coords(drop=True))
+        xr.testing.assert_equal(out['last_ice'].reset_coords(drop=True), last.reset_coords(drop=True))
+    assert has.any() and not has.all()
+
+
+def test_incremental_updates_match_one_pass(sic, tmp_path):
+    one_pass = IceProducts(sic(), str(tmp_path / 'one_pass'))
+    one_pass.update()
+
+    # Byte-scaled data, extended in three runs, one of them within a month
+    products = IceProducts(sic(raw=True), str(tmp_path / 'products'))
+    assert products.update(end='2023-09-10') == [2023, 2024]
+    assert products.update(end='2023-09-25') == [2024]
+    assert products.update() == [2024]
+    assert products.update() == []
+    assert products.read_manifest()['seasons']['2024'] == {'start': '2023-09-01', 'end': DATES[1], 'days': 45}
+
+    for season in (2023, 2024):
+        with products.read(season) as got, one_pass.read(season) as expected:
+            xr.testing.assert_equal(got[list(IceProducts.VARIABLES)], expected[list(IceProducts.VARIABLES)])
+
+
+def test_rebuild_recomputes_whole_seasons(sic, tmp_path):
+    products = IceProducts(sic(), str(tmp_path / 'products'))
+    products.update()
+    with products.read(2024) as ds:
+        before = ds.load()
+
+    # A rebuild of one day restarts its season; a new threshold starts over
+    assert products.update('2023-10-01', '2023-10-01', rebuild=True) == [2024]
+    with products.read(2024) as ds:
+        xr.testing.assert_identical(ds, before)
+    assert IceProducts(sic(), str(tmp_path / 'products'), threshold=0.5).read_manifest()['seasons'] == {}
+    assert pd.Timestamp(products.read_manifest()['seasons']['2024']['end']) == pd.Timestamp(DATES[1])
@@ -0,0 +1,60 @@
+import json
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from pw_site import MONTH_DAYS, site_data, write_site_data
+
+
+def baseline():
+    mean = np.linspace(100, 465, len(MONTH_DAYS))
+    return pd.DataFrame({'month_day': MONTH_DAYS, 'seaice_extent_mean': mean, 'seaice_extent_std': 150.0})
+
+
+def daily(start, end):
+    dates = pd.date_range(start, end)
+    df = pd.DataFrame({'date': dates.strftime('%Y-%m-%d'), 'seaice_extent': np.arange(len(dates), dtype=float)})
+    df.loc[3, 'seaice_extent'] = np.nan
+    return df
+
+
+ANNUAL = pd.DataFrame({'year': [2022.0, 2023.0], 'extent': [1.234, 2.345]})
+
+
+def test_site_data_is_aligned_on_the_season(tmp_path):
+    df = daily('2023-06-01', '2024-01-15')
+    # Data lagging behind the calendar keep their season
+    data = site_data('A', df, baseline(), ANNUAL, total_area=1234.567, today=date(2024, 10, 1))
+
+    assert (data['water_year'], data['updated'], data['total_area_km2']) == (2024, '2024-01-15', 1234.57)
+    assert data['month_day'][0] == '09-01' and data['month_day'][-1] == '08-31' and '02-29' in data['month_day']
+    for series in (data['baseline'], data['last'], data['this']):
+        assert all(len(values) == len(MONTH_DAYS) for values in series.values())
+
+    jan15 = data['month_day'].index('01-15')
+    assert data['this']['extent'][jan15] == float(len(df) - 1)
+    assert data['this']['extent'][jan15 + 1:] == [None] * (len(MONTH_DAYS) - jan15 - 1)
+    assert data['this']['anomaly'][0] == round(df['seaice_extent'][92] - 100, 1)
+    # June 4 has no value; the previous season ends on August 31
+    jun = data['month_day'].index('06-01')
+    assert data['last']['extent'][:jun] == [None] * jun
+    assert data['last']['extent'][jun + 3] is None and data['last']['extent'][-1] == 91.0
+    assert data['baseline']['lower'][0] == 0 and data['baseline']['upper'][0] == 250
+    assert data['latest'] == {'date': '2024-01-15', 'month_day': '01-15', 'extent': float(len(df) - 1)}
+    assert data['annual'] == {'year': [2022, 2023], 'extent': [1.2, 2.3]}
+
+    path = str(tmp_path / 'site_A.json')
+    write_site_data(path, data)
+    with open(path) as f:
+        assert json.load(f) == data
+
+
+def test_site_data_uses_precomputed_anomalies_and_handles_no_data():
+    df = daily('2024-09-01', '2024-09-10').assign(anomaly=-5.0)
+    data = site_data('A', df, baseline(), ANNUAL)
+    assert data['this']['anomaly'][:3] == [-5.0] * 3 and data['water_year'] == 2025
+
+    empty = site_data('A', df.iloc[:0], baseline(), ANNUAL.iloc[:0], today=date(2024, 10, 1))
+    assert (empty['water_year'], empty['updated'], empty['latest']) == (2025, None, None)
+    assert empty['this']['extent'] == [None] * len(MONTH_DAYS) and empty['annual'] == {'year': [], 'extent': []}
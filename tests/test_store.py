@@ -0,0 +1,120 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from pw_store import ExtentPyramid, ExtentStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ExtentStore(str(tmp_path / 'store'))
+
+
+def rows(start, end, value, source=None):
+    df = pd.DataFrame({'date': pd.date_range(start, end), 'seaice_extent': float(value)})
+    if source is not None:
+        df['source'] = source
+    return df
+
+
+def test_upsert_is_idempotent_and_merges(store):
+    assert store.upsert('A', rows('2024-01-30', '2024-02-02', 1)) == ['2024-01', '2024-02']
+    assert store.upsert('A', rows('2024-01-30', '2024-02-02', 1)) == ['2024-01', '2024-02']
+    assert len(store.read('A')) == 4
+
+    # Replaced days only; other days and columns keep their stored values
+    store.upsert('A', rows('2024-02-01', '2024-02-03', 2))
+    store.upsert('A', pd.DataFrame({'date': ['2024-01-31'], 'anomaly': [-1.0]}))
+    df = store.read('A').set_index('date')
+    assert df['seaice_extent'].tolist() == [1, 1, 2, 2, 2]
+    assert df.loc['2024-01-31', 'anomaly'] == -1
+    assert store.last_date('A') == pd.Timestamp('2024-02-03')
+    assert store.read_manifest('A')['partitions'] == {'2024-01': 2, '2024-02': 3}
+
+
+def test_stale_months_lists_days_from_other_sources(store):
+    store.upsert('A', rows('2024-01-01', '2024-02-29', 1, source='cdr'))
+    store.upsert('A', rows('2024-03-01', '2024-04-30', 1, source='nrt'))
+    store.upsert('A', rows('2024-05-01', '2024-05-10', 1))
+
+    # Days not stored, or stored from the preferred source, are not stale
+    assert store.stale_months('A', pd.date_range('2024-01-01', '2024-02-29'), 'cdr') == []
+    assert store.stale_months('A', pd.date_range('2024-01-01', '2024-03-15'), 'cdr') == ['2024-03']
+    assert store.stale_months('A', pd.date_range('2024-01-01', '2024-06-30'), 'cdr') == [
+        '2024-03', '2024-04', '2024-05']
+
+
+def test_mark_checked_skips_earlier_days(store):
+    store.upsert('A', rows('2024-01-01', '2024-04-30', 1, source='nrt'))
+    store.mark_checked('A', 'cdr', '2024-02-29')
+    available = pd.date_range('2024-01-01', '2024-03-31')
+    assert store.stale_months('A', available, 'cdr') == ['2024-03']
+
+    # The mark only moves forward and survives later upserts
+    store.mark_checked('A', 'cdr', '2024-01-15')
+    store.upsert('A', rows('2024-05-01', '2024-05-02', 1, source='nrt'))
+    assert store.read_manifest('A')['checked'] == {'cdr': '2024-02-29'}
+    assert store.stale_months('A', available, 'cdr') == ['2024-03']
+
+
+def test_import_csv_records_the_source(store, tmp_path):
+    path = tmp_path / 'nrt_extent_A.csv'
+    rows('2024-01-01', '2024-01-05', 3).to_csv(path, index=False)
+    assert store.import_csv('A', str(path), source='nrt') == 5
+    assert set(store.read('A')['source']) == {'nrt'}
+    assert store.stale_months('A', pd.date_range('2024-01-01', '2024-01-05'), 'cdr') == ['2024-01']
+
+
+def daily(start, end, seed=0):
+    rng = np.random.default_rng(seed)
+    df = rows(start, end, 0)
+    df['seaice_extent'] = rng.normal(1e5, 1e4, len(df))
+    # Missing days: one alone and seven in a row
+    return df[~df.index.isin([3, 40, 41, 42, 43, 44, 45, 46])].reset_index(drop=True)
+
+
+def resampled(df):
+    s = df.set_index('date')['seaice_extent']
+    weekly = s.resample('W-SUN').agg(['mean', 'count'])
+    weekly.index = weekly.index - pd.Timedelta(days=6)
+    monthly = s.resample('MS').agg(['mean', 'count'])
+    water_year = monthly[monthly['count'] > 0].resample('YS-SEP').agg({'mean': 'mean', 'count': 'sum'})
+    return {level: agg[agg['count'] > 0] for level, agg in
+            (('weekly', weekly), ('monthly', monthly), ('water_year', water_year))}
+
+
+def test_pyramid_matches_resampled_days(store):
+    df = daily('2023-08-15', '2024-10-10')
+    store.upsert('A', df)
+    pyramid = ExtentPyramid(store)
+    written = pyramid.update('A')
+
+    for level, expected in resampled(df).items():
+        got = pyramid.read('A', level).set_index('date')
+        assert written[level] == len(expected)
+        np.testing.assert_array_equal(got.index, expected.index)
+        np.testing.assert_allclose(got['seaice_extent'], expected['mean'], rtol=1e-12)
+        np.testing.assert_array_equal(got['days'], expected['count'])
+    assert pyramid.read('A', 'water_year')['year'].tolist() == [2023, 2024, 2025]
+
+
+def test_pyramid_update_follows_changed_days(store):
+    df = daily('2023-08-15', '2024-10-10')
+    store.upsert('A', df)
+    pyramid = ExtentPyramid(store)
+    pyramid.update('A')
+
+    # Superseded days and a new day, updated by date range only
+    changed = daily('2024-02-27', '2024-03-05', seed=1)
+    store.upsert('A', changed)
+    store.upsert('A', rows('2024-10-11', '2024-10-11', 5e4))
+    pyramid.update('A', '2024-02-27', '2024-03-05')
+    pyramid.update('A', '2024-10-11')
+
+    rebuilt = ExtentPyramid(store, root=str(store.root) + '_rebuilt')
+    rebuilt.update('A')
+    for level in ExtentPyramid.LEVELS:
+        pd.testing.assert_frame_equal(pyramid.read('A', level), rebuilt.read('A', level))
+    assert pyramid.read('A', 'monthly', '2024-10-01')['days'].tolist() == [11]
+    with pytest.raises(ValueError):
+        pyramid.read('A', 'daily')